@@ -0,0 +1,116 @@
+"""
+Compares reading TGN XML and HGIS-like CSV inputs straight from their archives
+(archives.open_input, decompressing while parsing) with decompressing them to disk
+first and reading the extracted files, as the import did before.
+
+For each format it reports the read throughput and the end-to-end time of
+  - plain: reading an already extracted file
+  - extract+plain: decompressing the archive to disk, then reading the extracted file
+  - stream: decompressing while parsing, without touching the disk
+
+Usage:
+    python benchmarks/bench_archives.py --subjects 100000 --rows 500000
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "dbmanager"))
+
+import pandas as pd
+
+from archives import MEMBER_SEPARATOR, open_input
+from benchmarks.bench_frame_rows import synthetic_frame
+from benchmarks.synthetic_tgn import generate_tgn_xml
+from tgn_extract import SubjectExtractor, iter_subjects
+
+
+def count_subjects(path: str) -> int:
+    count = 0
+    extractor = None
+    with open_input(path) as source:
+        for elem in iter_subjects(source):
+            if extractor is None:
+                extractor = SubjectExtractor.for_element(elem)
+            if extractor.extract(elem) is not None:
+                count += 1
+    return count
+
+
+def count_csv_rows(path: str) -> int:
+    with open_input(path) as f:
+        return sum(len(chunk) for chunk in pd.read_csv(f, chunksize=100000))
+
+
+def extract(path: str, directory: str) -> str:
+    """
+    Decompresses a .gz file or the member of a zip archive to directory, as a manual unzip would.
+    """
+    target = os.path.join(directory, os.path.basename(path.split(MEMBER_SEPARATOR)[-1]).removesuffix(".gz"))
+    with open_input(path) as source, open(target, "wb") as f:
+        shutil.copyfileobj(source, f, 1024 * 1024)
+    return target
+
+
+def make_archives(plain_path: str) -> dict:
+    gz_path = f"{plain_path}.gz"
+    with open(plain_path, "rb") as source, gzip.open(gz_path, "wb") as f:
+        shutil.copyfileobj(source, f, 1024 * 1024)
+    zip_path = f"{plain_path}.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(plain_path, os.path.basename(plain_path))
+    return {"gz": gz_path, "zip": f"{zip_path}{MEMBER_SEPARATOR}{os.path.basename(plain_path)}"}
+
+
+def measure(plain_path: str, read, items: int) -> dict:
+    results = {}
+    start = time.perf_counter()
+    read(plain_path)
+    seconds = time.perf_counter() - start
+    results["plain"] = {"seconds": seconds, "per_sec": items / seconds}
+    for kind, path in make_archives(plain_path).items():
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            extracted = extract(path, tmp)
+            extract_seconds = time.perf_counter() - start
+            read(extracted)
+            seconds = time.perf_counter() - start
+        results[f"extract+plain ({kind})"] = {"seconds": seconds, "per_sec": items / seconds,
+                                              "extract_seconds": extract_seconds}
+        start = time.perf_counter()
+        read(path)
+        seconds = time.perf_counter() - start
+        results[f"stream ({kind})"] = {"seconds": seconds, "per_sec": items / seconds}
+    return results
+
+
+def run(n_subjects: int, n_rows: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = generate_tgn_xml(os.path.join(tmp, "tgn_synthetic.xml"), n_subjects)
+        csv_path = os.path.join(tmp, "hgis_synthetic.csv")
+        synthetic_frame(n_rows).to_csv(csv_path, index=False)
+        return {
+            "tgn_xml": measure(xml_path, count_subjects, n_subjects),
+            "hgis_csv": measure(csv_path, count_csv_rows, n_rows),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=50000)
+    parser.add_argument("--rows", type=int, default=500000)
+    args = parser.parse_args()
+
+    for name, results in run(args.subjects, args.rows).items():
+        unit = "Subjects" if name == "tgn_xml" else "rows"
+        print(name)
+        for mode, result in results.items():
+            extra = f", of which extraction {result['extract_seconds']:.2f} s" if "extract_seconds" in result else ""
+            print(f"{mode:>22}: {result['per_sec']:,.0f} {unit}/sec ({result['seconds']:.2f} s{extra})")
@@ -0,0 +1,99 @@
+"""
+Compares the DataFrame-to-rows conversion used before frames.iter_row_batches
+(df.replace(...) to None, then values.tolist() per batch) with iter_row_batches.
+
+Reports rows/sec and peak traced memory of each path on a synthetic HGIS-like frame.
+
+Usage:
+    python benchmarks/bench_frame_rows.py --rows 1000000
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "dbmanager"))
+
+import numpy as np
+import pandas as pd
+
+from frames import iter_row_batches
+
+INTEGER_COLUMNS = ("original_source_id", "parent_id")
+
+
+def synthetic_frame(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Builds a frame with the columns and missing-value pattern of prepared HGIS data.
+    """
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(1, 10**7, n_rows).astype(float)
+    ids[rng.random(n_rows) < 0.01] = np.nan
+    latitude = rng.uniform(-60, 70, n_rows)
+    latitude[rng.random(n_rows) < 0.15] = np.nan
+    longitude = rng.uniform(-170, 170, n_rows)
+    longitude[np.isnan(latitude)] = np.nan
+    parents = rng.integers(1, 10**5, n_rows).astype(float)
+    parents[rng.random(n_rows) < 0.2] = np.nan
+    names = pd.Series(rng.integers(0, 10**6, n_rows)).map("Place {}".format)
+    alternates = names.where(rng.random(n_rows) < 0.5, np.nan)
+    return pd.DataFrame({
+        "original_source_id": ids,
+        "source": "HGIS",
+        "place_name": names,
+        "place_type": pd.Series(rng.choice(["Town", "Village", "City", None], n_rows), dtype=object),
+        "latitude": latitude,
+        "longitude": longitude,
+        "parent_id": parents,
+        "alternate_names": alternates,
+    })
+
+
+def legacy_rows(df: pd.DataFrame, batch_size: int) -> int:
+    count = 0
+    df = df.replace({pd.NA: None, pd.NaT: None, np.nan: None})
+    for i in range(0, len(df), batch_size):
+        batch = df.iloc[i:i + batch_size].values.tolist()
+        count += len(batch)
+    return count
+
+
+def converter_rows(df: pd.DataFrame, batch_size: int) -> int:
+    count = 0
+    for batch in iter_row_batches(df, batch_size=batch_size, integer_columns=INTEGER_COLUMNS):
+        count += len(batch)
+    return count
+
+
+def measure(function, df: pd.DataFrame, batch_size: int) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = function(df, batch_size)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows_per_sec": count / seconds, "seconds": seconds, "peak_mib": peak / 2**20}
+
+
+def run(n_rows: int, batch_size: int) -> dict:
+    df = synthetic_frame(n_rows)
+    frame_mib = df.memory_usage(deep=True).sum() / 2**20
+    results = {name: measure(function, df, batch_size)
+               for name, function in (("legacy", legacy_rows), ("converter", converter_rows))}
+    results["frame_mib"] = frame_mib
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    results = run(args.rows, args.batch_size)
+    print(f"frame size: {results['frame_mib']:.1f} MiB")
+    for name in ("legacy", "converter"):
+        result = results[name]
+        print(f"{name:>10}: {result['rows_per_sec']:,.0f} rows/sec ({result['seconds']:.2f} s), "
+              f"peak {result['peak_mib']:.1f} MiB")
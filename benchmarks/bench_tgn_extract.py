@@ -0,0 +1,111 @@
+"""
+Compares the Subjects/sec of the legacy TGN extraction loop with SubjectExtractor.
+
+Usage:
+    python benchmarks/bench_tgn_extract.py --subjects 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "dbmanager"))
+
+from lxml import etree
+
+from benchmarks.synthetic_tgn import generate_tgn_xml
+from tgn_extract import SubjectExtractor, iter_subjects
+
+
+def legacy_rows(file_path: str) -> list[tuple]:
+    """
+    The extraction loop of PopulateTGN.process_file before SubjectExtractor, without the inserts.
+    """
+    rows = []
+    context = etree.iterparse(file_path, events=('end',), recover=True)
+
+    for event, elem in context:
+        namespace = elem.nsmap.get(None)
+        if namespace:
+            break
+
+    def safe_find_text(element, path, ns):
+        try:
+            ns_path = '/'.join('{' + ns + '}' + part for part in path.split('/'))
+            result = element.find('.//' + ns_path)
+            return result.text if result is not None else None
+        except:
+            return None
+
+    for event, elem in context:
+        tag = etree.QName(elem).localname
+        if tag == "Subject":
+            original_source_id = int(elem.get('Subject_ID'))
+            preferred_term = elem.find('.//{' + namespace + '}Terms/{' + namespace + '}Preferred_Term/{' + namespace + '}Term_Text')
+            place_name = preferred_term.text if preferred_term is not None else None
+            latitude = float(safe_find_text(elem, 'Coordinates/Standard/Latitude/Decimal', namespace)) if safe_find_text(elem, 'Coordinates/Standard/Latitude/Decimal', namespace) else None
+            longitude = float(safe_find_text(elem, 'Coordinates/Standard/Longitude/Decimal', namespace)) if safe_find_text(elem, 'Coordinates/Standard/Longitude/Decimal', namespace) else None
+            place_type_elem = elem.find('.//{' + namespace + '}Place_Types/{' + namespace + '}Preferred_Place_Type/{' + namespace + '}Place_Type_ID')
+            place_type = place_type_elem.text if place_type_elem is not None else None
+            place_type = place_type.split('/')[1] if place_type and '/' in place_type else place_type
+            parent_elem = elem.find('.//{' + namespace + '}Parent_Relationships/{' + namespace + '}Preferred_Parent/{' + namespace + '}Parent_Subject_ID')
+            parent_id = int(parent_elem.text) if parent_elem is not None and parent_elem.text else None
+            alternate_names = []
+            for term in elem.findall('.//{' + namespace + '}Terms/{' + namespace + '}Non-Preferred_Term/{' + namespace + '}Term_Text'):
+                if term.text:
+                    alternate_names.append(term.text.replace('\\', '\\\\').strip())
+            if original_source_id and place_name:
+                rows.append((original_source_id, "TGN", place_name, place_type, latitude, longitude, parent_id,
+                             "|".join(alternate_names) if alternate_names else None))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    return rows
+
+
+def extractor_rows(file_path: str) -> list[tuple]:
+    """
+    The extraction loop of PopulateTGN.process_file with SubjectExtractor, without the inserts.
+    """
+    rows = []
+    extractor = None
+    for elem in iter_subjects(file_path):
+        if extractor is None:
+            extractor = SubjectExtractor.for_element(elem)
+        row = extractor.extract(elem)
+        if row is not None:
+            rows.append(row)
+    return rows
+
+
+def run(n_subjects: int, repeat: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = generate_tgn_xml(os.path.join(tmp, "tgn_synthetic.xml"), n_subjects)
+        results = {}
+        outputs = {}
+        for name, function in (("legacy", legacy_rows), ("extractor", extractor_rows)):
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                outputs[name] = function(file_path)
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            results[name] = {"seconds": best, "subjects_per_sec": n_subjects / best}
+        if outputs["legacy"] != outputs["extractor"]:
+            raise AssertionError("Legacy and extractor rows differ")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subjects", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    results = run(args.subjects, args.repeat)
+    for name, result in results.items():
+        print(f"{name:>10}: {result['subjects_per_sec']:,.0f} Subjects/sec ({result['seconds']:.2f} s)")
+    print(f"   speedup: {results['legacy']['seconds'] / results['extractor']['seconds']:.2f}x")
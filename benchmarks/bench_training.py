@@ -0,0 +1,257 @@
+"""
+Times each stage of models/train.model_pipeline on synthetic gazetteers, for several model
+types, vectorizer sizes and dataset sizes.
+
+For every (rows, model type, max_features) combination it builds the text features and the 80/20
+split as training/preprocessing_training.py does, then runs the pipeline one step at a time:
+the fit_transform of each featurization step (vectorizer, scaler, and reducer for hgb), the fit of
+the regressor and predict on the test set (featurization included). sgd_stream is trained as
+train.py trains it: the split is saved with save_split and streamed from disk by
+train_streaming_model for its configured epochs ("fit"), then evaluate_streaming_model computes
+the test MAE batch by batch ("predict"). Each stage records wall time,
+CPU seconds of the process and its workers, and peak RSS of the process. Results are written as
+JSON; with --baseline, the stage times are compared with an earlier results file and the run
+fails if a stage got slower than the tolerance.
+
+Usage:
+    python benchmarks/bench_training.py --rows 20000 100000 --models rfr gbr hgb sgd_stream \\
+        --max-features 1000 10000 --output benchmarks/results/training.json
+    python benchmarks/bench_training.py --baseline benchmarks/results/training.json --output benchmarks/results/training_new.json
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import sklearn
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
+
+from benchmarks.synthetic_gazetteer import synthetic_gazetteer
+from models.resources import assign_jobs, available_cores, cpu_seconds_since, cpu_snapshot, native_threads
+from models.streaming import evaluate_streaming_model, streaming_settings, train_streaming_model
+from models.train import load_config, model_pipeline
+from training.dataset_cache import STRING_TYPES
+from training.preprocessing_training import build_features, save_split
+
+CONFIG_PATH = Path(__file__).parent.parent / "config" / "model_config.yaml"
+
+# Seconds between RSS samples of a stage
+SAMPLE_INTERVAL = 0.01
+
+
+def rss_mib() -> float:
+    """
+    Current resident set size of this process, in MiB.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource
+        # peak instead of current where /proc is missing; ru_maxrss is in KiB on Linux, bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+@contextmanager
+def measure(stages: dict, name: str, rows: int):
+    """
+    Records wall time, CPU seconds, rows/sec and peak RSS (sampled every SAMPLE_INTERVAL) of the enclosed block.
+    """
+    start_rss = rss_mib()
+    peak = [start_rss]
+    done = threading.Event()
+    def sample():
+        while not done.wait(SAMPLE_INTERVAL):
+            peak[0] = max(peak[0], rss_mib())
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start_cpu = cpu_snapshot()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        cpu_seconds = cpu_seconds_since(start_cpu)
+        done.set()
+        sampler.join()
+        peak[0] = max(peak[0], rss_mib())
+        stages[name] = {
+            "seconds": seconds,
+            "cpu_seconds": cpu_seconds,
+            "rows_per_sec": rows / seconds if seconds else None,
+            "peak_rss_mib": peak[0],
+            "rss_growth_mib": peak[0] - start_rss,
+        }
+
+
+def synthetic_split(n_rows: int, seed: int = 42, split_dir: str = None):
+    """
+    The text features and coordinates of a synthetic gazetteer, split 80/20 like preprocessing_training.py.
+    With split_dir, the split is also saved there with save_split, for the streaming model.
+    """
+    table = build_features(pa.Table.from_pandas(synthetic_gazetteer(n_rows, seed), preserve_index=False))
+    text_features = table["text_features"]
+    coordinates = np.column_stack([table["latitude"].to_numpy(), table["longitude"].to_numpy()]).astype(np.float32)
+    train_index, test_index = train_test_split(np.arange(table.num_rows), test_size=0.2, random_state=42)
+    if split_dir is not None:
+        save_split(table.to_pandas(types_mapper=STRING_TYPES.get), train_index, test_index, split_dir)
+    def texts(index):
+        return pd.Series(pd.arrays.ArrowExtensionArray(text_features.take(index)), name="text_features")
+    return texts(train_index), texts(test_index), coordinates[train_index], coordinates[test_index]
+
+
+def run_stages(estimator, X_train, y_train, X_test, y_test) -> dict:
+    """
+    Fits and evaluates estimator one stage at a time.
+
+    Returns:
+        dict: The metrics of each stage and the test MAE.
+    """
+    stages = {}
+    steps = estimator.steps[:-1] if isinstance(estimator, Pipeline) else []
+    regressor = estimator.steps[-1][1] if isinstance(estimator, Pipeline) else estimator
+    features = X_train
+    for name, step in steps:
+        with measure(stages, name, len(X_train)):
+            features = step.fit_transform(features, y_train)
+    with measure(stages, "fit", len(X_train)):
+        regressor.fit(features, y_train)
+    with measure(stages, "predict", len(X_test)):
+        features = X_test
+        for _, step in steps:
+            features = step.transform(features)
+        y_pred = regressor.predict(features)
+    return {"stages": stages, "mae": float(mean_absolute_error(y_test, y_pred))}
+
+
+def run_streaming_stages(config: dict, split_dir: str, n_train: int, n_test: int) -> dict:
+    """
+    Trains and evaluates the sgd_stream model on a saved split, out of core, as train.py does.
+    """
+    stages = {}
+    with measure(stages, "fit", n_train):
+        model, _ = train_streaming_model(config, split_dir)
+    with measure(stages, "predict", n_test):
+        mae = evaluate_streaming_model(model, split_dir, streaming_settings(config)["batch_size"])
+    return {"stages": stages, "mae": float(mae)}
+
+
+def run(rows: list, models: list, max_features: list, n_estimators: int, n_cores: int, seed: int = 42) -> dict:
+    base_config = load_config(str(CONFIG_PATH))
+    base_config["model"]["n_estimators"] = n_estimators
+    results = []
+    for n_rows in rows:
+        with tempfile.TemporaryDirectory() as split_dir:
+            X_train, X_test, y_train, y_test = synthetic_split(n_rows, seed, split_dir if "sgd_stream" in models else None)
+            for model_type in models:
+                for features in max_features:
+                    config = copy.deepcopy(base_config)
+                    config["model_type"] = model_type
+                    config["vectorizer"]["max_features"] = features
+                    with native_threads(n_cores):
+                        if model_type == "sgd_stream":
+                            result = run_streaming_stages(config, split_dir, len(X_train), len(X_test))
+                        else:
+                            result = run_stages(assign_jobs(model_pipeline(config), n_cores), X_train, y_train, X_test, y_test)
+                    result.update({"rows": n_rows, "model_type": model_type, "max_features": features,
+                                   "training_samples": len(X_train), "test_samples": len(X_test),
+                                   "seconds": sum(stage["seconds"] for stage in result["stages"].values())})
+                    results.append(result)
+                    print(f"{n_rows:>9} {model_type:>10} {features:>7}: {result['seconds']:.2f} s, MAE {result['mae']:.3f}  "
+                          + ", ".join(f"{name} {stage['seconds']:.2f} s" for name, stage in result["stages"].items()))
+    return {
+        "benchmark": "training",
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "scikit-learn": sklearn.__version__,
+            "cores": n_cores,
+        },
+        "params": {"rows": rows, "models": models, "max_features": max_features,
+                   "n_estimators": n_estimators, "seed": seed},
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_seconds: float = 0.0) -> list:
+    """
+    Compares the stage times of results with those of the same (rows, model type, max_features) in baseline.
+    A stage regressed if it is more than tolerance slower and more than min_seconds slower, so that
+    the noise of stages of a few milliseconds is not reported.
+
+    Returns:
+        list: One dict per compared stage, with both times, their ratio and whether it is a regression.
+    """
+    previous = {(result["rows"], result["model_type"], result["max_features"]): result for result in baseline["results"]}
+    comparisons = []
+    for result in results["results"]:
+        old = previous.get((result["rows"], result["model_type"], result["max_features"]))
+        if old is None:
+            continue
+        for name, stage in result["stages"].items():
+            if name not in old["stages"] or not old["stages"][name]["seconds"]:
+                continue
+            ratio = stage["seconds"] / old["stages"][name]["seconds"]
+            comparisons.append({"rows": result["rows"], "model_type": result["model_type"],
+                                "max_features": result["max_features"], "stage": name,
+                                "seconds": stage["seconds"], "baseline_seconds": old["stages"][name]["seconds"],
+                                "ratio": ratio,
+                                "regression": ratio > 1 + tolerance and stage["seconds"] - old["stages"][name]["seconds"] > min_seconds})
+    return comparisons
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--models", nargs="+", default=["rfr", "gbr", "hgb", "sgd_stream"])
+    parser.add_argument("--max-features", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--n-estimators", type=int, default=50,
+                        help="Overrides model.n_estimators of model_config.yaml, to keep runs short")
+    parser.add_argument("--cores", type=int, default=available_cores())
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmarks/results/training.json")
+    parser.add_argument("--baseline", help="Results file of an earlier run to compare the stage times with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Slowdown of a stage over the baseline reported as a regression (0.1 = 10%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="Slowdowns of a stage of at most this many seconds are not regressions")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        # read first: --output may be the same file
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(args.rows, args.models, args.max_features, args.n_estimators, args.cores, args.seed)
+    if baseline is not None:
+        results["comparison"] = compare(results, baseline, args.tolerance, args.min_seconds)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"results written to {args.output}")
+
+    if baseline is not None:
+        regressions = [comparison for comparison in results["comparison"] if comparison["regression"]]
+        for comparison in regressions:
+            print(f"regression: {comparison['rows']} {comparison['model_type']} {comparison['max_features']} "
+                  f"{comparison['stage']}: {comparison['baseline_seconds']:.2f} s -> {comparison['seconds']:.2f} s "
+                  f"({comparison['ratio']:.2f}x)")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,185 @@
+"""
+Generates synthetic place-name corpora with the columns of the training data export
+(training/extract_training_data.py): place_name, place_type, latitude, longitude, alternate_names.
+
+Places belong to regions, each with its own syllables, name prefixes and suffixes, and
+coordinates clustered around a few provincial centers, so that names carry information about
+coordinates as in the real gazetteers. Alternate names are spelling variants, the name without
+or with another prefix, historic "Old"/"Viejo" forms and renderings in the language of another
+region, "|"-joined as the loaders store them. A share of places has no coordinates or no
+alternate names, as in the exports.
+
+Usage:
+    python benchmarks/synthetic_gazetteer.py --rows 1000000 --output training/data/synthetic_gazetteer.parquet
+"""
+import argparse
+import random
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# center (lat, lon), spread of the provinces around it in degrees, syllables, prefixes and suffixes of names
+REGIONS = {
+    "andes": {"center": (-12.0, -72.0), "spread": 8.0,
+              "syllables": ["hua", "ca", "pa", "ta", "qui", "llo", "cha", "ma", "yu", "pu", "co", "ra"],
+              "prefixes": ["San ", "Santa ", "Villa "], "suffixes": ["pampa", "bamba", "marca", "cocha"]},
+    "mexico": {"center": (20.0, -100.0), "spread": 6.0,
+               "syllables": ["te", "xo", "tla", "co", "mi", "hua", "ca", "zo", "pa", "chi", "mo", "na"],
+               "prefixes": ["San ", "Santa ", "Villa ", "Ciudad "], "suffixes": ["tepec", "tlan", "pan", "co"]},
+    "brazil": {"center": (-12.0, -48.0), "spread": 9.0,
+               "syllables": ["ita", "ja", "gua", "ra", "pe", "cu", "ma", "ri", "ba", "to", "ca", "na"],
+               "prefixes": ["São ", "Santa ", "Porto ", "Vila "], "suffixes": ["ópolis", "inha", "ema", "tiba"]},
+    "anglo": {"center": (40.0, -90.0), "spread": 10.0,
+              "syllables": ["wood", "mill", "ash", "ford", "brook", "field", "ham", "ches", "ter", "lin", "dal", "spring"],
+              "prefixes": ["New ", "Port ", "Lake ", "Fort "], "suffixes": ["ton", "ville", "burg", " City"]},
+    "quebec": {"center": (47.0, -72.0), "spread": 3.0,
+               "syllables": ["bel", "mont", "ri", "vière", "beau", "lac", "cha", "teau", "ro", "ber", "val", "gny"],
+               "prefixes": ["Saint-", "Sainte-", "Lac-", "Notre-Dame-de-"], "suffixes": ["ville", "mont", "court", "ière"]},
+    "caribbean": {"center": (18.0, -72.0), "spread": 4.0,
+                  "syllables": ["ba", "ra", "co", "ma", "gua", "ya", "ni", "to", "ca", "bo", "ri", "sa"],
+                  "prefixes": ["Port-", "San ", "Saint ", "Cap-"], "suffixes": ["bo", "ey", "ague", "ica"]},
+    "patagonia": {"center": (-44.0, -68.0), "spread": 5.0,
+                  "syllables": ["cal", "fa", "gue", "pil", "que", "lau", "hue", "chu", "tre", "mai", "co", "len"],
+                  "prefixes": ["Puerto ", "Villa ", "General ", "Colonia "], "suffixes": ["hue", "leufu", "co", "mahuida"]},
+}
+
+# export place types and their shares
+PLACE_TYPES = {
+    "inhabited place": 0.62, "hamlet": 0.08, "river": 0.07, "lake": 0.04, "mountain": 0.05,
+    "administrative division": 0.06, "island": 0.02, "neighborhood": 0.04, "estate": 0.02,
+}
+
+PROVINCES_PER_REGION = 12
+MISSING_COORDINATES = 0.05
+MISSING_ALTERNATES = 0.4
+
+# spelling variants of historic and transliterated names
+SPELLINGS = [("c", "k"), ("v", "b"), ("qu", "k"), ("i", "y"), ("hua", "wa"), ("x", "j"), ("ph", "f"), ("ó", "o"), ("è", "e")]
+HISTORIC = ["Old ", "Viejo ", "Antiguo "]
+
+
+def _base_name(rng: random.Random, region: dict) -> str:
+    return "".join(rng.choice(region["syllables"]) for _ in range(rng.randint(2, 3))).capitalize()
+
+
+def place_name(rng: random.Random, region: dict) -> str:
+    """
+    A name in the style of region: syllables, sometimes with one of its prefixes or suffixes.
+    """
+    name = _base_name(rng, region)
+    draw = rng.random()
+    if draw < 0.3:
+        return rng.choice(region["prefixes"]) + name
+    if draw < 0.55:
+        return name + rng.choice(region["suffixes"])
+    return name
+
+
+def alternate_names(rng: random.Random, name: str, region: dict, regions: List[dict]) -> List[str]:
+    """
+    Zero to four variants of name.
+    """
+    variants = []
+    for _ in range(rng.randint(1, 4)):
+        draw = rng.random()
+        if draw < 0.4:
+            old, new = rng.choice(SPELLINGS)
+            variant = name.replace(old, new)
+        elif draw < 0.6:
+            prefix = next((prefix for prefix in region["prefixes"] if name.startswith(prefix)), None)
+            variant = name[len(prefix):] if prefix else rng.choice(region["prefixes"]) + name
+        elif draw < 0.75:
+            variant = rng.choice(HISTORIC) + name
+        else:
+            variant = rng.choice(rng.choice(regions)["prefixes"]) + _base_name(rng, rng.choice(regions))
+        if variant != name and variant not in variants:
+            variants.append(variant)
+    return variants
+
+
+def province_centers(seed: int = 42) -> np.ndarray:
+    """
+    The (latitude, longitude) of the provinces of each region, an array of shape (regions, PROVINCES_PER_REGION, 2).
+    """
+    np_rng = np.random.default_rng(seed)
+    return np.array([
+        [np.asarray(region["center"]) + np_rng.normal(0, region["spread"], 2) for _ in range(PROVINCES_PER_REGION)]
+        for region in REGIONS.values()
+    ])
+
+
+def synthetic_gazetteer(n_rows: int, seed: int = 42, provinces: np.ndarray = None) -> pd.DataFrame:
+    """
+    Builds a gazetteer of n_rows places.
+
+    Args:
+        n_rows (int): Number of places.
+        seed (int, optional): Random seed; the same seed gives the same corpus. Defaults to 42.
+        provinces (np.ndarray, optional): Province centers from province_centers, so that corpora
+            drawn with different seeds share one geography. Defaults to the provinces of seed.
+
+    Returns:
+        pd.DataFrame: place_name, place_type, latitude, longitude and alternate_names ("|"-joined, or None).
+    """
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    regions = list(REGIONS.values())
+    if provinces is None:
+        provinces = province_centers(seed)
+
+    region_index = np_rng.integers(0, len(regions), n_rows)
+    province_index = np_rng.integers(0, PROVINCES_PER_REGION, n_rows)
+    coordinates = provinces[region_index, province_index] + np_rng.normal(0, 0.8, (n_rows, 2))
+    latitude = np.clip(coordinates[:, 0], -90, 90)
+    longitude = np.clip(coordinates[:, 1], -180, 180)
+    missing = np_rng.random(n_rows) < MISSING_COORDINATES
+    latitude[missing] = np.nan
+    longitude[missing] = np.nan
+
+    names = []
+    alternates = []
+    for index in region_index:
+        region = regions[index]
+        name = place_name(rng, region)
+        names.append(name)
+        variants = [] if rng.random() < MISSING_ALTERNATES else alternate_names(rng, name, region, regions)
+        alternates.append("|".join(variants) if variants else None)
+
+    return pd.DataFrame({
+        "place_name": names,
+        "place_type": np_rng.choice(list(PLACE_TYPES), n_rows, p=list(PLACE_TYPES.values())),
+        "latitude": latitude,
+        "longitude": longitude,
+        "alternate_names": alternates,
+    })
+
+
+def write_gazetteer(file_path: str, n_rows: int, seed: int = 42, batch_size: int = 500000) -> str:
+    """
+    Writes a synthetic gazetteer of n_rows places as Parquet, batch_size places at a time.
+    All batches share the provinces of seed; only the places are drawn with a seed per batch.
+
+    Returns:
+        str: The path of the written file.
+    """
+    schema = pa.schema([("place_name", pa.string()), ("place_type", pa.string()), ("latitude", pa.float64()),
+                        ("longitude", pa.float64()), ("alternate_names", pa.string())])
+    provinces = province_centers(seed)
+    with pq.ParquetWriter(file_path, schema) as writer:
+        for batch, start in enumerate(range(0, n_rows, batch_size)):
+            df = synthetic_gazetteer(min(batch_size, n_rows - start), seed=seed + batch, provinces=provinces)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+    return file_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="training/data/synthetic_gazetteer.parquet")
+    args = parser.parse_args()
+
+    print(f"wrote {write_gazetteer(args.output, args.rows, args.seed)}")
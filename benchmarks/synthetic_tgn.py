@@ -0,0 +1,73 @@
+"""
+Generates synthetic TGN XML files with the structure of the Getty TGN XML release.
+"""
+import random
+from xml.sax.saxutils import escape
+
+NAMESPACE = "http://localhost/namespace"
+
+PLACE_TYPES = [
+    "83002/inhabited place", "81010/nation", "81175/state", "21471/river",
+    "21116/lake", "21447/island", "81117/administrative division",
+]
+SYLLABLES = ["san", "ta", "lu", "mar", "co", "ri", "ve", "qui", "to", "ca", "la", "pa", "ma", "no"]
+
+
+def _name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def _coordinate(value: float, kind: str) -> str:
+    degrees = int(abs(value))
+    minutes = int((abs(value) - degrees) * 60)
+    direction = ("N" if value >= 0 else "S") if kind == "Latitude" else ("E" if value >= 0 else "W")
+    return (f"<{kind}><Degrees>{degrees}</Degrees><Minutes>{minutes}</Minutes><Seconds>0</Seconds>"
+            f"<Direction>{direction}</Direction><Decimal>{value:.4f}</Decimal></{kind}>")
+
+
+def subject_xml(subject_id: int, rng: random.Random) -> str:
+    """
+    Returns the XML of one synthetic Subject element.
+    """
+    name = _name(rng)
+    alternates = "".join(
+        f"<Non-Preferred_Term><Term_Text>{escape(_name(rng))}</Term_Text><Term_ID>{rng.randint(1, 10**6)}</Term_ID></Non-Preferred_Term>"
+        for _ in range(rng.randint(0, 5))
+    )
+    coordinates = ""
+    if rng.random() < 0.9:
+        coordinates = (f"<Coordinates><Standard>{_coordinate(rng.uniform(-60, 70), 'Latitude')}"
+                       f"{_coordinate(rng.uniform(-170, 170), 'Longitude')}</Standard></Coordinates>")
+    return (
+        f'<Subject Subject_ID="{subject_id}">'
+        f"<Descriptive_Notes><Descriptive_Note><Note_Text>Synthetic place {escape(name)}.</Note_Text></Descriptive_Note></Descriptive_Notes>"
+        f"<Parent_Relationships><Preferred_Parent><Parent_Subject_ID>{rng.randint(1000000, 7000000)}</Parent_Subject_ID>"
+        f"<Relationship_Type>Parent/Child</Relationship_Type></Preferred_Parent></Parent_Relationships>"
+        f"<Subject_Contributors><Subject_Contributor><Contributor_id>2500000</Contributor_id></Subject_Contributor></Subject_Contributors>"
+        f"<Terms><Preferred_Term><Term_Text>{escape(name)}</Term_Text><Term_ID>{subject_id}</Term_ID></Preferred_Term>{alternates}</Terms>"
+        f"<Place_Types><Preferred_Place_Type><Place_Type_ID>{rng.choice(PLACE_TYPES)}</Place_Type_ID></Preferred_Place_Type>"
+        f"<Non-Preferred_Place_Type><Place_Type_ID>{rng.choice(PLACE_TYPES)}</Place_Type_ID></Non-Preferred_Place_Type></Place_Types>"
+        f"{coordinates}"
+        "</Subject>\n"
+    )
+
+
+def generate_tgn_xml(file_path: str, n_subjects: int, seed: int = 42) -> str:
+    """
+    Writes a synthetic TGN XML file.
+
+    Args:
+        file_path (str): Where to write the file.
+        n_subjects (int): Number of Subject elements.
+        seed (int, optional): Random seed. Defaults to 42.
+
+    Returns:
+        str: The path of the written file.
+    """
+    rng = random.Random(seed)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<Vocabulary xmlns="{NAMESPACE}" Title="TGN">\n')
+        for i in range(n_subjects):
+            f.write(subject_xml(1000000 + i, rng))
+        f.write("</Vocabulary>\n")
+    return file_path
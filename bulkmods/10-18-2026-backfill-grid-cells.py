@@ -0,0 +1,24 @@
+"""
+This script adds the grid_cell column and its index to a places table created before them,
+and computes the grid cell of every place with coordinates (see dbmanager/grid.py).
+New imports fill grid_cell themselves; rerunning the script only fills the rows still missing it.
+"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from dbmanager.backend import get_backend
+
+db = get_backend()
+
+connection = db.connect_to_db()
+
+try:
+    updated = db.backfill_grid_cells(connection)
+    print(f"Grid cells successfully computed for {updated} places")
+except Exception as e:
+    print(f"Error computing grid cells: {e}")
+    connection.rollback()
+finally:
+    connection.close()
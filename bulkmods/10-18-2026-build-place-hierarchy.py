@@ -0,0 +1,24 @@
+"""
+This script creates the place_hierarchy closure table in a database created before it and fills it
+from the parent_id of every place (see dbmanager/hierarchy.py).
+The loaders rebuild it after every import; rerunning the script rebuilds it from scratch.
+"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from dbmanager.backend import get_backend
+
+db = get_backend()
+
+connection = db.connect_to_db()
+
+try:
+    pairs = db.refresh_hierarchy(connection)
+    print(f"Place hierarchy successfully built: {pairs} ancestor/descendant pairs")
+except Exception as e:
+    print(f"Error building the place hierarchy: {e}")
+    connection.rollback()
+finally:
+    connection.close()
@@ -0,0 +1,81 @@
+"""
+Reads inputs straight from the archives they are distributed in, decompressing while parsing.
+
+Supported inputs:
+    - plain files, e.g. raw_data/TGN/TGN1.xml
+    - gzip files, e.g. raw_data/TGN/TGN1.xml.gz or raw_data/HGIS/gz_info_1.csv.gz
+    - zip members, written as <archive>::<member>, e.g. raw_data/TGN/tgn_xml.zip::TGN1.xml.
+      A zip archive given without a member is expanded to its members by expand_inputs().
+"""
+import fnmatch
+import gzip
+import zipfile
+from typing import BinaryIO
+
+# Separates a zip archive from the member to read, e.g. "tgn_xml.zip::TGN1.xml"
+MEMBER_SEPARATOR = "::"
+
+
+def split_member(path: str) -> tuple[str, str | None]:
+    """
+    Splits "archive.zip::member" into the archive path and the member name (None for other inputs).
+    """
+    if MEMBER_SEPARATOR in path:
+        archive, member = path.split(MEMBER_SEPARATOR, 1)
+        return archive, member
+    return path, None
+
+
+def is_compressed(path: str) -> bool:
+    """
+    Whether the input is read through a decompressor, so it cannot be split into byte-range shards.
+    """
+    archive, _ = split_member(path)
+    return archive.endswith((".gz", ".zip"))
+
+
+def expand_inputs(paths: list[str], pattern: str = "*") -> list[str]:
+    """
+    Replaces each zip archive given without a member with its members matching pattern.
+
+    Args:
+        paths (list[str]): Input paths.
+        pattern (str, optional): fnmatch pattern of the members to read, e.g. "*.xml". Defaults to "*".
+    """
+    expanded = []
+    for path in paths:
+        archive, member = split_member(path)
+        if member is None and archive.endswith(".zip"):
+            with zipfile.ZipFile(archive) as zf:
+                members = [info.filename for info in zf.infolist()
+                           if not info.is_dir() and fnmatch.fnmatch(info.filename, pattern)]
+            expanded.extend(f"{archive}{MEMBER_SEPARATOR}{name}" for name in members)
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def open_input(path: str) -> BinaryIO:
+    """
+    Opens an input for streaming binary reads, decompressing gzip files and zip members on the fly.
+
+    Raises:
+        ValueError: If path is a zip archive with more than one member and no member is given.
+    """
+    archive, member = split_member(path)
+    if archive.endswith(".zip"):
+        zf = zipfile.ZipFile(archive)
+        try:
+            if member is None:
+                names = [info.filename for info in zf.infolist() if not info.is_dir()]
+                if len(names) != 1:
+                    raise ValueError(f"{archive} has {len(names)} members; "
+                                     f"name one as {archive}{MEMBER_SEPARATOR}<member>")
+                member = names[0]
+            return zf.open(member)
+        finally:
+            # the member keeps the archive file open until it is closed
+            zf.close()
+    if archive.endswith(".gz"):
+        return gzip.open(archive, "rb")
+    return open(archive, "rb")
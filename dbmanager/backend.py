@@ -0,0 +1,30 @@
+"""
+Selects the storage backend used by the loaders and scripts.
+
+Every backend module exposes the same functions as dbmanage (connect_to_db, get_connection,
+session, create_tables, insert_data, bulk_load, write_rows, execute_sql, close_db,
+export_filtered_places) plus SCHEMA_FILE, PLACE_COLUMNS and BATCH_SIZES.
+"""
+import importlib
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKENDS = {
+    "mysql": "dbmanage",
+    "sqlite": "sqlite_backend",
+}
+
+def get_backend(name: str = None):
+    """
+    Returns the backend module.
+    
+    Parameters:
+        name (str): "mysql" or "sqlite". Defaults to the DATABASE_BACKEND environment variable, or "mysql".
+    """
+    name = (name or os.getenv("DATABASE_BACKEND", "mysql")).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported database backend: {name}")
+    module = BACKENDS[name]
+    return importlib.import_module(f"{__package__}.{module}" if __package__ else module)
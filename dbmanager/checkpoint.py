@@ -0,0 +1,50 @@
+"""
+Checkpoint files that let interrupted imports resume where the last commit left off.
+"""
+import hashlib
+import json
+import os
+from typing import Optional
+
+DEFAULT_CHECKPOINT_DIR = "checkpoints"
+
+
+class Checkpoint:
+    """
+    Stores the progress of one input (a file or a shard of a file) as a small JSON file.
+
+    Args:
+        input_key (str): Identifies the input, e.g. its path or the string of a Shard.
+        directory (str, optional): Where checkpoint files are kept. Defaults to DEFAULT_CHECKPOINT_DIR.
+    """
+    def __init__(self, input_key: str, directory: str = DEFAULT_CHECKPOINT_DIR):
+        self.input_key = input_key
+        digest = hashlib.sha1(os.path.abspath(input_key).encode("utf-8")).hexdigest()[:12]
+        name = os.path.basename(input_key.split(" [")[0])
+        self.path = os.path.join(directory, f"{name}-{digest}.json")
+
+    def load(self) -> Optional[dict]:
+        """
+        Returns the saved state, or None if there is no checkpoint.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def save(self, **state) -> None:
+        """
+        Atomically replaces the saved state.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"input": self.input_key, **state}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        """
+        Removes the checkpoint file.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
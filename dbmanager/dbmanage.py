@@ -1,28 +1,268 @@
 import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+from contextlib import contextmanager
 from dotenv import load_dotenv
 import os
+import tempfile
+import time
+
+try:
+    from .parquet_export import write_cursor_to_parquet, DEFAULT_BATCH_SIZE
+    from . import grid
+    from . import hierarchy
+except ImportError:
+    from parquet_export import write_cursor_to_parquet, DEFAULT_BATCH_SIZE
+    import grid
+    import hierarchy
 
 load_dotenv()
 
-def connect_to_db():
-    return mysql.connector.connect(
-        host=os.getenv("DATABASE_HOST"),
-        user=os.getenv("DATABASE_USER"),
-        password=os.getenv("DATABASE_PASSWORD"),
-        database=os.getenv("DATABASE_NAME")
-    )
+SCHEMA_FILE = "dbmanager/sql/tgn.sql"
+FILTER_SQL_FILE = "dbmanager/sql/filterdata.sql"
+
+PLACE_COLUMNS = [
+    "original_source_id", "source", "place_name", "place_type",
+    "latitude", "longitude", "parent_id", "alternate_names", "grid_cell"
+]
+
+# Secondary indexes of places (see tgn.sql), built after bulk loads into staging tables
+SECONDARY_INDEXES = {
+    "idx_place_type": "place_type",
+    "idx_parent_id": "parent_id",
+    "idx_coordinates": "latitude, longitude",
+    "idx_grid_cell": "grid_cell",
+}
+
+# Columns of place_hashes, the content hashes used by delta imports (see delta.py)
+HASH_COLUMNS = ["original_source_id", "source", "content_hash", "deleted_at"]
+
+# Columns of place_hierarchy, the closure table of parent_id (see hierarchy.py)
+HIERARCHY_COLUMNS = hierarchy.HIERARCHY_COLUMNS
+
+# Columns of the unique_source_id key of places
+UNIQUE_KEY_COLUMNS = ["original_source_id", "source"]
+
+LOAD_STRATEGIES = ("executemany", "load_data")
+
+# Rows per batch for each load strategy
+BATCH_SIZES = {"executemany": 1000, "load_data": 50000}
+
+# mysql.connector does not allow larger pools
+MAX_POOL_SIZE = 32
+
+# Pools are created lazily, one per process and connection flavour, so forked workers never share sockets
+_pools = {}
+
+def _connection_config(allow_local_infile: bool) -> dict:
+    return {
+        "host": os.getenv("DATABASE_HOST"),
+        "user": os.getenv("DATABASE_USER"),
+        "password": os.getenv("DATABASE_PASSWORD"),
+        "database": os.getenv("DATABASE_NAME"),
+        "allow_local_infile": allow_local_infile,
+    }
+
+def connect_to_db(allow_local_infile: bool = False):
+    """
+    Opens a connection to the database configured in the environment.
+    
+    Parameters:
+        allow_local_infile (bool): Whether LOAD DATA LOCAL INFILE is allowed on the connection. Required by bulk_load.
+    """
+    return mysql.connector.connect(**_connection_config(allow_local_infile))
+
+def get_pool(allow_local_infile: bool = False) -> pooling.MySQLConnectionPool:
+    """
+    Returns the connection pool of the current process, creating it on first use.
+    The size is read from DATABASE_POOL_SIZE (default 5, at most MAX_POOL_SIZE).
+    
+    Parameters:
+        allow_local_infile (bool): Whether the pooled connections allow LOAD DATA LOCAL INFILE.
+    """
+    key = (os.getpid(), allow_local_infile)
+    if key not in _pools:
+        pool_size = min(int(os.getenv("DATABASE_POOL_SIZE", 5)), MAX_POOL_SIZE)
+        _pools[key] = pooling.MySQLConnectionPool(
+            pool_name=f"places_{os.getpid()}_{int(allow_local_infile)}",
+            pool_size=pool_size,
+            pool_reset_session=True,
+            **_connection_config(allow_local_infile)
+        )
+    return _pools[key]
+
+def get_connection(allow_local_infile: bool = False, timeout: float = None):
+    """
+    Borrows a connection from the pool. Closing the connection returns it to the pool.
+    Waits up to timeout seconds (DATABASE_POOL_TIMEOUT, default 30) when the pool is exhausted.
+    
+    Parameters:
+        allow_local_infile (bool): Whether LOAD DATA LOCAL INFILE is allowed on the connection. Required by bulk_load.
+        timeout (float): Seconds to wait for a free connection.
+    """
+    pool = get_pool(allow_local_infile)
+    timeout = float(os.getenv("DATABASE_POOL_TIMEOUT", 30)) if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return pool.get_connection()
+        except PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+@contextmanager
+def session(prepared: bool = False, allow_local_infile: bool = False):
+    """
+    Context manager that yields a cursor on a pooled connection, commits when the block
+    succeeds, rolls back when it raises, and returns the connection to the pool.
+    
+    Usage:
+        with db.session() as cursor:
+            cursor.execute(...)
     
-def create_tables(cursor, model_file):
+    Parameters:
+        prepared (bool): Use server-side prepared statements for the cursor.
+        allow_local_infile (bool): Whether LOAD DATA LOCAL INFILE is allowed on the connection. Required by bulk_load.
+    """
+    connection = get_connection(allow_local_infile)
+    cursor = connection.cursor(prepared=prepared)
+    try:
+        yield cursor
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        close_db(cursor, connection)
+    
+def create_tables(cursor, model_file=SCHEMA_FILE):
     with open(model_file, "r") as file:
         cursor.execute(file.read())
+    add_grid_cell(cursor)
 
-def insert_data(cursor, data):
+def add_grid_cell(cursor) -> None:
+    """
+    Adds the grid_cell column and idx_grid_cell to places if they are missing, as in tables created before them.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+    """
+    cursor.execute("ALTER TABLE places ADD COLUMN IF NOT EXISTS grid_cell BIGINT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grid_cell ON places(grid_cell)")
+
+def upsert_clause(columns: list[str]) -> str:
+    """
+    Returns an ON DUPLICATE KEY UPDATE clause that overwrites the non-key columns.
+    """
+    updates = ", ".join(f"{column} = VALUES({column})" for column in columns if column not in UNIQUE_KEY_COLUMNS)
+    return f"ON DUPLICATE KEY UPDATE {updates}"
+
+def insert_data(cursor, data, upsert: bool = False):
+    """
+    Inserts place rows with executemany.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        data (list[Sequence]): The rows to insert, in the order of PLACE_COLUMNS.
+        upsert (bool): If True, rows whose (original_source_id, source) already exists are updated instead of failing.
+    """
     sql = """
-    INSERT INTO places (original_source_id, source, place_name, place_type, latitude, longitude, parent_id, alternate_names) 
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    INSERT INTO places (original_source_id, source, place_name, place_type, latitude, longitude, parent_id, alternate_names, grid_cell) 
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
+    if upsert:
+        sql += upsert_clause(PLACE_COLUMNS)
     cursor.executemany(sql, data)
 
+def _tsv_field(value) -> str:
+    """
+    Formats a value as a LOAD DATA field: NULL as \\N, with backslash, tab, newline,
+    carriage return and NUL characters escaped.
+    """
+    if value is None or (isinstance(value, float) and value != value):  # None or NaN
+        return "\\N"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    text = str(value)
+    if "\\" in text:
+        text = text.replace("\\", "\\\\")
+    if "\t" in text or "\n" in text or "\r" in text or "\0" in text:
+        text = text.replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r").replace("\0", "\\0")
+    return text
+
+def bulk_load(cursor, rows, table: str = "places", columns: list[str] = PLACE_COLUMNS, upsert: bool = False) -> int:
+    """
+    Loads rows with LOAD DATA LOCAL INFILE, streaming them through a temporary TSV file.
+    The connection of the cursor must be opened with allow_local_infile=True.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        rows (Iterable[Sequence]): The rows to load, in the order of columns.
+        table (str): The table to load the rows into.
+        columns (list[str]): The columns of the rows.
+        upsert (bool): If True, rows are loaded into a temporary table and merged with
+            INSERT ... SELECT ... ON DUPLICATE KEY UPDATE.
+        
+    Returns:
+        int: The number of rows loaded.
+    """
+    if upsert:
+        staging = f"{table}_upsert_tmp"
+        cursor.execute(f"CREATE TEMPORARY TABLE {staging} LIKE {table}")
+        try:
+            count = bulk_load(cursor, rows, staging, columns)
+            column_list = ", ".join(columns)
+            cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {staging} {upsert_clause(columns)}")
+            return count
+        finally:
+            cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staging}")
+    
+    with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8", newline="", delete=False) as file:
+        for row in rows:
+            file.write("\t".join([_tsv_field(value) for value in row]))
+            file.write("\n")
+        tsv_path = file.name
+    
+    try:
+        cursor.execute(f"""
+        LOAD DATA LOCAL INFILE '{tsv_path}' INTO TABLE {table}
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+        LINES TERMINATED BY '\\n'
+        ({', '.join(columns)})
+        """)
+        return cursor.rowcount
+    finally:
+        os.remove(tsv_path)
+
+def write_rows(cursor, rows, strategy: str = "executemany", table: str = "places", columns: list[str] = PLACE_COLUMNS,
+               upsert: bool = False) -> None:
+    """
+    Writes rows with the given load strategy.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        rows (Iterable[Sequence]): The rows to write, in the order of columns.
+        strategy (str): "executemany" for batched INSERT statements or "load_data" for bulk_load.
+        table (str): The table to write the rows into.
+        columns (list[str]): The columns of the rows.
+        upsert (bool): If True, existing rows with the same (original_source_id, source) are updated.
+    """
+    if strategy == "load_data":
+        bulk_load(cursor, rows, table, columns, upsert=upsert)
+    elif strategy == "executemany":
+        if table == "places" and columns == PLACE_COLUMNS:
+            insert_data(cursor, list(rows), upsert=upsert)
+        else:
+            placeholders = ', '.join(['%s'] * len(columns))
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+            if upsert:
+                sql += f" {upsert_clause(columns)}"
+            cursor.executemany(sql, list(rows))
+    else:
+        raise ValueError(f"Unsupported load strategy: {strategy}")
+
 def execute_sql(cursor, sql):
     """
     Executes a SQL command or SQL file.
@@ -40,6 +280,224 @@ def execute_sql(cursor, sql):
         print(f"Error executing SQL command: {e}")
         raise
 
+def create_staging_table(cursor, table: str = "places", staging: str = "places_staging", exclude_source: str = None) -> None:
+    """
+    Creates an empty copy of table without its secondary indexes, replacing any previous staging table.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        table (str): The table to copy.
+        staging (str): The name of the staging table.
+        exclude_source (str): If given, the rows of every other source are copied into the staging table,
+            so that swapping it in replaces only the rows of this source.
+    """
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    cursor.execute(f"CREATE TABLE {staging} LIKE {table}")
+    cursor.execute(f"SHOW INDEX FROM {staging}")
+    existing = {row[2] for row in cursor.fetchall()}
+    drops = [f"DROP INDEX {name}" for name in SECONDARY_INDEXES if name in existing]
+    if drops:
+        cursor.execute(f"ALTER TABLE {staging} {', '.join(drops)}")
+    if exclude_source is not None:
+        cursor.execute(f"INSERT INTO {staging} SELECT * FROM {table} WHERE source <> %s OR source IS NULL", (exclude_source,))
+
+def swap_tables(cursor, table: str = "places", staging: str = "places_staging") -> None:
+    """
+    Builds the secondary indexes of the staging table and atomically swaps it in with RENAME TABLE.
+    Readers see either the old or the new table. The old table is dropped.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        table (str): The table to replace.
+        staging (str): The loaded staging table.
+    """
+    cursor.execute(f"ALTER TABLE {staging} " + ", ".join(
+        f"ADD INDEX {name} ({columns})" for name, columns in SECONDARY_INDEXES.items()
+    ))
+    cursor.execute(f"DROP TABLE IF EXISTS {table}_old")
+    cursor.execute(f"RENAME TABLE {table} TO {table}_old, {staging} TO {table}")
+    cursor.execute(f"DROP TABLE {table}_old")
+
+def export_filtered_places(cursor, output_path: str, batch_size: int = DEFAULT_BATCH_SIZE, roots: list[tuple[str, int]] = None) -> int:
+    """
+    Streams the places with the training place types into a Parquet file, batch_size rows per row group.
+    Works with any server and user with SELECT privileges; the rows never leave the client's memory in bulk.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): An unbuffered cursor (the default), so rows are
+            read from the server as they are fetched instead of all at once.
+        output_path (str): The path of the Parquet file.
+        batch_size (int): Rows fetched per round trip and written per row group.
+        roots (list[tuple[str, int]]): If given, only the places in the subtrees of these
+            (source, original_source_id) places are exported, through place_hierarchy.
+    
+    Returns:
+        int: The number of rows written.
+    """
+    with open(FILTER_SQL_FILE, "r") as file:
+        sql = file.read().strip().rstrip(";")
+    params = []
+    if roots:
+        condition, params = hierarchy.subtree_condition(roots, "%s")
+        sql = f"{sql} AND {condition}"
+    cursor.execute(sql, params)
+    return write_cursor_to_parquet(cursor, output_path, batch_size)
+
+def load_hashes(cursor, source: str, batch_size: int = 100000):
+    """
+    Yields (original_source_id, content_hash) for the live rows of source in place_hashes.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        source (str): The source of the rows, e.g. "TGN".
+        batch_size (int): Rows fetched per round trip.
+    """
+    cursor.execute("SELECT original_source_id, content_hash FROM place_hashes WHERE source = %s AND deleted_at IS NULL", (source,))
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+def tombstone_places(cursor, source: str, ids, batch_size: int = 1000) -> int:
+    """
+    Deletes the places of source with the given ids and marks their hashes as deleted,
+    keeping a record of when each row left the source.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        source (str): The source of the rows, e.g. "TGN".
+        ids (Sequence[int]): The original_source_id of the rows to delete.
+        batch_size (int): Ids per statement.
+    
+    Returns:
+        int: The number of places deleted.
+    """
+    deleted = 0
+    for i in range(0, len(ids), batch_size):
+        batch = list(ids[i:i + batch_size])
+        placeholders = ", ".join(["%s"] * len(batch))
+        cursor.execute(f"DELETE FROM places WHERE source = %s AND original_source_id IN ({placeholders})", [source] + batch)
+        deleted += cursor.rowcount
+        cursor.execute(f"UPDATE place_hashes SET deleted_at = CURRENT_TIMESTAMP "
+                       f"WHERE source = %s AND original_source_id IN ({placeholders})", [source] + batch)
+    return deleted
+
+def places_in_bbox(cursor, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                   columns: list[str] = PLACE_COLUMNS) -> list[tuple]:
+    """
+    Returns the places in a bounding box, reading only the idx_grid_cell ranges of the cells covering it.
+    A box with min_lon > max_lon crosses the antimeridian.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        min_lat, min_lon, max_lat, max_lon (float): The bounding box in degrees.
+        columns (list[str]): The columns to return.
+    """
+    return grid.places_in_bbox(cursor, min_lat, min_lon, max_lat, max_lon, columns, "%s", grid.MYSQL_INDEX_HINT)
+
+def places_within_radius(cursor, latitude: float, longitude: float, radius_km: float,
+                         columns: list[str] = PLACE_COLUMNS) -> list[tuple]:
+    """
+    Returns the places within radius_km of a point, nearest first, each row followed by its distance in km.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        latitude, longitude (float): The center in degrees.
+        radius_km (float): The radius in km.
+        columns (list[str]): The columns to return.
+    """
+    return grid.places_within_radius(cursor, latitude, longitude, radius_km, columns, "%s", grid.MYSQL_INDEX_HINT)
+
+def backfill_grid_cells(connection, batch_size: int = 10000) -> int:
+    """
+    Adds the grid_cell column and idx_grid_cell to a places table created before them,
+    and computes the cell of every place with coordinates that has none.
+    
+    Parameters:
+        connection (mysql.connector.connection.MySQLConnection): The connection to use.
+        batch_size (int): Places updated per commit.
+    
+    Returns:
+        int: The number of places updated.
+    """
+    cursor = connection.cursor()
+    try:
+        add_grid_cell(cursor)
+        connection.commit()
+    finally:
+        cursor.close()
+    return grid.backfill_grid_cells(connection, "%s", batch_size)
+
+def refresh_hierarchy(connection, strategy: str = "executemany", batch_size: int = None) -> int:
+    """
+    Rebuilds place_hierarchy from the parent_id of every place, creating the table if needed.
+    The pairs are loaded into a staging table that is swapped in with RENAME TABLE, so readers
+    see either the old or the new hierarchy.
+    
+    Parameters:
+        connection (mysql.connector.connection.MySQLConnection): The connection to use.
+        strategy (str): "executemany" or "load_data"; load_data needs a connection opened with allow_local_infile=True.
+        batch_size (int): Pairs per write. Defaults to BATCH_SIZES[strategy].
+    
+    Returns:
+        int: The number of (ancestor, descendant) pairs, including the depth 0 pair of every place.
+    """
+    cursor = connection.cursor()
+    try:
+        for statement in hierarchy.CREATE_TABLE_SQL:
+            cursor.execute(statement)
+        ancestor, descendant, depth = hierarchy.closure(hierarchy.read_parents(cursor))
+        cursor.execute("DROP TABLE IF EXISTS place_hierarchy_staging")
+        cursor.execute("CREATE TABLE place_hierarchy_staging LIKE place_hierarchy")
+        for rows in hierarchy.iter_rows(ancestor, descendant, depth, batch_size or BATCH_SIZES[strategy]):
+            write_rows(cursor, rows, strategy, "place_hierarchy_staging", HIERARCHY_COLUMNS)
+        connection.commit()
+        cursor.execute("DROP TABLE IF EXISTS place_hierarchy_old")
+        cursor.execute("RENAME TABLE place_hierarchy TO place_hierarchy_old, place_hierarchy_staging TO place_hierarchy")
+        cursor.execute("DROP TABLE place_hierarchy_old")
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(depth)
+
+def descendants(cursor, place_id: int, columns: list[str] = PLACE_COLUMNS, max_depth: int = None,
+                include_self: bool = False) -> list[tuple]:
+    """
+    Returns the places under a place, nearest first, each row followed by its depth below the place.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        place_id (int): The place_id of the root of the subtree.
+        columns (list[str]): The columns to return.
+        max_depth (int): If given, only the places at most this many levels below are returned.
+        include_self (bool): If True, the place itself is returned first, at depth 0.
+    """
+    return hierarchy.descendants(cursor, place_id, columns, "%s", max_depth, include_self)
+
+def ancestors(cursor, place_id: int, columns: list[str] = PLACE_COLUMNS) -> list[tuple]:
+    """
+    Returns the ancestors of a place from its parent to the root, each row followed by its depth above the place.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        place_id (int): The place_id of the place.
+        columns (list[str]): The columns to return.
+    """
+    return hierarchy.ancestors(cursor, place_id, columns, "%s")
+
+def place_depth(cursor, place_id: int) -> int:
+    """
+    Returns the number of ancestors of a place (0 for a root), or None if it is not in place_hierarchy.
+    
+    Parameters:
+        cursor (mysql.connector.cursor.MySQLCursor): The cursor object to execute the SQL command.
+        place_id (int): The place_id of the place.
+    """
+    return hierarchy.place_depth(cursor, place_id, "%s")
+
 def close_db(cursor, connection):
     cursor.close()
     connection.close()
@@ -0,0 +1,94 @@
+"""
+Content hashes of imported rows, for delta imports of new source releases.
+
+The hash of every imported row is kept in the place_hashes table, keyed by
+(original_source_id, source). A delta import hashes each extracted row, compares it with
+the stored hash and writes only the rows that are new or changed, so a new release that
+changes a small part of the source writes a small part of the table.
+"""
+import hashlib
+from typing import Callable, Iterable, Optional, Sequence
+
+# Indexes loaded in this process, by source. Loaded before the worker pool is created so that
+# forked workers share them instead of reading the table again.
+_indexes = {}
+
+
+def row_hash(row: Sequence) -> int:
+    """
+    Stable 64-bit hash of a row tuple, as a signed integer that fits a BIGINT column.
+    repr() keeps None, "" and "None" apart, and the unit separator keeps the fields apart.
+    """
+    digest = hashlib.blake2b("\x1f".join(map(repr, row)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class DeltaIndex:
+    """
+    The stored content hashes of one source, and the ids seen by the current import.
+
+    Args:
+        source (str): The source of the rows, e.g. "TGN".
+        hashes (dict[int, int], optional): Stored hash by original_source_id. Defaults to empty (first import).
+    """
+    def __init__(self, source: str, hashes: Optional[dict] = None):
+        self.source = source
+        self.hashes = hashes if hashes is not None else {}
+        self.seen = set()
+
+    @classmethod
+    def load(cls, source: str, load_hashes: Callable[[str], Iterable[tuple[int, int]]]) -> "DeltaIndex":
+        """
+        Builds the index of source from load_hashes(source), e.g. the backend's load_hashes on a cursor.
+        """
+        return cls(source, dict(load_hashes(source)))
+
+    def changed(self, row: Sequence) -> bool:
+        """
+        Records the row as seen and tells whether it is new or differs from the stored version.
+        Rows without an id cannot be tracked and always count as changed.
+        """
+        original_source_id = row[0]
+        if original_source_id is None:
+            return True
+        self.seen.add(original_source_id)
+        content_hash = row_hash(row)
+        if self.hashes.get(original_source_id) == content_hash:
+            return False
+        self.hashes[original_source_id] = content_hash
+        return True
+
+    def missing(self, seen: Iterable[int] = None) -> list[int]:
+        """
+        Ids of stored rows that were not seen by the import, i.e. removed from the source.
+
+        Args:
+            seen (Iterable[int], optional): The ids seen by the whole import, when it ran in several
+                processes. Defaults to the ids seen through this index.
+        """
+        seen = self.seen if seen is None else set(seen)
+        return [original_source_id for original_source_id in self.hashes if original_source_id not in seen]
+
+
+def hash_rows(rows: Iterable[Sequence]) -> list[tuple]:
+    """
+    Rows for the place_hashes table (see HASH_COLUMNS of the backends) of the given place rows.
+    deleted_at is written as NULL, so a row that comes back after a tombstone is live again.
+    """
+    return [(row[0], row[1], row_hash(row), None) for row in rows if row[0] is not None]
+
+
+def get_index(source: str, load_hashes: Callable[[str], Iterable[tuple[int, int]]]) -> DeltaIndex:
+    """
+    Returns the index of source, loading it on first use in this process.
+    """
+    if source not in _indexes:
+        _indexes[source] = DeltaIndex.load(source, load_hashes)
+    return _indexes[source]
+
+
+def clear_indexes() -> None:
+    """
+    Forgets the loaded indexes, e.g. after an import so that the next one reads the table again.
+    """
+    _indexes.clear()
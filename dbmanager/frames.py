@@ -0,0 +1,71 @@
+"""
+Converts DataFrames to DB-ready row tuples batch by batch.
+
+Replaces df.replace({pd.NA: None, pd.NaT: None, np.nan: None}) followed by values.tolist(),
+which turns every column into object dtype and copies the whole frame twice. Here the typed
+column buffers are sliced per batch (views, no copy) and only the batch is converted to
+Python objects, mapping NaN/NA/NaT to None on the fly.
+"""
+import numpy as np
+import pandas as pd
+from typing import Iterator
+
+
+def _to_objects(values, integer: bool = False) -> np.ndarray:
+    """
+    Converts a column slice to an object array of Python values with None for missing values.
+
+    Args:
+        values (np.ndarray | ExtensionArray): The column slice.
+        integer (bool, optional): Write whole-number floats as int (e.g. IDs read as float64
+            because of missing values). Defaults to False.
+    """
+    if not isinstance(values, np.ndarray):
+        return values.to_numpy(dtype=object, na_value=None)
+
+    kind = values.dtype.kind
+    if kind == "f":
+        mask = np.isnan(values)
+        if integer:
+            objects = np.where(mask, 0, values).astype(np.int64).astype(object)
+        else:
+            objects = values.astype(object)
+        if mask.any():
+            objects[mask] = None
+        return objects
+    if kind in "iub":
+        return values.astype(object)
+    if kind == "O":
+        mask = pd.isna(values)
+        if mask.any():
+            values = values.copy()
+            values[mask] = None
+        return values
+    # datetimes, timedeltas and anything else go through pandas' NA handling
+    return pd.array(values).to_numpy(dtype=object, na_value=None)
+
+
+def iter_row_batches(df: pd.DataFrame, columns: list[str] = None, batch_size: int = 1000, start: int = 0,
+                     integer_columns: tuple[str, ...] = ()) -> Iterator[list[tuple]]:
+    """
+    Yields the rows of a DataFrame as lists of tuples, batch_size rows at a time.
+
+    Args:
+        df (pd.DataFrame): The frame to convert.
+        columns (list[str], optional): Columns to emit, in order. Defaults to all columns.
+        batch_size (int, optional): Rows per batch. Defaults to 1000.
+        start (int, optional): Position of the first row to emit. Defaults to 0.
+        integer_columns (tuple[str, ...], optional): Float columns holding integers, written as int.
+    """
+    columns = list(df.columns) if columns is None else columns
+    arrays = []
+    for column in columns:
+        array = df[column].array
+        # numpy-backed columns are exposed as a NumpyExtensionArray; unwrap them to slice the buffer directly
+        if isinstance(array, pd.arrays.NumpyExtensionArray):
+            array = array.to_numpy()
+        arrays.append((array, column in integer_columns))
+
+    for i in range(start, len(df), batch_size):
+        converted = [_to_objects(array[i:i + batch_size], integer) for array, integer in arrays]
+        yield list(zip(*converted))
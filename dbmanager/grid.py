@@ -0,0 +1,239 @@
+"""
+Grid cell keys of places, for indexed bounding-box and radius queries.
+
+The grid is a quadtree over longitude [-180, 180] and latitude [-90, 90]. A place's grid_cell is
+the Z-order (Morton) code of its cell at MAX_LEVEL: the bits of the column and row numbers,
+interleaved. The code of a cell at a coarser level L is grid_cell >> 2 * (MAX_LEVEL - L), so every
+cell at every resolution is one contiguous range of grid_cell values. A bounding box is covered by
+a few cells at a suitable level and queried as a few BETWEEN ranges on the idx_grid_cell B-tree,
+followed by an exact filter on latitude/longitude.
+"""
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Finest level: 2^24 columns of ~2.4 m at the equator; 48-bit codes fit a BIGINT
+MAX_LEVEL = 24
+
+# Largest number of cells used to cover a query box
+DEFAULT_MAX_CELLS = 32
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Index hint of the bounding-box queries on MySQL/MariaDB, whose optimizer may otherwise range-scan idx_coordinates
+MYSQL_INDEX_HINT = "FORCE INDEX (idx_grid_cell)"
+
+
+def _spread(value: int) -> int:
+    """
+    Spreads the 24 low bits of value to the even bits of a 48-bit integer.
+    """
+    value = (value | (value << 16)) & 0x0000FFFF0000FFFF
+    value = (value | (value << 8)) & 0x00FF00FF00FF00FF
+    value = (value | (value << 4)) & 0x0F0F0F0F0F0F0F0F
+    value = (value | (value << 2)) & 0x3333333333333333
+    value = (value | (value << 1)) & 0x5555555555555555
+    return value
+
+
+def _cell_number(value: float, minimum: float, span: float, level: int) -> int:
+    n = 1 << level
+    return min(n - 1, max(0, int((value - minimum) / span * n)))
+
+
+def grid_cell(latitude: Optional[float], longitude: Optional[float]) -> Optional[int]:
+    """
+    Returns the grid cell of a point at MAX_LEVEL, or None if a coordinate is missing.
+    """
+    if latitude is None or longitude is None or latitude != latitude or longitude != longitude:
+        return None
+    x = _cell_number(float(longitude), -180.0, 360.0, MAX_LEVEL)
+    y = _cell_number(float(latitude), -90.0, 180.0, MAX_LEVEL)
+    return _spread(x) | (_spread(y) << 1)
+
+
+def _spread_array(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.uint64)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def grid_cells(latitude: np.ndarray, longitude: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized grid_cell.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The int64 cells and a mask of the points with both coordinates
+            (the cells of the other points are 0).
+    """
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    valid = ~(np.isnan(latitude) | np.isnan(longitude))
+    n = 1 << MAX_LEVEL
+    x = np.clip(np.floor((np.where(valid, longitude, 0.0) + 180.0) / 360.0 * n), 0, n - 1)
+    y = np.clip(np.floor((np.where(valid, latitude, 0.0) + 90.0) / 180.0 * n), 0, n - 1)
+    cells = (_spread_array(x) | (_spread_array(y) << np.uint64(1))).astype(np.int64)
+    cells[~valid] = 0
+    return cells, valid
+
+
+def cell_ranges(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                max_cells: int = DEFAULT_MAX_CELLS) -> list[tuple[int, int]]:
+    """
+    Covers a bounding box (not crossing the antimeridian) with the cells of the finest level that
+    needs at most max_cells of them, and returns their grid_cell ranges, merged where adjacent.
+    """
+    level = 0
+    for candidate in range(MAX_LEVEL, -1, -1):
+        columns = _cell_number(max_lon, -180.0, 360.0, candidate) - _cell_number(min_lon, -180.0, 360.0, candidate) + 1
+        rows = _cell_number(max_lat, -90.0, 180.0, candidate) - _cell_number(min_lat, -90.0, 180.0, candidate) + 1
+        if columns * rows <= max_cells:
+            level = candidate
+            break
+
+    shift = 2 * (MAX_LEVEL - level)
+    codes = sorted(
+        _spread(x) | (_spread(y) << 1)
+        for x in range(_cell_number(min_lon, -180.0, 360.0, level), _cell_number(max_lon, -180.0, 360.0, level) + 1)
+        for y in range(_cell_number(min_lat, -90.0, 180.0, level), _cell_number(max_lat, -90.0, 180.0, level) + 1)
+    )
+    ranges = []
+    for code in codes:
+        start, end = code << shift, ((code + 1) << shift) - 1
+        if ranges and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def split_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> list[tuple[float, float, float, float]]:
+    """
+    Clamps a bounding box to valid coordinates, splitting it in two if it crosses the antimeridian
+    (min_lon > max_lon, or longitudes beyond +-180).
+    """
+    min_lat, max_lat = max(-90.0, min_lat), min(90.0, max_lat)
+    if max_lon - min_lon >= 360.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    if min_lon < -180.0:
+        min_lon += 360.0
+    if max_lon > 180.0:
+        max_lon -= 360.0
+    if min_lon > max_lon:
+        return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
+
+
+def bbox_condition(min_lat: float, min_lon: float, max_lat: float, max_lon: float, placeholder: str = "%s",
+                   max_cells: int = DEFAULT_MAX_CELLS) -> tuple[str, list]:
+    """
+    Returns a WHERE condition selecting the places in a bounding box through idx_grid_cell, and its parameters.
+
+    Args:
+        placeholder (str, optional): The parameter placeholder of the backend ("%s" for MySQL/MariaDB,
+            "?" for SQLite). Defaults to "%s".
+    """
+    # SQLite only: +latitude is an expression that no index matches, which keeps its planner from
+    # choosing idx_coordinates over the grid cell ranges. MySQL/MariaDB ignore unary + and are
+    # queried with MYSQL_INDEX_HINT instead.
+    coordinate = "+" if placeholder == "?" else ""
+    conditions = []
+    params = []
+    for box in split_bbox(min_lat, min_lon, max_lat, max_lon):
+        for start, end in cell_ranges(*box, max_cells=max_cells):
+            # one flat term per range lets the planner union index range scans
+            conditions.append(f"(grid_cell BETWEEN {placeholder} AND {placeholder} "
+                              f"AND {coordinate}latitude BETWEEN {placeholder} AND {placeholder} "
+                              f"AND {coordinate}longitude BETWEEN {placeholder} AND {placeholder})")
+            params.extend([start, end, box[0], box[2], box[1], box[3]])
+    return " OR ".join(conditions), params
+
+
+def radius_bbox(latitude: float, longitude: float, radius_km: float) -> tuple[float, float, float, float]:
+    """
+    Returns a bounding box containing the circle of radius_km around a point.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = latitude - delta_lat, latitude + delta_lat
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        # the circle contains a pole: every longitude
+        return max(-90.0, min_lat), -180.0, min(90.0, max_lat), 180.0
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))
+    if ratio >= 1.0:
+        return min_lat, -180.0, max_lat, 180.0
+    delta_lon = math.degrees(math.asin(ratio))
+    return min_lat, longitude - delta_lon, max_lat, longitude + delta_lon
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    Great-circle distances in km from a point to arrays of points.
+    """
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def places_in_bbox(cursor, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                   columns: Sequence[str], placeholder: str = "%s", index_hint: str = "") -> list[tuple]:
+    """
+    Returns the columns of the places in a bounding box, using idx_grid_cell.
+
+    Args:
+        index_hint (str, optional): Index hint after the table name, such as MYSQL_INDEX_HINT. Defaults to none.
+    """
+    condition, params = bbox_condition(min_lat, min_lon, max_lat, max_lon, placeholder)
+    table = f"places {index_hint}" if index_hint else "places"
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {condition}", params)
+    return cursor.fetchall()
+
+
+def places_within_radius(cursor, latitude: float, longitude: float, radius_km: float, columns: Sequence[str],
+                         placeholder: str = "%s", index_hint: str = "") -> list[tuple]:
+    """
+    Returns the columns of the places within radius_km of a point, nearest first, each row
+    followed by its distance in km.
+    """
+    columns = list(columns) + ["latitude", "longitude"]
+    rows = places_in_bbox(cursor, *radius_bbox(latitude, longitude, radius_km), columns, placeholder, index_hint)
+    if not rows:
+        return []
+    coordinates = np.array([(float(row[-2]), float(row[-1])) for row in rows])
+    distances = haversine_km(latitude, longitude, coordinates[:, 0], coordinates[:, 1])
+    order = np.argsort(distances, kind="stable")
+    return [rows[i][:-2] + (float(distances[i]),) for i in order if distances[i] <= radius_km]
+
+
+def backfill_grid_cells(connection, placeholder: str = "%s", batch_size: int = 10000) -> int:
+    """
+    Computes grid_cell for the places with coordinates and no cell, batch_size rows per commit.
+
+    Returns:
+        int: The number of places updated.
+    """
+    cursor = connection.cursor()
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                f"SELECT place_id, latitude, longitude FROM places WHERE place_id > {placeholder} "
+                f"AND grid_cell IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL "
+                f"ORDER BY place_id LIMIT {placeholder}", (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            cells, _ = grid_cells([float(row[1]) for row in rows], [float(row[2]) for row in rows])
+            cursor.executemany(f"UPDATE places SET grid_cell = {placeholder} WHERE place_id = {placeholder}",
+                               list(zip(cells.tolist(), ids)))
+            connection.commit()
+            updated += len(rows)
+            last_id = ids[-1]
+    finally:
+        cursor.close()
+    return updated
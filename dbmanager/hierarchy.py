@@ -0,0 +1,187 @@
+"""
+Closure table of the place hierarchy, for subtree queries without recursion.
+
+places.parent_id holds the original_source_id of a place's parent in the same source. The
+place_hierarchy table stores one row (ancestor_id, descendant_id, depth) for every place and each
+of its ancestors, by place_id, with depth the number of parent links between them. Every place is
+also its own ancestor at depth 0, so "the subtree of X" is a single indexed lookup of ancestor_id = X
+joined to places. The table is computed in one pass over the parent links with numpy and is rebuilt
+after imports.
+"""
+from typing import Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Columns of place_hierarchy
+HIERARCHY_COLUMNS = ["ancestor_id", "descendant_id", "depth"]
+
+# Parent chains longer than this are treated as cycles and cut
+MAX_DEPTH = 64
+
+# The same DDL works on MySQL and SQLite; also in tgn.sql and tgn_sqlite.sql
+CREATE_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS place_hierarchy ("
+    "ancestor_id BIGINT NOT NULL, descendant_id BIGINT NOT NULL, depth INT NOT NULL, "
+    "PRIMARY KEY (ancestor_id, descendant_id))",
+    "CREATE INDEX IF NOT EXISTS idx_hierarchy_descendant ON place_hierarchy(descendant_id, depth)",
+)
+
+
+def read_parents(cursor, batch_size: int = 100000) -> pd.DataFrame:
+    """
+    Reads place_id, source, original_source_id and parent_id of every place.
+    """
+    cursor.execute("SELECT place_id, source, original_source_id, parent_id FROM places")
+    frames = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        frames.append(pd.DataFrame.from_records(rows, columns=["place_id", "source", "original_source_id", "parent_id"]))
+    if not frames:
+        return pd.DataFrame(columns=["place_id", "source", "original_source_id", "parent_id"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def parent_positions(places: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Resolves the parent_id of each place to the place with that original_source_id in the same source.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The int64 place_ids, sorted, and for each of them the position of
+            its parent in that array (-1 for roots and for parents that are not in places).
+    """
+    place_ids = pd.to_numeric(places["place_id"]).to_numpy(np.int64)
+    order = np.argsort(place_ids, kind="stable")
+    place_ids = place_ids[order]
+    places = places.iloc[order].reset_index(drop=True)
+    parents = np.full(len(places), -1, dtype=np.int64)
+
+    keys = pd.DataFrame({
+        "source": places["source"],
+        "original_source_id": pd.to_numeric(places["original_source_id"], errors="coerce"),
+        "parent_id": pd.to_numeric(places["parent_id"], errors="coerce"),
+        "position": np.arange(len(places)),
+    })
+    children = keys[keys["parent_id"].notna()]
+    candidates = keys.loc[keys["original_source_id"].notna(), ["source", "original_source_id", "position"]]
+    links = children[["source", "parent_id", "position"]].merge(
+        candidates.rename(columns={"original_source_id": "parent_id", "position": "parent_position"}),
+        on=["source", "parent_id"], how="inner",
+    )
+    parents[links["position"].to_numpy()] = links["parent_position"].to_numpy()
+    # a place that is its own parent is a root
+    parents[parents == np.arange(len(parents))] = -1
+    return place_ids, parents
+
+
+def closure(places: pd.DataFrame, max_depth: int = MAX_DEPTH) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the closure of the parent links of places, one level per iteration over all places at once.
+
+    Args:
+        places (pd.DataFrame): place_id, source, original_source_id and parent_id of every place (see read_parents).
+        max_depth (int, optional): Parent chains are cut after this many links. Defaults to MAX_DEPTH.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The ancestor_id, descendant_id and depth of every pair,
+            sorted by ancestor_id and descendant_id.
+    """
+    place_ids, parents = parent_positions(places)
+    positions = np.arange(len(place_ids))
+    ancestor_parts, descendant_parts, depth_parts = [positions], [positions], [np.zeros(len(place_ids), dtype=np.int64)]
+
+    descendant, ancestor = positions, parents
+    level = 1
+    while True:
+        live = ancestor >= 0
+        if not live.any():
+            break
+        if level > max_depth:
+            logger.warning(f"{int(live.sum())} places have more than {max_depth} ancestors; "
+                           f"their parent links contain a cycle and are cut")
+            break
+        descendant, ancestor = descendant[live], ancestor[live]
+        ancestor_parts.append(ancestor)
+        descendant_parts.append(descendant)
+        depth_parts.append(np.full(len(ancestor), level, dtype=np.int64))
+        ancestor = parents[ancestor]
+        level += 1
+
+    ancestor = np.concatenate(ancestor_parts)
+    descendant = np.concatenate(descendant_parts)
+    levels = np.concatenate(depth_parts)
+    # levels are increasing, so a stable sort keeps the shortest path of pairs repeated by a cycle first
+    # (and the depth 0 row of a place in a cycle)
+    order = np.lexsort((descendant, ancestor))
+    ancestor, descendant, levels = ancestor[order], descendant[order], levels[order]
+    keep = np.ones(len(ancestor), dtype=bool)
+    keep[1:] = (ancestor[1:] != ancestor[:-1]) | (descendant[1:] != descendant[:-1])
+    return place_ids[ancestor[keep]], place_ids[descendant[keep]], levels[keep]
+
+
+def iter_rows(ancestor: np.ndarray, descendant: np.ndarray, depth: np.ndarray, batch_size: int) -> Iterator[list[tuple]]:
+    """
+    Yields the pairs of closure as lists of (ancestor_id, descendant_id, depth) tuples.
+    """
+    for start in range(0, len(depth), batch_size):
+        end = start + batch_size
+        yield list(zip(ancestor[start:end].tolist(), descendant[start:end].tolist(), depth[start:end].tolist()))
+
+
+def _columns(columns: Sequence[str]) -> str:
+    return ", ".join(f"p.{column}" for column in columns)
+
+
+def descendants(cursor, place_id: int, columns: Sequence[str], placeholder: str = "%s",
+                max_depth: Optional[int] = None, include_self: bool = False) -> list[tuple]:
+    """
+    Returns the columns of the places under place_id, nearest first, each row followed by its depth
+    below place_id.
+    """
+    sql = (f"SELECT {_columns(columns)}, h.depth FROM place_hierarchy h JOIN places p ON p.place_id = h.descendant_id "
+           f"WHERE h.ancestor_id = {placeholder} AND h.depth >= {placeholder}")
+    params = [place_id, 0 if include_self else 1]
+    if max_depth is not None:
+        sql += f" AND h.depth <= {placeholder}"
+        params.append(max_depth)
+    cursor.execute(f"{sql} ORDER BY h.depth, p.place_id", params)
+    return cursor.fetchall()
+
+
+def ancestors(cursor, place_id: int, columns: Sequence[str], placeholder: str = "%s") -> list[tuple]:
+    """
+    Returns the columns of the places above place_id, from its parent to the root, each row followed
+    by its depth above place_id.
+    """
+    cursor.execute(f"SELECT {_columns(columns)}, h.depth FROM place_hierarchy h JOIN places p ON p.place_id = h.ancestor_id "
+                   f"WHERE h.descendant_id = {placeholder} AND h.depth > 0 ORDER BY h.depth", (place_id,))
+    return cursor.fetchall()
+
+
+def place_depth(cursor, place_id: int, placeholder: str = "%s") -> Optional[int]:
+    """
+    Returns the number of ancestors of place_id (0 for a root), or None if it is not in place_hierarchy.
+    """
+    cursor.execute(f"SELECT MAX(depth) FROM place_hierarchy WHERE descendant_id = {placeholder}", (place_id,))
+    row = cursor.fetchone()
+    return None if row is None or row[0] is None else int(row[0])
+
+
+def subtree_condition(roots: Sequence[tuple[str, int]], placeholder: str = "%s") -> tuple[str, list]:
+    """
+    Returns a WHERE condition on places selecting the subtrees of roots, and its parameters.
+
+    Args:
+        roots (Sequence[tuple[str, int]]): The (source, original_source_id) of the root of each subtree,
+            e.g. ("TGN", 7005560). The roots are included.
+    """
+    terms = " OR ".join([f"(r.source = {placeholder} AND r.original_source_id = {placeholder})"] * len(roots))
+    params = [value for root in roots for value in root]
+    return (f"place_id IN (SELECT h.descendant_id FROM place_hierarchy h "
+            f"JOIN places r ON r.place_id = h.ancestor_id WHERE {terms})"), params
@@ -0,0 +1,229 @@
+"""
+Per-stage timing, throughput and memory metrics for the loaders.
+
+Each loader run records the cumulative time, calls and rows of its stages (parse, transform,
+insert, commit, ...), the latency of every batch commit and the peak RSS. Progress events are
+appended as JSON lines to logs/metrics/<run>.events.jsonl at most every interval seconds, and a
+summary is written to logs/metrics/<run>.json at the end, so runs can be compared.
+"""
+import datetime
+import json
+import logging
+import os
+import resource
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_DIR = "logs/metrics"
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak resident set size of this process and its finished children, in MiB.
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in KiB on Linux
+    return max(own, children) / 1024
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """
+    Nearest-rank percentile of values, or None if empty.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class IngestMetrics:
+    """
+    Collects stage metrics for one loader run. Safe to use from writer threads.
+
+    Args:
+        run_name (str): Name of the run, e.g. "tgn" or "hgis". A timestamp, the pid and a random suffix are
+            appended, so that runs started in the same second do not share their files.
+        metrics_dir (str, optional): Where events and the summary are written. Defaults to DEFAULT_METRICS_DIR.
+        interval (float, optional): Minimum seconds between progress events. Defaults to 10.
+        run_id (str, optional): Use this run id instead of a new one, e.g. to send the events of
+            worker processes to the events file of the parent run.
+    """
+    def __init__(self, run_name: str, metrics_dir: str = DEFAULT_METRICS_DIR, interval: float = 10.0,
+                 run_id: str = None):
+        self.run_id = run_id or (f"{run_name}_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+                                 f"_{os.getpid()}_{secrets.token_hex(3)}")
+        self.metrics_dir = metrics_dir
+        self.interval = interval
+        self.started = time.time()
+        self.stages = {}
+        self.commit_latencies = []
+        self.rows = 0
+        self.peak_rss_mb = 0.0
+        self._last_event = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, rows: int = 0, calls: int = 1) -> None:
+        """
+        Adds time, rows and calls to a stage.
+        """
+        with self._lock:
+            totals = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0, "rows": 0})
+            totals["seconds"] += seconds
+            totals["calls"] += calls
+            totals["rows"] += rows
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0):
+        """
+        Times the enclosed block as one call of the stage.
+
+        Usage:
+            with metrics.stage("insert", rows=len(batch)):
+                db.write_rows(cursor, batch)
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, rows)
+
+    def timed_iter(self, iterable: Iterable, stage: str, size: Callable = None) -> Iterator:
+        """
+        Yields the items of iterable, adding the time spent producing each one to stage.
+
+        Args:
+            iterable (Iterable): The items, e.g. parsed elements, read chunks or row batches.
+            stage (str): The stage to add the time to.
+            size (Callable, optional): Returns the rows of an item (e.g. len for batches). Defaults to one row per item.
+        """
+        iterator = iter(iterable)
+        seconds = 0.0
+        calls = 0
+        rows = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                seconds += time.perf_counter() - start
+                calls += 1
+                rows += size(item) if size else 1
+                # flush in blocks to keep the lock out of the per-item path
+                if calls == 1000:
+                    self.add(stage, seconds, rows=rows, calls=calls)
+                    seconds = 0.0
+                    calls = 0
+                    rows = 0
+                yield item
+        finally:
+            if calls:
+                self.add(stage, seconds, rows=rows, calls=calls)
+
+    @contextmanager
+    def commit(self):
+        """
+        Times a batch commit, recording its latency.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            latency = time.perf_counter() - start
+            self.add("commit", latency)
+            with self._lock:
+                self.commit_latencies.append(latency)
+
+    def add_rows(self, rows: int) -> None:
+        """
+        Counts rows written to the database and emits a progress event if the interval has passed.
+        """
+        with self._lock:
+            self.rows += rows
+            due = time.monotonic() - self._last_event >= self.interval
+            if due:
+                self._last_event = time.monotonic()
+        if due:
+            self.emit("progress")
+
+    def state(self) -> dict:
+        """
+        Returns the raw metrics, for merging the metrics of worker processes with merge().
+        """
+        with self._lock:
+            return {
+                "stages": {name: dict(totals) for name, totals in self.stages.items()},
+                "commit_latencies": list(self.commit_latencies),
+                "rows": self.rows,
+                "peak_rss_mb": max(self.peak_rss_mb, peak_rss_mb()),
+            }
+
+    def merge(self, state: dict) -> None:
+        """
+        Adds the metrics returned by state() of another IngestMetrics.
+        """
+        for name, totals in state["stages"].items():
+            self.add(name, totals["seconds"], totals["rows"], totals["calls"])
+        with self._lock:
+            self.commit_latencies.extend(state["commit_latencies"])
+            self.rows += state["rows"]
+            self.peak_rss_mb = max(self.peak_rss_mb, state["peak_rss_mb"])
+
+    def snapshot(self) -> dict:
+        """
+        Returns the current metrics with derived rates and commit latency percentiles.
+        """
+        state = self.state()
+        elapsed = time.time() - self.started
+        latencies = state["commit_latencies"]
+        stages = state["stages"]
+        for totals in stages.values():
+            totals["rows_per_sec"] = totals["rows"] / totals["seconds"] if totals["seconds"] and totals["rows"] else None
+        return {
+            "run": self.run_id,
+            "elapsed_seconds": elapsed,
+            "rows": state["rows"],
+            "rows_per_sec": state["rows"] / elapsed if elapsed else None,
+            "stages": stages,
+            "commits": {
+                "count": len(latencies),
+                "p50_seconds": percentile(latencies, 50),
+                "p90_seconds": percentile(latencies, 90),
+                "p99_seconds": percentile(latencies, 99),
+                "max_seconds": max(latencies) if latencies else None,
+            },
+            "peak_rss_mb": state["peak_rss_mb"],
+        }
+
+    def emit(self, event: str, **fields) -> dict:
+        """
+        Logs a structured event and appends it to the events file of the run.
+        """
+        record = {"event": event, "time": datetime.datetime.now().isoformat(timespec="seconds"),
+                  **self.snapshot(), **fields}
+        logger.info(json.dumps(record))
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        with open(os.path.join(self.metrics_dir, f"{self.run_id}.events.jsonl"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+        return record
+
+    def write_summary(self, **fields) -> str:
+        """
+        Emits the final event and writes the summary file.
+
+        Returns:
+            str: The path of the summary file.
+        """
+        record = self.emit("summary", **fields)
+        path = os.path.join(self.metrics_dir, f"{self.run_id}.json")
+        with open(path, "w") as f:
+            json.dump(record, f, indent=4)
+        return path
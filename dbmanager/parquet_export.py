@@ -0,0 +1,87 @@
+"""
+Streams the result of a query into a typed, compressed Parquet file, one row group per fetched batch.
+
+Used by the export_filtered_places of the backends to write the training data without
+INTO OUTFILE or holding the result in memory. Coordinates are written as float64, IDs as
+int64 and missing values as Parquet NULLs, so readers get typed columns without parsing.
+"""
+import datetime
+import decimal
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Types of the exported columns of places; other columns are written as strings
+PLACE_SCHEMA = {
+    "place_id": pa.int64(),
+    "original_source_id": pa.int64(),
+    "source": pa.string(),
+    "place_name": pa.string(),
+    "place_type": pa.string(),
+    "latitude": pa.float64(),
+    "longitude": pa.float64(),
+    "parent_id": pa.int64(),
+    "alternate_names": pa.string(),
+    "created_at": pa.timestamp("s"),
+    "updated_at": pa.timestamp("s"),
+    "grid_cell": pa.int64(),
+}
+
+DEFAULT_BATCH_SIZE = 100000
+DEFAULT_COMPRESSION = "zstd"
+
+
+def _column(values: tuple, arrow_type: pa.DataType) -> pa.Array:
+    """
+    Converts the values of one column of a fetched batch to an Arrow array of arrow_type.
+    """
+    if pa.types.is_floating(arrow_type):
+        # MySQL returns DECIMAL columns as decimal.Decimal
+        values = [float(value) if isinstance(value, decimal.Decimal) else value for value in values]
+    elif pa.types.is_timestamp(arrow_type):
+        if any(isinstance(value, str) for value in values):
+            # SQLite returns timestamps as text
+            return pc.strptime(pa.array(values, pa.string()), format="%Y-%m-%d %H:%M:%S", unit="s")
+        values = [value.replace(tzinfo=None) if isinstance(value, datetime.datetime) else value for value in values]
+    return pa.array(values, type=arrow_type)
+
+
+def write_cursor_to_parquet(cursor, output_path: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                            compression: str = DEFAULT_COMPRESSION) -> int:
+    """
+    Writes the rows of an executed query to a Parquet file, fetching batch_size rows at a time.
+
+    The file is written to a temporary path and renamed when complete, so readers never see a partial export.
+
+    Args:
+        cursor: A DB-API cursor with an executed SELECT. Should be unbuffered so rows are streamed from the server.
+        output_path (str): The path of the Parquet file.
+        batch_size (int, optional): Rows fetched and written per row group. Defaults to DEFAULT_BATCH_SIZE.
+        compression (str, optional): Parquet compression codec. Defaults to DEFAULT_COMPRESSION.
+
+    Returns:
+        int: The number of rows written.
+    """
+    columns = [column[0] for column in cursor.description]
+    schema = pa.schema([(column, PLACE_SCHEMA.get(column, pa.string())) for column in columns])
+
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    count = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression=compression) as writer:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                arrays = [_column(values, field.type) for values, field in zip(zip(*rows), schema)]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                count += len(rows)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
@@ -0,0 +1,125 @@
+"""
+Background batch writers fed through a bounded queue, so that parsing and DB writes overlap.
+"""
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+# Seconds between checks for a failed writer while the producer waits on a full queue
+POLL_INTERVAL = 0.5
+
+_STOP = object()
+
+
+class PipelinedWriter:
+    """
+    Writes batches on one or more threads, each with its own DB connection.
+
+    The producer hands batches to submit(), which blocks while queue_depth batches are waiting
+    (backpressure), so at most (queue_depth + threads) batches are held in memory.
+
+    Args:
+        connect (Callable): Returns a new DB connection; called once per writer thread.
+        write (Callable): write(cursor, rows) writes one batch. The writer commits after it.
+        threads (int, optional): Number of writer threads. Defaults to 1.
+        queue_depth (int, optional): Maximum number of batches waiting to be written. Defaults to 4.
+        on_committed (Callable, optional): Called with the state passed to submit() once that batch and
+            every batch submitted before it are committed. Used to advance checkpoints in order.
+        commit (Callable, optional): commit(connection, count) commits a batch of count rows, e.g. to time
+            the commit. Defaults to connection.commit().
+    """
+    def __init__(self, connect: Callable, write: Callable, threads: int = 1, queue_depth: int = 4,
+                 on_committed: Optional[Callable[[Any], None]] = None, commit: Optional[Callable] = None):
+        self.connect = connect
+        self.write = write
+        self.commit = commit or (lambda connection, count: connection.commit())
+        self.on_committed = on_committed
+        self.error: Optional[BaseException] = None
+        self.rows_written = 0
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self._next_sequence = 0
+        self._next_committed = 0
+        self._pending = {}
+        self._threads = [threading.Thread(target=self._run, name=f"batch-writer-{i}", daemon=True) for i in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, rows: list, state: Any = None) -> None:
+        """
+        Queues a batch, waiting while the queue is full. Raises the error of a failed writer.
+        """
+        item = (self._next_sequence, rows, state)
+        self._next_sequence += 1
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def close(self) -> Optional[BaseException]:
+        """
+        Waits for the queued batches to be written and stops the writers.
+
+        Returns:
+            BaseException | None: The first error raised by a writer, if any.
+        """
+        for _ in self._threads:
+            while True:
+                try:
+                    self._queue.put(_STOP, timeout=POLL_INTERVAL)
+                    break
+                except queue.Full:
+                    if not any(thread.is_alive() for thread in self._threads):
+                        break
+        for thread in self._threads:
+            thread.join()
+        return self.error
+
+    def _committed(self, sequence: int, state: Any, rows: int) -> None:
+        with self._lock:
+            self.rows_written += rows
+            self._pending[sequence] = state
+            latest = None
+            advanced = False
+            while self._next_committed in self._pending:
+                latest = self._pending.pop(self._next_committed)
+                self._next_committed += 1
+                advanced = True
+            if advanced and self.on_committed is not None:
+                self.on_committed(latest)
+
+    def _run(self) -> None:
+        connection = None
+        cursor = None
+        try:
+            connection = self.connect()
+            cursor = connection.cursor()
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    return
+                if self.error is not None:
+                    # another writer failed; drain without writing
+                    continue
+                sequence, rows, state = item
+                self.write(cursor, rows)
+                self.commit(connection, len(rows))
+                self._committed(sequence, state, len(rows))
+        except BaseException as e:
+            with self._lock:
+                if self.error is None:
+                    self.error = e
+            # keep draining so the producer and close() never block on a full queue
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+        finally:
+            if cursor is not None:
+                cursor.close()
+            if connection is not None:
+                connection.close()
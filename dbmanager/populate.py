@@ -1,7 +1,17 @@
-import dbmanage as db
-from lxml import etree
+from backend import get_backend
+from shards import Shard, ShardReader, plan_shards
+from tgn_extract import SubjectExtractor, iter_subjects
+from checkpoint import Checkpoint, DEFAULT_CHECKPOINT_DIR
+from frames import iter_row_batches
+from pipeline import PipelinedWriter
+from metrics import IngestMetrics, DEFAULT_METRICS_DIR
+import delta
+from archives import expand_inputs, is_compressed, open_input
+from grid import grid_cell, grid_cells
 from glob import glob
-import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
 import pandas as pd
 
 import logging
@@ -9,155 +19,443 @@ import logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s', filename="logs/populate.log")
 logger = logging.getLogger(__name__)
 
+db = get_backend()
+
+DEFAULT_SHARD_SIZE = 256 * 1024 * 1024
+
+# ID columns read as float64 when they have missing values, written back as integers
+INTEGER_COLUMNS = ("original_source_id", "parent_id", "grid_cell")
+
+
+def grid_cell_column(df: pd.DataFrame) -> pd.arrays.IntegerArray:
+    """
+    The grid cells of the latitude and longitude columns of a frame, with NA where a coordinate is missing.
+    """
+    cells, valid = grid_cells(df["latitude"].to_numpy(dtype=float, na_value=float("nan")),
+                              df["longitude"].to_numpy(dtype=float, na_value=float("nan")))
+    return pd.arrays.IntegerArray(cells, ~valid)
+
+
+def _refresh_hierarchy(metrics: IngestMetrics, load_strategy: str) -> int:
+    """
+    Rebuilds the place_hierarchy closure table after an import, timed as the "hierarchy" stage.
+    """
+    connection = db.get_connection(allow_local_infile=load_strategy == "load_data")
+    try:
+        with metrics.stage("hierarchy"):
+            pairs = db.refresh_hierarchy(connection, load_strategy)
+    finally:
+        connection.close()
+    logger.info(f"Place hierarchy rebuilt: {pairs} ancestor/descendant pairs")
+    return pairs
+
 
 class PopulateTGN:
-    def __init__(self, file_list: list[str], raw_data_path: str = None) -> None:
+    def __init__(self, file_list: list[str], raw_data_path: str = None, workers: int = 1, shard_size: int = DEFAULT_SHARD_SIZE,
+                 load_strategy: str = "executemany", resume: bool = False, upsert: bool = False,
+                 checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR, writer_threads: int = 0, queue_depth: int = 4,
+                 batch_size: int = None, metrics_dir: str = DEFAULT_METRICS_DIR, delta: bool = False,
+                 tombstone: bool = False, refresh_hierarchy: bool = True) -> None:
         """
         Initialize the PopulateTGN class.
 
         Args:
             file_list (list[str]): A list of file paths to process.
             raw_data_path (str, optional): The path to the raw data. Defaults to None.
+            workers (int, optional): Number of worker processes. Defaults to 1 (sequential import).
+            shard_size (int, optional): Files larger than this many bytes are split into shards
+                at <Subject> boundaries when workers > 1. Defaults to DEFAULT_SHARD_SIZE.
+            load_strategy (str, optional): "executemany" or "load_data" (LOAD DATA LOCAL INFILE). Defaults to "executemany".
+            resume (bool, optional): Record a checkpoint after every commit and skip the Subjects already
+                committed by a previous run. Implies upsert. Defaults to False.
+            upsert (bool, optional): Update rows that already exist instead of failing on the unique key. Defaults to False.
+            checkpoint_dir (str, optional): Where checkpoint files are kept. Defaults to DEFAULT_CHECKPOINT_DIR.
+            writer_threads (int, optional): If > 0, batches are written by this many background threads, each
+                with its own connection, while parsing continues. Defaults to 0 (parse and write alternately).
+            queue_depth (int, optional): Maximum number of parsed batches waiting for a writer thread. Parsing
+                blocks when the queue is full. Defaults to 4.
+            batch_size (int, optional): Rows per batch. Defaults to db.BATCH_SIZES[load_strategy].
+            metrics_dir (str, optional): Where stage metrics, progress events and the run summary are written.
+                Defaults to DEFAULT_METRICS_DIR.
+            delta (bool, optional): Compare the content hash of every extracted row with the one stored in
+                place_hashes by the previous import and upsert only new or changed rows. Defaults to False.
+            tombstone (bool, optional): With delta, delete the TGN places missing from this release and mark
+                their hashes as deleted. The file list must be the complete release. Defaults to False.
+            refresh_hierarchy (bool, optional): Rebuild the place_hierarchy closure table after the import. Defaults to True.
         """
+        if tombstone and not delta:
+            raise ValueError("tombstone requires delta")
+        if tombstone and resume:
+            raise ValueError("tombstone cannot be combined with resume: Subjects skipped on resume would be tombstoned")
         self.file_list = file_list
         self.raw_data_path = raw_data_path
+        self.workers = workers
+        self.shard_size = shard_size
+        self.load_strategy = load_strategy
+        self.resume = resume
+        self.upsert = upsert or resume or delta
+        self.delta = delta
+        self.tombstone = tombstone
+        self.refresh_hierarchy = refresh_hierarchy
+        self.delta_seen = set()
+        self.checkpoint_dir = checkpoint_dir
+        self.writer_threads = writer_threads
+        self.queue_depth = queue_depth
+        self.batch_size = batch_size or db.BATCH_SIZES[load_strategy]
+        self.metrics_dir = metrics_dir
+        self.metrics = IngestMetrics("tgn", metrics_dir)
         
-    def process_file(self, file_path: str) -> None:
+    def process_file(self, file_path: str) -> tuple[int, int, int]:
         """
-        Process a single file.
+        Process a single file. Gzip files (.xml.gz) and zip members (archive.zip::member.xml)
+        are decompressed while parsing.
 
         Args:
             file_path (str): The path to the file to process.
+            
+        Returns:
+            tuple[int, int, int]: Subjects processed, successful insertions and errors.
         """
-        # Initialize DB connection
-        connection = db.connect_to_db()
-        cursor = connection.cursor()
+        with open_input(file_path) as source:
+            return self._ingest(source, file_path)
+    
+    def process_shard(self, shard: Shard) -> tuple[int, int, int]:
+        """
+        Process a byte-range shard of a file.
+
+        Args:
+            shard (Shard): The shard to process.
+            
+        Returns:
+            tuple[int, int, int]: Subjects processed, successful insertions and errors.
+        """
+        reader = ShardReader(shard)
+        try:
+            return self._ingest(reader, str(shard))
+        finally:
+            reader.close()
+        
+    def _ingest(self, source, label: str) -> tuple[int, int, int]:
+        """
+        Parse, transform and insert the Subjects read from source.
+
+        Args:
+            source: A file path or a binary file-like object with the XML.
+            label (str): Name of the source used in progress messages. Also the key of its checkpoint.
+        """
+        checkpoint = Checkpoint(label, self.checkpoint_dir) if self.resume else None
+        state = checkpoint.load() if checkpoint else None
+        if state and state.get("complete"):
+            print(f"Skipping {label}: already imported according to {checkpoint.path}")
+            return 0, 0, 0
+        skip = state["subjects_committed"] if state else 0
+        allow_local_infile = self.load_strategy == "load_data"
+        metrics = self.metrics
+        index = self._delta_index() if self.delta else None
+        
+        def write(cursor, rows):
+            with metrics.stage("insert", rows=len(rows)):
+                db.write_rows(cursor, rows, self.load_strategy, upsert=self.upsert)
+                if index is not None:
+                    db.write_rows(cursor, delta.hash_rows(rows), self.load_strategy, "place_hashes", db.HASH_COLUMNS,
+                                  upsert=True)
+        
+        def commit(connection, rows):
+            with metrics.commit():
+                connection.commit()
+            metrics.add_rows(rows)
+        
+        def save_checkpoint(progress, complete=False):
+            checkpoint.save(subjects_committed=progress[0], last_subject_id=progress[1], complete=complete)
+        
+        # Initialize DB connection, or the writer threads and their connections
+        writer = None
+        connection = None
+        cursor = None
+        if self.writer_threads > 0:
+            writer = PipelinedWriter(
+                lambda: db.get_connection(allow_local_infile=allow_local_infile),
+                write,
+                threads=self.writer_threads,
+                queue_depth=self.queue_depth,
+                on_committed=save_checkpoint if checkpoint else None,
+                commit=commit
+            )
+        else:
+            connection = db.get_connection(allow_local_infile=allow_local_infile)
+            cursor = connection.cursor()
         
         try:
-            # Parse with namespace awareness
-            context = etree.iterparse(file_path, events=('end',), recover=True)
-            
-            print(f"Processing {file_path}")
-            batch_size = 1000
+            print(f"Processing {label}")
+            batch_size = self.batch_size
             current_batch = []
-            
-            # Get the namespace from the first element
-            for event, elem in context:
-                namespace = elem.nsmap.get(None)
-                if namespace:
-                    print(f"Found namespace: {namespace}")
-                    break
-            
-            def safe_find_text(element, path, ns):
-                try:
-                    ns_path = '/'.join('{' + ns + '}' + part for part in path.split('/'))
-                    result = element.find('.//' + ns_path)
-                    return result.text if result is not None else None
-                except:
-                    return None
+            extractor = None
             
             count = 0
             success_count = 0
             error_count = 0
+            unchanged_count = 0
+            done = skip
+            last_subject_id = state["last_subject_id"] if state else None
+            
+            if skip:
+                print(f"Resuming {label} after Subject {last_subject_id} ({skip} Subjects already committed)")
             
-            for event, elem in context:
+            transform_seconds = 0.0
+            transform_calls = 0
+            for elem in metrics.timed_iter(iter_subjects(source), "parse"):
+                count += 1
+                if count <= skip:
+                    if count == skip and elem.get('Subject_ID') != last_subject_id:
+                        raise ValueError(f"Checkpoint {checkpoint.path} does not match {label}: "
+                                         f"expected Subject {last_subject_id} at position {skip}, found {elem.get('Subject_ID')}")
+                    continue
+                
                 try:
-                    tag = etree.QName(elem).localname
+                    if extractor is None:
+                        extractor = SubjectExtractor.for_element(elem)
+                        print(f"Found namespace: {extractor.namespace}")
                     
-                    if tag == "Subject":
-                        count += 1
-                        
-                        # Get Place ID (Subject ID)
-                        original_source_id = int(elem.get('Subject_ID'))
-                        
-                        # Get preferred name from Preferred_Term using namespace
-                        preferred_term = elem.find('.//{' + namespace + '}Terms/{' + namespace + '}Preferred_Term/{' + namespace + '}Term_Text')
-                        place_name = preferred_term.text if preferred_term is not None else None
-                        
-                        # Get coordinates
-                        latitude = float(safe_find_text(elem, 'Coordinates/Standard/Latitude/Decimal', namespace)) if safe_find_text(elem, 'Coordinates/Standard/Latitude/Decimal', namespace) else None
-                        longitude = float(safe_find_text(elem, 'Coordinates/Standard/Longitude/Decimal', namespace)) if safe_find_text(elem, 'Coordinates/Standard/Longitude/Decimal', namespace) else None
-                        
-                        # Get place type
-                        place_type_elem = elem.find('.//{' + namespace + '}Place_Types/{' + namespace + '}Preferred_Place_Type/{' + namespace + '}Place_Type_ID')
-                        place_type = place_type_elem.text if place_type_elem is not None else None
-                        place_type = place_type.split('/')[1] if place_type and '/' in place_type else place_type
-                        
-                        # Get parent ID
-                        parent_elem = elem.find('.//{' + namespace + '}Parent_Relationships/{' + namespace + '}Preferred_Parent/{' + namespace + '}Parent_Subject_ID')
-                        parent_id = int(parent_elem.text) if parent_elem is not None and parent_elem.text else None
-                        
-                        # Get non-preferred terms (alternate names)
-                        alternate_names = []
-                        for term in elem.findall('.//{' + namespace + '}Terms/{' + namespace + '}Non-Preferred_Term/{' + namespace + '}Term_Text'):
-                            if term.text:
-                                # clean text before adding to list
-                                cleaned_term = term.text.replace('\\', '\\\\')
-                                alternate_names.append(cleaned_term.strip())
-                        
-                        if original_source_id and place_name:
-                            current_batch.append((
-                                original_source_id,
-                                "TGN",
-                                place_name,
-                                place_type,
-                                latitude,
-                                longitude,
-                                parent_id,
-                                "|".join(alternate_names) if alternate_names else None
-                            ))
-                            success_count += 1
-                        
-                        # Process batch when it reaches batch_size
-                        if len(current_batch) >= batch_size:
-                            db.insert_data(cursor, current_batch)
-                            connection.commit()
+                    started = time.perf_counter()
+                    row = extractor.extract(elem)
+                    if row is not None:
+                        row += (grid_cell(row[4], row[5]),)
+                    if row is not None and index is not None and not index.changed(row):
+                        unchanged_count += 1
+                        row = None
+                    transform_seconds += time.perf_counter() - started
+                    transform_calls += 1
+                    if row is not None:
+                        current_batch.append(row)
+                        success_count += 1
+                    
+                    done = count
+                    last_subject_id = elem.get('Subject_ID')
+                    
+                    # Process batch when it reaches batch_size
+                    if len(current_batch) >= batch_size:
+                        metrics.add("transform", transform_seconds, rows=transform_calls, calls=transform_calls)
+                        transform_seconds = 0.0
+                        transform_calls = 0
+                        if writer:
+                            writer.submit(current_batch, (done, last_subject_id))
+                            print(f"Queued batch of {batch_size} records. Total processed: {count}")
+                        else:
+                            write(cursor, current_batch)
+                            commit(connection, len(current_batch))
+                            if checkpoint:
+                                save_checkpoint((done, last_subject_id))
                             print(f"Committed batch of {batch_size} records. Total processed: {count}")
-                            current_batch = []
-                        
-                        # Show progress
-                        if count % 1000 == 0:
-                            print(f"Processed {count} subjects. Successes: {success_count}, Errors: {error_count}")
-                        
-                        # Memory management (existing code)
-                        elem.clear()
-                        while elem.getprevious() is not None:
-                            del elem.getparent()[0]
+                        current_batch = []
+                    
+                    # Show progress
+                    if count % 1000 == 0:
+                        print(f"Processed {count} subjects. Successes: {success_count}, Errors: {error_count}")
                             
                 except Exception as e:
                     error_count += 1
                     print(f"Error processing record {count}: {str(e)}")
                     break
             
+            metrics.add("transform", transform_seconds, rows=transform_calls, calls=transform_calls)
+            
             # Insert any remaining records
-            if current_batch:
-                db.insert_data(cursor, current_batch)
-                connection.commit()
+            writer_error = None
+            if writer:
+                try:
+                    if current_batch:
+                        writer.submit(current_batch, (done, last_subject_id))
+                except Exception:
+                    pass
+                writer_error = writer.close()
+                writer = None
+                if writer_error is not None:
+                    print(f"Error writing batches: {str(writer_error)}")
+                    if error_count == 0:
+                        error_count += 1
+            elif current_batch:
+                write(cursor, current_batch)
+                commit(connection, len(current_batch))
+            # A failed writer has already advanced the checkpoint to its last committed batch
+            if checkpoint and writer_error is None:
+                save_checkpoint((done, last_subject_id), complete=error_count == 0)
                 
-            print(f"\nProcess complete!")
+            print(f"\nProcess complete for {label}!")
             print(f"Total processed: {count}")
             print(f"Successful insertions: {success_count}")
+            if index is not None:
+                print(f"Unchanged since the last import: {unchanged_count}")
             print(f"Errors: {error_count}")
+            
+            return count, success_count, error_count
                 
         except Exception as e:
-            print(f"Fatal error processing file: {str(e)}")
+            print(f"Fatal error processing {label}: {str(e)}")
             raise
         
         finally:
-            db.close_db(cursor, connection)
+            if writer:
+                writer.close()
+            if connection:
+                db.close_db(cursor, connection)
 
 
-    def populate_db(self):
+    def populate_db(self) -> tuple[int, int, int]:
         """
         Populate the database with the data from the files.
+        
+        With workers > 1 the files, and the shards of files larger than shard_size,
+        are processed in a pool of worker processes, each one with its own DB connection.
+        Zip archives in the file list are expanded to their .xml members. Compressed inputs
+        are read as a stream and never split into shards.
+        
+        Returns:
+            tuple[int, int, int]: Aggregated Subjects processed, successful insertions and errors.
+        """
+        file_paths = [f"{self.raw_data_path if self.raw_data_path else ''}{file}" for file in self.file_list]
+        file_paths = expand_inputs(file_paths, "*.xml")
+        totals = [0, 0, 0]
+        if self.delta:
+            # load the stored hashes once, before forking the workers
+            delta.clear_indexes()
+            index = self._delta_index()
+            logger.info(f"Delta import: {len(index.hashes)} TGN hashes loaded")
+        
+        if self.workers <= 1:
+            for file_path in file_paths:
+                for i, value in enumerate(self.process_file(file_path)):
+                    totals[i] += value
+        else:
+            tasks = []
+            for file_path in file_paths:
+                if not is_compressed(file_path) and os.path.getsize(file_path) > self.shard_size:
+                    tasks.extend(plan_shards(file_path, self.shard_size))
+                else:
+                    tasks.append(file_path)
+            
+            logger.info(f"Processing {len(tasks)} tasks from {len(file_paths)} files with {self.workers} workers")
+            
+            failed = 0
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(_ingest_task, task, self._worker_options(), self.metrics.run_id): task
+                           for task in tasks}
+                for future in as_completed(futures):
+                    task = futures[future]
+                    try:
+                        stats, metrics_state, seen = future.result()
+                    except Exception as e:
+                        failed += 1
+                        totals[2] += 1
+                        logger.error(f"Task {task} failed: {str(e)}")
+                        continue
+                    for i, value in enumerate(stats):
+                        totals[i] += value
+                    self.metrics.merge(metrics_state)
+                    self.delta_seen.update(seen)
+                    logger.info(f"Task {task} finished: processed {stats[0]}, inserted {stats[1]}, errors {stats[2]}")
+            
+            if failed:
+                logger.error(f"{failed} of {len(tasks)} tasks failed")
+        
+        logger.info(f"TGN import complete - processed: {totals[0]}, inserted: {totals[1]}, errors: {totals[2]}")
+        if self.tombstone:
+            self._tombstone_missing(totals[2])
+        if self.refresh_hierarchy:
+            _refresh_hierarchy(self.metrics, self.load_strategy)
+        summary_path = self.metrics.write_summary(processed=totals[0], inserted=totals[1], errors=totals[2])
+        logger.info(f"Metrics summary written to {summary_path}")
+        print(f"Total processed: {totals[0]}")
+        print(f"Successful insertions: {totals[1]}")
+        print(f"Errors: {totals[2]}")
+        
+        return tuple(totals)
+    
+    def _worker_options(self) -> dict:
+        """
+        Options passed to the PopulateTGN instances created in worker processes.
+        """
+        return {
+            "load_strategy": self.load_strategy,
+            "resume": self.resume,
+            "upsert": self.upsert,
+            "checkpoint_dir": self.checkpoint_dir,
+            "writer_threads": self.writer_threads,
+            "queue_depth": self.queue_depth,
+            "batch_size": self.batch_size,
+            "metrics_dir": self.metrics_dir,
+            "delta": self.delta,
+        }
+    
+    def _delta_index(self) -> delta.DeltaIndex:
+        """
+        The stored TGN hashes, loaded once per process. Records the ids seen in self.delta_seen.
+        """
+        def load_hashes(source):
+            with db.session() as cursor:
+                return list(db.load_hashes(cursor, source))
+        index = delta.get_index("TGN", load_hashes)
+        index.seen = self.delta_seen
+        return index
+    
+    def _tombstone_missing(self, errors: int) -> None:
+        """
+        Deletes the TGN places that were not in this release. Skipped if the import had errors,
+        since the Subjects after a failure were never seen.
         """
-        for file in self.file_list:
-            self.process_file(f"{self.raw_data_path if self.raw_data_path else ''}{file}")
+        if errors:
+            logger.warning(f"Not tombstoning missing TGN places: the import had {errors} errors")
+            return
+        missing = self._delta_index().missing(self.delta_seen)
+        with db.session() as cursor:
+            deleted = db.tombstone_places(cursor, "TGN", missing)
+        logger.info(f"Tombstoned {len(missing)} TGN places missing from this release ({deleted} deleted)")
+        print(f"Tombstoned: {len(missing)}")
+
+
+def _ingest_task(task: str | Shard, options: dict, run_id: str) -> tuple[tuple[int, int, int], dict, set]:
+    """
+    Worker entry point for parallel TGN imports. Runs in a separate process.
+    
+    Progress events go to the events file of the parent run; the stage metrics and, for delta
+    imports, the ids seen are returned for the parent to merge.
+    """
+    populate = PopulateTGN([], **options)
+    populate.metrics = IngestMetrics("tgn", populate.metrics_dir, run_id=run_id)
+    if isinstance(task, Shard):
+        stats = populate.process_shard(task)
+    else:
+        stats = populate.process_file(task)
+    return stats, populate.metrics.state(), populate.delta_seen
 
 
 class PopulateHGIS:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, load_strategy: str = "executemany", resume: bool = False, upsert: bool = False,
+                 checkpoint_dir: str = DEFAULT_CHECKPOINT_DIR, chunksize: int = None, metrics_dir: str = DEFAULT_METRICS_DIR,
+                 refresh_hierarchy: bool = True):
+        """
+        Initialize the PopulateHGIS class.
+
+        Args:
+            file_path (str): The path to the HGIS csv file. May be gzipped (.csv.gz) or a zip member (archive.zip::member.csv).
+            load_strategy (str, optional): "executemany" or "load_data" (LOAD DATA LOCAL INFILE). Defaults to "executemany".
+            resume (bool, optional): Record a checkpoint after every commit and skip the work already
+                committed by a previous run. Implies upsert. Defaults to False.
+            upsert (bool, optional): Update rows that already exist instead of failing on the unique key. Defaults to False.
+            checkpoint_dir (str, optional): Where checkpoint files are kept. Defaults to DEFAULT_CHECKPOINT_DIR.
+            chunksize (int, optional): If set, the file is read, transformed and inserted this many rows at a time,
+                keeping memory flat regardless of the file size. Defaults to None (whole file at once).
+            metrics_dir (str, optional): Where stage metrics, progress events and the run summary are written.
+                Defaults to DEFAULT_METRICS_DIR.
+            refresh_hierarchy (bool, optional): Rebuild the place_hierarchy closure table after the import. Defaults to True.
+        """
         self.file_path = file_path
+        self.refresh_hierarchy = refresh_hierarchy
+        self.metrics = IngestMetrics("hgis", metrics_dir)
+        self.chunksize = chunksize
+        self.load_strategy = load_strategy
+        self.resume = resume
+        self.upsert = upsert or resume
+        self.checkpoint_dir = checkpoint_dir
         self.cert_map = {
                             "Exacta": 100,
                             "Buena": 85,
@@ -176,7 +474,7 @@ class PopulateHGIS:
         
         logger.info(f"Found {len(dataframe[dataframe.duplicated(subset=['original_source_id', 'source'], keep=False)])} duplicate rows.")
         
-        deduplicated = dataframe.sort_values(by="certainty_score", ascending=False) \
+        deduplicated = dataframe.sort_values(by="certainty_score", ascending=False, kind="stable") \
                                .drop_duplicates(subset=["original_source_id", "source"], keep="first")
     
         logger.info(f"Deduplicated DataFrame shape: {deduplicated.shape}")
@@ -202,47 +500,55 @@ class PopulateHGIS:
         dataframe["place_type"] = dataframe["place_type"].map(TRANSLATION_MAPPING)
         return dataframe
         
+    def prepare_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rename, score and convert the columns of raw HGIS rows. Duplicates are kept.
+        """
+        df = df.rename(columns={
+                "gz_id": "original_source_id",
+                "label": "place_name",
+                "categoria": "place_type",
+                "lat": "latitude",
+                "lon": "longitude",
+                "es_parte_de": "parent_id",
+                "variantes": "alternate_names"
+            })
+        
+        df["certainty_score"] = df["cert"].map(self.cert_map)
+        
+        df["source"] = "HGIS"
+        
+        df["place_name"] = df["place_name"].fillna('[Unnamed Place]')
+        
+        numeric_columns = ["latitude", "longitude", "original_source_id", "parent_id"]
+        for col in numeric_columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        
+        df["grid_cell"] = grid_cell_column(df)
+        
+        columns = ["original_source_id", "source", "place_name", "place_type", 
+                    "latitude", "longitude", "parent_id", "alternate_names", "grid_cell", "certainty_score"]
+        
+        return df[columns]
+        
     def process_file(self) -> pd.DataFrame:
         try:
-            df = pd.read_csv(self.file_path)
+            with self.metrics.stage("read"), open_input(self.file_path) as f:
+                df = pd.read_csv(f)
             
             logger.info(f"Original DataFrame shape: {df.shape}")
             logger.info(f"Original columns: {df.columns.tolist()}")
             
-            df = df.rename(columns={
-                    "gz_id": "original_source_id",
-                    "label": "place_name",
-                    "categoria": "place_type",
-                    "lat": "latitude",
-                    "lon": "longitude",
-                    "es_parte_de": "parent_id",
-                    "variantes": "alternate_names"
-                })
-            
-            df["certainty_score"] = df["cert"].map(self.cert_map)
-            
-            df["source"] = "HGIS"
-            
-            df["place_name"] = df["place_name"].fillna('[Unnamed Place]')
-            
-            numeric_columns = ["latitude", "longitude", "original_source_id", "parent_id"]
-            for col in numeric_columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
+            with self.metrics.stage("transform", rows=len(df)):
+                df = self.prepare_frame(df)
                 
-            df = df.replace({pd.NA: None, pd.NaT: None, np.nan: None})
-            
-            columns = ["original_source_id", "source", "place_name", "place_type", 
-                        "latitude", "longitude", "parent_id", "alternate_names", "certainty_score"]
-            
-            df = df[columns]
-            
-            # Resolve duplicates
-            df = self.resolve_duplicates(df)
-            
-            df.drop(columns=["certainty_score"], inplace=True)
-            
-            # Translate place types
-            df = self.translate_place_types(df)
+                # Resolve duplicates
+                df = self.resolve_duplicates(df)
+                
+                df.drop(columns=["certainty_score"], inplace=True)
+                
+                # Translate place types
+                df = self.translate_place_types(df)
             
             logger.info(f"Processed file: {self.file_path}")
             logger.info(f"DataFrame shape: {df.shape}")
@@ -253,23 +559,129 @@ class PopulateHGIS:
         except Exception as e:
             logger.error(f"Error processing file: {str(e)}")
             raise
+    
+    def iter_chunks(self):
+        """
+        Read, score, deduplicate and translate the file chunksize rows at a time.
+        
+        Duplicates across chunks are resolved with an index of the best certainty score
+        seen for each (original_source_id, source). A row is kept if it is the first of its
+        key or beats the score of the row kept before, in which case it must replace it.
+        
+        Yields:
+            tuple[pd.DataFrame, int]: The rows to write and how many of them replace rows of earlier chunks.
+        """
+        best_scores = {}
+        
+        with open_input(self.file_path) as f:
+            chunks = self.metrics.timed_iter(pd.read_csv(f, chunksize=self.chunksize), "read", size=len)
+            for i, chunk in enumerate(chunks):
+                started = time.perf_counter()
+                df = self.resolve_duplicates(self.prepare_frame(chunk))
+                
+                keep = []
+                replaces = 0
+                ids = [None if pd.isna(value) else value for value in df["original_source_id"].tolist()]
+                keys = zip(ids, df["source"].tolist())
+                scores = df["certainty_score"].tolist()
+                for key, score in zip(keys, scores):
+                    score = -1 if pd.isna(score) else score
+                    previous = best_scores.get(key)
+                    if previous is None or score > previous:
+                        if previous is not None:
+                            replaces += 1
+                        best_scores[key] = score
+                        keep.append(True)
+                    else:
+                        keep.append(False)
+                
+                df = df[keep].drop(columns=["certainty_score"])
+                df = self.translate_place_types(df)
+                self.metrics.add("transform", time.perf_counter() - started, rows=len(chunk))
+                
+                logger.info(f"Chunk {i + 1}: {len(chunk)} rows read, {len(df)} to write, {replaces} replacing earlier chunks, "
+                            f"{len(best_scores)} keys indexed")
+                
+                yield df, replaces
+    
+    def _populate_streaming(self, cursor, connection, checkpoint: Checkpoint = None, state: dict = None) -> int:
+        """
+        Insert the file chunk by chunk. Chunks committed by a previous run are still read
+        to rebuild the duplicate index, but not written again.
+        """
+        start = state.get("chunks_committed", 0) if state else 0
+        if start:
+            logger.info(f"Resuming {self.file_path} after {start} committed chunks")
+        
+        batch_size = db.BATCH_SIZES[self.load_strategy]
+        total = 0
+        committed = start
+        for i, (df, replaces) in enumerate(self.iter_chunks()):
+            if i < start:
+                continue
+            rows = []
+            try:
+                batches = iter_row_batches(df, batch_size=batch_size, integer_columns=INTEGER_COLUMNS)
+                for rows in self.metrics.timed_iter(batches, "convert", size=len):
+                    with self.metrics.stage("insert", rows=len(rows)):
+                        db.write_rows(cursor, rows, self.load_strategy, upsert=self.upsert or replaces > 0)
+                with self.metrics.commit():
+                    connection.commit()
+                self.metrics.add_rows(len(df))
+                committed = i + 1
+                if checkpoint:
+                    checkpoint.save(chunks_committed=committed, complete=False)
+                total += len(df)
+                logger.info(f"Inserted chunk {i + 1} ({len(df)} rows)")
+            except Exception as e:
+                logger.error(f"Error in chunk {i + 1}: {str(e)}")
+                logger.error(f"Problem row sample: {rows[0] if rows else 'No data'}")
+                raise
+        
+        if checkpoint:
+            checkpoint.save(chunks_committed=committed, complete=True)
+        return total
 
     def populate_db(self) -> None:
-        connection = db.connect_to_db()
+        connection = db.get_connection(allow_local_infile=self.load_strategy == "load_data")
         cursor = connection.cursor()
         
         try:
+            checkpoint = Checkpoint(self.file_path, self.checkpoint_dir) if self.resume else None
+            state = checkpoint.load() if checkpoint else None
+            if state and state.get("complete"):
+                logger.info(f"Skipping {self.file_path}: already imported according to {checkpoint.path}")
+                return
+            
+            if self.chunksize:
+                total = self._populate_streaming(cursor, connection, checkpoint, state)
+                logger.info("Data insertion completed successfully.")
+                logger.info(f"Total records inserted: {total}")
+                if self.refresh_hierarchy:
+                    _refresh_hierarchy(self.metrics, self.load_strategy)
+                self.metrics.write_summary(inserted=total)
+                return
+            
             df = self.process_file()
             
-            batch_size = 1000
+            start = state.get("rows_committed", 0) if state else 0
+            if start:
+                logger.info(f"Resuming {self.file_path} after {start} committed rows")
+            
+            batch_size = db.BATCH_SIZES[self.load_strategy]
             total_batches = len(df) // batch_size + (1 if len(df) % batch_size else 0)
             
-            for i in range(0, len(df), batch_size):
+            batches = iter_row_batches(df, batch_size=batch_size, start=start, integer_columns=INTEGER_COLUMNS)
+            for i, batch in zip(range(start, len(df), batch_size), self.metrics.timed_iter(batches, "convert", size=len)):
                 try:
-                    batch = df.iloc[i:i+batch_size].values.tolist()
                     if batch:
-                        db.insert_data(cursor, batch)
-                        connection.commit()
+                        with self.metrics.stage("insert", rows=len(batch)):
+                            db.write_rows(cursor, batch, self.load_strategy, upsert=self.upsert)
+                        with self.metrics.commit():
+                            connection.commit()
+                        self.metrics.add_rows(len(batch))
+                        if checkpoint:
+                            checkpoint.save(rows_committed=i + len(batch), complete=i + len(batch) >= len(df))
                         
                     logger.info(f"Inserted batch {i//batch_size + 1} of {total_batches}")
                     
@@ -280,6 +692,9 @@ class PopulateHGIS:
                 
             logger.info("Data insertion completed successfully.")
             logger.info(f"Total records inserted: {len(df)}")
+            if self.refresh_hierarchy:
+                _refresh_hierarchy(self.metrics, self.load_strategy)
+            self.metrics.write_summary(inserted=len(df) - start)
             
         except Exception as e:
             logger.error(f"Error inserting data: {str(e)}")
@@ -295,45 +710,64 @@ class Reimporter:
     Only use this if you are sure you want to delete all existing data in the database.
     
     Parameters:
-        csv_file (str): The path to the csv file to import.
+        csv_file (str): The path to the csv file to import. May be gzipped (.csv.gz) or a zip member (archive.zip::member.csv).
         table_name (str): The name of the table to import the data into.
         source (str, optional): The source of the data (e.g. "TGN" or "HGIS"). Defaults to None. If None, the source will not be filtered and all data will be deleted.
+        load_strategy (str, optional): "executemany" or "load_data" (LOAD DATA LOCAL INFILE). Defaults to "executemany".
+        mode (str, optional): "delete" deletes the existing rows and inserts the new ones in place; the table is
+            partially empty during the reload. "swap" loads into a staging table, builds its indexes after the load
+            and swaps it in atomically, so readers see either the old or the new data. With a source, the staging
+            table starts as a copy of the other sources' rows (merged swap). Defaults to "delete".
+        metrics_dir (str, optional): Where stage metrics, progress events and the run summary are written.
+            Defaults to DEFAULT_METRICS_DIR.
+        refresh_hierarchy (bool, optional): Rebuild the place_hierarchy closure table after reimporting places.
+            Defaults to True.
     """
-    def __init__(self, csv_file: str, table_name: str, source: str = None):
+    def __init__(self, csv_file: str, table_name: str, source: str = None, load_strategy: str = "executemany",
+                 mode: str = "delete", metrics_dir: str = DEFAULT_METRICS_DIR, refresh_hierarchy: bool = True):
+        if mode not in {"delete", "swap"}:
+            raise ValueError(f"Unsupported reimport mode: {mode}")
         self.csv_file = csv_file
         self.table_name = table_name
         self.source = source
-        self.connection = db.connect_to_db()
-        self.cursor = self.connection.cursor()
+        self.load_strategy = load_strategy
+        self.mode = mode
+        self.refresh_hierarchy = refresh_hierarchy
+        self.metrics = IngestMetrics("reimport", metrics_dir)
+        self.connection = None
+        self.cursor = None
 
 
     def prepare_csv(self):
         """
         Prepares the csv file for import.
         """
-        df = pd.read_csv(
-            self.csv_file,
-            escapechar="\\",
-            encoding="utf-8",
-            na_values=["\\", "N", "NULL", "", "nan", "\\N"],  
-            keep_default_na=True, 
-            low_memory=False,
-        )
+        with self.metrics.stage("read"), open_input(self.csv_file) as f:
+            df = pd.read_csv(
+                f,
+                escapechar="\\",
+                encoding="utf-8",
+                na_values=["\\", "N", "NULL", "", "nan", "\\N"],  
+                keep_default_na=True, 
+                low_memory=False,
+            )
         
         logger.info(f"Columns in DataFrame: {df.columns.tolist()}")
         logger.info(f"DataFrame shape: {df.shape}")
         
-        df['place_name'] = df['place_name'].fillna('[Unnamed Place]')
-        
-        if "alternate_names" in df.columns:
-            df["alternate_names"] = df["alternate_names"].str.replace(r'\\', '', regex=True)
-        
-        numeric_columns = ["latitude", "longitude", "original_source_id", "parent_id"]
-        for col in numeric_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-                
-        df = df.replace({pd.NA: None, pd.NaT: None, np.nan: None})
+        with self.metrics.stage("transform", rows=len(df)):
+            df['place_name'] = df['place_name'].fillna('[Unnamed Place]')
+            
+            if "alternate_names" in df.columns:
+                df["alternate_names"] = df["alternate_names"].str.replace(r'\\', '', regex=True)
+            
+            numeric_columns = ["latitude", "longitude", "original_source_id", "parent_id"]
+            for col in numeric_columns:
+                if col in df.columns:
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
+            
+            if "grid_cell" not in df.columns:
+                df["grid_cell"] = grid_cell_column(df)
         
         logger.info(f"Sample of prepared data:\n{df.head()}")
         
@@ -346,47 +780,68 @@ class Reimporter:
             warning = input("This will delete all existing data in the database. Are you sure? (y/n) ")
             
             if warning.lower() in {"y", "yes"}:
-                logger.info("Deleting all existing data in the database.")
+                self.connection = db.get_connection(allow_local_infile=self.load_strategy == "load_data")
+                self.cursor = self.connection.cursor()
                 
-                if self.source:
-                    self.cursor.execute(f"DELETE FROM {self.table_name} WHERE source = '{self.source}'")
+                if self.mode == "swap":
+                    target_table = f"{self.table_name}_staging"
+                    logger.info(f"Creating staging table {target_table}")
+                    with self.metrics.stage("staging"):
+                        db.create_staging_table(self.cursor, self.table_name, target_table, exclude_source=self.source)
                 else:
-                    self.cursor.execute(f"DELETE FROM {self.table_name}")
+                    target_table = self.table_name
+                    logger.info("Deleting all existing data in the database.")
+                    
+                    with self.metrics.stage("delete"):
+                        if self.source:
+                            self.cursor.execute(f"DELETE FROM {self.table_name} WHERE source = '{self.source}'")
+                        else:
+                            self.cursor.execute(f"DELETE FROM {self.table_name}")
                 self.connection.commit()
                 
                 expected_columns = [
                     'place_name', 'place_type', 'latitude', 'longitude', 
                     'parent_id', 'alternate_names', 'created_at', 'updated_at',
-                    'original_source_id', 'source'
+                    'original_source_id', 'source', 'grid_cell'
                 ]
                 
                 df = df[expected_columns]
                 
                 logger.info(f"Inserting new data from {self.csv_file}")
                 
-                values = df.values.tolist()
-                
                 columns = df.columns.tolist()
                 placeholders = ', '.join(['%s'] * len(columns))
-                sql = f"INSERT INTO {self.table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+                sql = f"INSERT INTO {target_table} ({', '.join(columns)}) VALUES ({placeholders})"
                 
+                logger.info(f"Load strategy: {self.load_strategy}")
                 logger.info(f"SQL Statement: {sql}")
                 logger.info(f"Number of columns in SQL: {len(columns)}")
-                logger.info(f"Sample row length: {len(values[0]) if values else 0}")
                 
-                batch_size = 1000
-                for i in range(0, len(values), batch_size):
-                    batch = values[i:i + batch_size]
+                batch_size = db.BATCH_SIZES[self.load_strategy]
+                batches = iter_row_batches(df, batch_size=batch_size, integer_columns=INTEGER_COLUMNS)
+                for i, batch in zip(range(0, len(df), batch_size), self.metrics.timed_iter(batches, "convert", size=len)):
                     try:
-                        self.cursor.executemany(sql, batch)
-                        self.connection.commit()
-                        logger.info(f"Inserted batch {i//batch_size + 1} of {len(values)//batch_size + 1}")
+                        with self.metrics.stage("insert", rows=len(batch)):
+                            db.write_rows(self.cursor, batch, self.load_strategy, target_table, columns)
+                        with self.metrics.commit():
+                            self.connection.commit()
+                        self.metrics.add_rows(len(batch))
+                        logger.info(f"Inserted batch {i//batch_size + 1} of {len(df)//batch_size + 1}")
                     except Exception as e:
                         logger.error(f"Error in batch {i//batch_size + 1}: {str(e)}")
                         logger.error(f"Problem row sample: {batch[0] if batch else 'No data'}")
                         raise
                 
+                if self.mode == "swap":
+                    logger.info(f"Building indexes and swapping {target_table} in for {self.table_name}")
+                    with self.metrics.stage("swap"):
+                        db.swap_tables(self.cursor, self.table_name, target_table)
+                        self.connection.commit()
+                
                 logger.info("Data reimport completed successfully.")
+                if self.refresh_hierarchy and self.table_name == "places":
+                    _refresh_hierarchy(self.metrics, self.load_strategy)
+                self.metrics.write_summary(inserted=len(df), mode=self.mode)
             else:
                 logger.info("Operation cancelled by user.")
                 
@@ -394,13 +849,14 @@ class Reimporter:
             logger.error(f"An error occurred: {str(e)}")
             raise
         finally:
-            self.cursor.close()
-            self.connection.close()
-            self.connection.close()
+            if self.connection is not None:
+                db.close_db(self.cursor, self.connection)
+                self.connection = None
+                self.cursor = None
 
 
 if __name__ == "__main__":
-    #xmlfiles = glob("raw_data/TGN/*.xml")
-    #PopulateTGN(xmlfiles).populate_db()
+    #xmlfiles = glob("raw_data/TGN/*.xml") + glob("raw_data/TGN/*.xml.gz") + glob("raw_data/TGN/*.zip")
+    #PopulateTGN(xmlfiles, workers=os.cpu_count()).populate_db()
     PopulateHGIS("raw_data/HGIS/gz_info_1.csv").populate_db()
     #Reimporter("raw_data/TGN/tgn_new_columns.csv", "places", "TGN").reimport_data()
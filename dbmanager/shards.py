@@ -0,0 +1,149 @@
+"""
+Splits large TGN XML files into byte-range shards aligned on <Subject> boundaries.
+
+Each shard is wrapped with the original document header (everything before the first
+<Subject>) and footer (everything after the last </Subject>), so it can be parsed on its
+own by etree.iterparse.
+"""
+import io
+import os
+import re
+from typing import NamedTuple
+
+SUBJECT_START = re.compile(rb"<Subject[\s>]")
+SUBJECT_END = b"</Subject>"
+SCAN_CHUNK = 1024 * 1024
+
+
+class Shard(NamedTuple):
+    file_path: str
+    start: int
+    end: int
+
+    def __str__(self) -> str:
+        return f"{self.file_path} [{self.start}:{self.end}]"
+
+
+def _find_forward(f, pattern: re.Pattern, offset: int) -> int | None:
+    """
+    Returns the offset of the first match of pattern at or after offset, or None.
+    """
+    f.seek(offset)
+    carry = b""
+    base = offset
+    while True:
+        chunk = f.read(SCAN_CHUNK)
+        if not chunk:
+            return None
+        data = carry + chunk
+        match = pattern.search(data)
+        if match:
+            return base + match.start()
+        # keep a tail in case the tag straddles two chunks
+        carry = data[-16:]
+        base += len(data) - len(carry)
+
+
+def _find_last_subject_end(f, file_size: int) -> int | None:
+    """
+    Returns the offset just past the last </Subject> tag, or None.
+    """
+    position = file_size
+    carry = b""
+    while position > 0:
+        read_from = max(0, position - SCAN_CHUNK)
+        f.seek(read_from)
+        data = f.read(position - read_from) + carry
+        index = data.rfind(SUBJECT_END)
+        if index != -1:
+            return read_from + index + len(SUBJECT_END)
+        carry = data[:len(SUBJECT_END)]
+        position = read_from
+    return None
+
+
+def subject_bounds(file_path: str) -> tuple[int, int]:
+    """
+    Returns the (start, end) byte range spanning all Subjects of the file.
+
+    Args:
+        file_path (str): The path to the XML file.
+    """
+    with open(file_path, "rb") as f:
+        start = _find_forward(f, SUBJECT_START, 0)
+        end = _find_last_subject_end(f, os.path.getsize(file_path))
+    if start is None or end is None or end <= start:
+        raise ValueError(f"No <Subject> elements found in {file_path}")
+    return start, end
+
+
+def plan_shards(file_path: str, shard_size: int) -> list[Shard]:
+    """
+    Splits a file into shards of roughly shard_size bytes, each starting on a <Subject> tag.
+
+    Args:
+        file_path (str): The path to the XML file.
+        shard_size (int): The target size of each shard in bytes.
+    """
+    start, end = subject_bounds(file_path)
+    boundaries = [start]
+    with open(file_path, "rb") as f:
+        target = start + shard_size
+        while target < end:
+            boundary = _find_forward(f, SUBJECT_START, target)
+            if boundary is None or boundary >= end:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+            target = boundary + shard_size
+    boundaries.append(end)
+    return [Shard(file_path, a, b) for a, b in zip(boundaries, boundaries[1:])]
+
+
+class ShardReader(io.RawIOBase):
+    """
+    File-like object that exposes a shard as a standalone XML document.
+
+    Args:
+        shard (Shard): The shard to read.
+    """
+    def __init__(self, shard: Shard):
+        super().__init__()
+        self.shard = shard
+        self._file = open(shard.file_path, "rb")
+        data_start, data_end = subject_bounds(shard.file_path)
+        self._file.seek(0)
+        header = self._file.read(data_start)
+        self._file.seek(data_end)
+        footer = self._file.read()
+        self._file.seek(shard.start)
+        self._segments = [header, None, footer]
+        self._remaining = shard.end - shard.start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._segments:
+            segment = self._segments[0]
+            if segment is None:
+                if self._remaining > 0:
+                    data = self._file.read(min(len(buffer), self._remaining))
+                    self._remaining -= len(data)
+                    if data:
+                        buffer[:len(data)] = data
+                        return len(data)
+                self._segments.pop(0)
+                continue
+            if not segment:
+                self._segments.pop(0)
+                continue
+            size = min(len(buffer), len(segment))
+            buffer[:size] = segment[:size]
+            self._segments[0] = segment[size:]
+            return size
+        return 0
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
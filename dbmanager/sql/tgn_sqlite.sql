@@ -0,0 +1,50 @@
+--- Version 0.2.0 (SQLite)
+--- Same schema as tgn.sql for the embedded SQLite backend
+CREATE TABLE IF NOT EXISTS places (
+    place_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    original_source_id BIGINT,
+    source VARCHAR(50),
+    place_name VARCHAR(255) NOT NULL,
+    place_type VARCHAR(255),
+    latitude REAL,
+    longitude REAL,
+    parent_id BIGINT,
+    alternate_names TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (original_source_id, source)
+);
+
+CREATE TRIGGER IF NOT EXISTS places_updated_at AFTER UPDATE ON places
+FOR EACH ROW WHEN NEW.updated_at = OLD.updated_at
+BEGIN
+    UPDATE places SET updated_at = CURRENT_TIMESTAMP WHERE place_id = NEW.place_id;
+END;
+
+CREATE INDEX IF NOT EXISTS idx_place_type ON places(place_type);
+
+CREATE INDEX IF NOT EXISTS idx_parent_id ON places(parent_id);
+CREATE INDEX IF NOT EXISTS idx_coordinates ON places(latitude, longitude);
+-- grid_cell (the Z-order grid cell of the coordinates, see dbmanager/grid.py) and idx_grid_cell are added
+-- by create_tables after this file runs, so that tables created before them get them too
+
+-- Content hash of the last imported version of each place, used by delta imports (see dbmanager/delta.py).
+-- deleted_at marks places removed from their source by a later release.
+CREATE TABLE IF NOT EXISTS place_hashes (
+    original_source_id BIGINT NOT NULL,
+    source VARCHAR(50) NOT NULL,
+    content_hash BIGINT NOT NULL,
+    deleted_at TIMESTAMP NULL DEFAULT NULL,
+    PRIMARY KEY (original_source_id, source)
+);
+
+-- Closure table of the parent_id hierarchy: one row per place and each of its ancestors, by place_id,
+-- including the place itself at depth 0 (see dbmanager/hierarchy.py). Rebuilt after imports.
+CREATE TABLE IF NOT EXISTS place_hierarchy (
+    ancestor_id BIGINT NOT NULL,
+    descendant_id BIGINT NOT NULL,
+    depth INT NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_hierarchy_descendant ON place_hierarchy(descendant_id, depth);
@@ -0,0 +1,416 @@
+"""
+Embedded SQLite implementation of the dbmanage interface.
+
+Lets the loaders, the training data export and CI run without a MySQL server.
+The database file is read from SQLITE_DATABASE_PATH (default data/places.sqlite).
+"""
+import os
+import sqlite3
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+try:
+    from .parquet_export import write_cursor_to_parquet, DEFAULT_BATCH_SIZE
+    from . import grid
+    from . import hierarchy
+except ImportError:
+    from parquet_export import write_cursor_to_parquet, DEFAULT_BATCH_SIZE
+    import grid
+    import hierarchy
+
+load_dotenv()
+
+SCHEMA_FILE = "dbmanager/sql/tgn_sqlite.sql"
+FILTER_SQL_FILE = "dbmanager/sql/filterdata.sql"
+
+PLACE_COLUMNS = [
+    "original_source_id", "source", "place_name", "place_type",
+    "latitude", "longitude", "parent_id", "alternate_names", "grid_cell"
+]
+
+# Secondary indexes of places (see tgn_sqlite.sql), built after bulk loads into staging tables
+SECONDARY_INDEXES = {
+    "idx_place_type": "place_type",
+    "idx_parent_id": "parent_id",
+    "idx_coordinates": "latitude, longitude",
+    "idx_grid_cell": "grid_cell",
+}
+
+# Columns of place_hashes, the content hashes used by delta imports (see delta.py)
+HASH_COLUMNS = ["original_source_id", "source", "content_hash", "deleted_at"]
+
+# Columns of place_hierarchy, the closure table of parent_id (see hierarchy.py)
+HIERARCHY_COLUMNS = hierarchy.HIERARCHY_COLUMNS
+
+# Columns of the unique key of places
+UNIQUE_KEY_COLUMNS = ["original_source_id", "source"]
+
+LOAD_STRATEGIES = ("executemany", "load_data")
+
+# Rows per batch for each load strategy
+BATCH_SIZES = {"executemany": 1000, "load_data": 50000}
+
+def _database_path() -> str:
+    return os.getenv("SQLITE_DATABASE_PATH", "data/places.sqlite")
+
+def connect_to_db(allow_local_infile: bool = False):
+    """
+    Opens a connection to the SQLite database file.
+
+    Parameters:
+        allow_local_infile (bool): Accepted for compatibility with dbmanage; ignored.
+    """
+    path = _database_path()
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=60)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    return connection
+
+def get_connection(allow_local_infile: bool = False, timeout: float = None):
+    """
+    Returns a new connection. SQLite connections are cheap, so there is no pool.
+
+    Parameters:
+        allow_local_infile (bool): Accepted for compatibility with dbmanage; ignored.
+        timeout (float): Accepted for compatibility with dbmanage; ignored.
+    """
+    return connect_to_db()
+
+@contextmanager
+def session(prepared: bool = False, allow_local_infile: bool = False):
+    """
+    Context manager that yields a cursor, commits when the block succeeds and rolls back when it raises.
+
+    Parameters:
+        prepared (bool): Accepted for compatibility with dbmanage; sqlite3 always caches prepared statements.
+        allow_local_infile (bool): Accepted for compatibility with dbmanage; ignored.
+    """
+    connection = get_connection()
+    cursor = connection.cursor()
+    try:
+        yield cursor
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        close_db(cursor, connection)
+
+def create_tables(cursor, model_file: str = SCHEMA_FILE):
+    with open(model_file, "r") as file:
+        cursor.executescript(file.read())
+    add_grid_cell(cursor)
+
+def add_grid_cell(cursor) -> None:
+    """
+    Adds the grid_cell column and idx_grid_cell to places if they are missing, as in tables created before them.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+    """
+    cursor.execute("PRAGMA table_info(places)")
+    if "grid_cell" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE places ADD COLUMN grid_cell BIGINT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_grid_cell ON places(grid_cell)")
+
+def upsert_clause(columns: list[str]) -> str:
+    """
+    Returns an ON CONFLICT clause that overwrites the non-key columns.
+    """
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column not in UNIQUE_KEY_COLUMNS)
+    return f"ON CONFLICT ({', '.join(UNIQUE_KEY_COLUMNS)}) DO UPDATE SET {updates}"
+
+def _insert_sql(table: str, columns: list[str], upsert: bool) -> str:
+    placeholders = ", ".join(["?"] * len(columns))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    if upsert:
+        sql += f" {upsert_clause(columns)}"
+    return sql
+
+def insert_data(cursor, data, upsert: bool = False):
+    """
+    Inserts place rows with executemany.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        data (list[Sequence]): The rows to insert, in the order of PLACE_COLUMNS.
+        upsert (bool): If True, rows whose (original_source_id, source) already exists are updated instead of failing.
+    """
+    cursor.executemany(_insert_sql("places", PLACE_COLUMNS, upsert), data)
+
+def bulk_load(cursor, rows, table: str = "places", columns: list[str] = PLACE_COLUMNS, upsert: bool = False) -> int:
+    """
+    Loads rows in a single executemany over an iterator, without materializing them.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        rows (Iterable[Sequence]): The rows to load, in the order of columns.
+        table (str): The table to load the rows into.
+        columns (list[str]): The columns of the rows.
+        upsert (bool): If True, existing rows with the same (original_source_id, source) are updated.
+
+    Returns:
+        int: The number of rows loaded.
+    """
+    cursor.executemany(_insert_sql(table, columns, upsert), rows)
+    return cursor.rowcount
+
+def write_rows(cursor, rows, strategy: str = "executemany", table: str = "places", columns: list[str] = PLACE_COLUMNS,
+               upsert: bool = False) -> None:
+    """
+    Writes rows with the given load strategy. Both strategies use executemany on SQLite.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        rows (Iterable[Sequence]): The rows to write, in the order of columns.
+        strategy (str): "executemany" or "load_data".
+        table (str): The table to write the rows into.
+        columns (list[str]): The columns of the rows.
+        upsert (bool): If True, existing rows with the same (original_source_id, source) are updated.
+    """
+    if strategy not in LOAD_STRATEGIES:
+        raise ValueError(f"Unsupported load strategy: {strategy}")
+    bulk_load(cursor, rows, table, columns, upsert=upsert)
+
+def execute_sql(cursor, sql):
+    """
+    Executes a SQL command or SQL file.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        sql (str): The SQL command or the path to the SQL file to execute.
+    """
+    try:
+        if sql.endswith(".sql"):
+            with open(sql, "r") as file:
+                sql = file.read()
+        if sql.strip().rstrip(";").count(";"):
+            cursor.executescript(sql)
+        else:
+            cursor.execute(sql)
+    except Exception as e:
+        print(f"Error executing SQL command: {e}")
+        raise
+
+def create_staging_table(cursor, table: str = "places", staging: str = "places_staging", exclude_source: str = None) -> None:
+    """
+    Creates an empty copy of table without its secondary indexes, replacing any previous staging table.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        table (str): The table to copy.
+        staging (str): The name of the staging table.
+        exclude_source (str): If given, the rows of every other source are copied into the staging table,
+            so that swapping it in replaces only the rows of this source.
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+    create_sql = cursor.fetchone()[0]
+    cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+    cursor.execute(create_sql.replace(table, staging, 1))
+    if exclude_source is not None:
+        cursor.execute(f"INSERT INTO {staging} SELECT * FROM {table} WHERE source <> ? OR source IS NULL", (exclude_source,))
+
+def swap_tables(cursor, table: str = "places", staging: str = "places_staging") -> None:
+    """
+    Swaps the staging table in and builds its indexes and triggers in one transaction.
+    Readers see either the old or the new table. The old table is dropped.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        table (str): The table to replace.
+        staging (str): The loaded staging table.
+    """
+    cursor.connection.commit()
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (table,))
+    triggers = [row[0] for row in cursor.fetchall()]
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+        for name, columns in SECONDARY_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+        for trigger in triggers:
+            cursor.execute(trigger)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+def export_filtered_places(cursor, output_path: str, batch_size: int = DEFAULT_BATCH_SIZE, roots: list[tuple[str, int]] = None) -> int:
+    """
+    Streams the places with the training place types into a Parquet file, batch_size rows per row group.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        output_path (str): The path of the Parquet file.
+        batch_size (int): Rows fetched per round trip and written per row group.
+        roots (list[tuple[str, int]]): If given, only the places in the subtrees of these
+            (source, original_source_id) places are exported, through place_hierarchy.
+
+    Returns:
+        int: The number of rows written.
+    """
+    with open(FILTER_SQL_FILE, "r") as file:
+        sql = file.read().strip().rstrip(";")
+    params = []
+    if roots:
+        condition, params = hierarchy.subtree_condition(roots, "?")
+        sql = f"{sql} AND {condition}"
+    cursor.execute(sql, params)
+    return write_cursor_to_parquet(cursor, output_path, batch_size)
+
+def load_hashes(cursor, source: str, batch_size: int = 100000):
+    """
+    Yields (original_source_id, content_hash) for the live rows of source in place_hashes.
+    
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        source (str): The source of the rows, e.g. "TGN".
+        batch_size (int): Rows fetched per round trip.
+    """
+    cursor.execute("SELECT original_source_id, content_hash FROM place_hashes WHERE source = ? AND deleted_at IS NULL", (source,))
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+
+def tombstone_places(cursor, source: str, ids, batch_size: int = 1000) -> int:
+    """
+    Deletes the places of source with the given ids and marks their hashes as deleted,
+    keeping a record of when each row left the source.
+    
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        source (str): The source of the rows, e.g. "TGN".
+        ids (Sequence[int]): The original_source_id of the rows to delete.
+        batch_size (int): Ids per statement.
+    
+    Returns:
+        int: The number of places deleted.
+    """
+    deleted = 0
+    for i in range(0, len(ids), batch_size):
+        batch = list(ids[i:i + batch_size])
+        placeholders = ", ".join(["?"] * len(batch))
+        cursor.execute(f"DELETE FROM places WHERE source = ? AND original_source_id IN ({placeholders})", [source] + batch)
+        deleted += cursor.rowcount
+        cursor.execute(f"UPDATE place_hashes SET deleted_at = CURRENT_TIMESTAMP "
+                       f"WHERE source = ? AND original_source_id IN ({placeholders})", [source] + batch)
+    return deleted
+
+def places_in_bbox(cursor, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                   columns: list[str] = PLACE_COLUMNS) -> list[tuple]:
+    """
+    Returns the places in a bounding box, reading only the idx_grid_cell ranges of the cells covering it.
+    A box with min_lon > max_lon crosses the antimeridian.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        min_lat, min_lon, max_lat, max_lon (float): The bounding box in degrees.
+        columns (list[str]): The columns to return.
+    """
+    return grid.places_in_bbox(cursor, min_lat, min_lon, max_lat, max_lon, columns, "?")
+
+def places_within_radius(cursor, latitude: float, longitude: float, radius_km: float,
+                         columns: list[str] = PLACE_COLUMNS) -> list[tuple]:
+    """
+    Returns the places within radius_km of a point, nearest first, each row followed by its distance in km.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        latitude, longitude (float): The center in degrees.
+        radius_km (float): The radius in km.
+        columns (list[str]): The columns to return.
+    """
+    return grid.places_within_radius(cursor, latitude, longitude, radius_km, columns, "?")
+
+def backfill_grid_cells(connection, batch_size: int = 10000) -> int:
+    """
+    Adds the grid_cell column and idx_grid_cell to a places table created before them,
+    and computes the cell of every place with coordinates that has none.
+
+    Parameters:
+        connection (sqlite3.Connection): The connection to use.
+        batch_size (int): Places updated per commit.
+
+    Returns:
+        int: The number of places updated.
+    """
+    cursor = connection.cursor()
+    try:
+        add_grid_cell(cursor)
+        connection.commit()
+    finally:
+        cursor.close()
+    return grid.backfill_grid_cells(connection, "?", batch_size)
+
+def refresh_hierarchy(connection, strategy: str = "executemany", batch_size: int = None) -> int:
+    """
+    Rebuilds place_hierarchy from the parent_id of every place, creating the table if needed.
+    The table is replaced in one transaction, so readers see either the old or the new hierarchy.
+
+    Parameters:
+        connection (sqlite3.Connection): The connection to use.
+        strategy (str): "executemany" or "load_data".
+        batch_size (int): Pairs per write. Defaults to BATCH_SIZES[strategy].
+
+    Returns:
+        int: The number of (ancestor, descendant) pairs, including the depth 0 pair of every place.
+    """
+    cursor = connection.cursor()
+    try:
+        for statement in hierarchy.CREATE_TABLE_SQL:
+            cursor.execute(statement)
+        ancestor, descendant, depth = hierarchy.closure(hierarchy.read_parents(cursor))
+        cursor.execute("DELETE FROM place_hierarchy")
+        for rows in hierarchy.iter_rows(ancestor, descendant, depth, batch_size or BATCH_SIZES[strategy]):
+            write_rows(cursor, rows, strategy, "place_hierarchy", HIERARCHY_COLUMNS)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(depth)
+
+def descendants(cursor, place_id: int, columns: list[str] = PLACE_COLUMNS, max_depth: int = None,
+                include_self: bool = False) -> list[tuple]:
+    """
+    Returns the places under a place, nearest first, each row followed by its depth below the place.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        place_id (int): The place_id of the root of the subtree.
+        columns (list[str]): The columns to return.
+        max_depth (int): If given, only the places at most this many levels below are returned.
+        include_self (bool): If True, the place itself is returned first, at depth 0.
+    """
+    return hierarchy.descendants(cursor, place_id, columns, "?", max_depth, include_self)
+
+def ancestors(cursor, place_id: int, columns: list[str] = PLACE_COLUMNS) -> list[tuple]:
+    """
+    Returns the ancestors of a place from its parent to the root, each row followed by its depth above the place.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        place_id (int): The place_id of the place.
+        columns (list[str]): The columns to return.
+    """
+    return hierarchy.ancestors(cursor, place_id, columns, "?")
+
+def place_depth(cursor, place_id: int) -> int:
+    """
+    Returns the number of ancestors of a place (0 for a root), or None if it is not in place_hierarchy.
+
+    Parameters:
+        cursor (sqlite3.Cursor): The cursor object to execute the SQL command.
+        place_id (int): The place_id of the place.
+    """
+    return hierarchy.place_depth(cursor, place_id, "?")
+
+def close_db(cursor, connection):
+    cursor.close()
+    connection.close()
@@ -0,0 +1,121 @@
+"""
+Single-pass extraction of place rows from TGN <Subject> elements.
+"""
+from lxml import etree
+from typing import Iterator, Optional
+
+SUBJECT_TAG = "{*}Subject"
+
+# Positions of the fields in the row tuple, matching dbmanage.insert_data
+ID, SOURCE, NAME, TYPE, LATITUDE, LONGITUDE, PARENT, ALTERNATES = range(8)
+
+
+class SubjectExtractor:
+    """
+    Extracts the place row of a TGN Subject with one walk over its children.
+
+    The namespaced tag names are built once per namespace and each child of the
+    Subject is routed through a tag dispatch table, instead of running several
+    descendant searches per Subject.
+
+    Args:
+        namespace (str, optional): The XML namespace of the TGN file. Defaults to None.
+    """
+    def __init__(self, namespace: Optional[str] = None):
+        self.namespace = namespace
+        q = self._qualify
+        self.preferred_term = q("Preferred_Term")
+        self.non_preferred_term = q("Non-Preferred_Term")
+        self.term_text = q("Term_Text")
+        self.latitude_path = f"{q('Standard')}/{q('Latitude')}/{q('Decimal')}"
+        self.longitude_path = f"{q('Standard')}/{q('Longitude')}/{q('Decimal')}"
+        self.place_type_path = f"{q('Preferred_Place_Type')}/{q('Place_Type_ID')}"
+        self.parent_path = f"{q('Preferred_Parent')}/{q('Parent_Subject_ID')}"
+        self._handlers = {
+            q("Terms"): self._read_terms,
+            q("Coordinates"): self._read_coordinates,
+            q("Place_Types"): self._read_place_types,
+            q("Parent_Relationships"): self._read_parent,
+        }
+
+    def _qualify(self, tag: str) -> str:
+        return f"{{{self.namespace}}}{tag}" if self.namespace else tag
+
+    @classmethod
+    def for_element(cls, elem) -> "SubjectExtractor":
+        """
+        Creates an extractor for the namespace of the given element.
+        """
+        return cls(etree.QName(elem).namespace)
+
+    def _read_terms(self, node, fields: list) -> None:
+        alternate_names = []
+        for term in node:
+            if term.tag == self.preferred_term:
+                if fields[NAME] is None:
+                    fields[NAME] = term.findtext(self.term_text)
+            elif term.tag == self.non_preferred_term:
+                for text in term.iterchildren(self.term_text):
+                    if text.text:
+                        # clean text before adding to list
+                        alternate_names.append(text.text.replace('\\', '\\\\').strip())
+        if alternate_names:
+            fields[ALTERNATES] = alternate_names if fields[ALTERNATES] is None else fields[ALTERNATES] + alternate_names
+
+    def _read_coordinates(self, node, fields: list) -> None:
+        if fields[LATITUDE] is None:
+            latitude = node.findtext(self.latitude_path)
+            fields[LATITUDE] = float(latitude) if latitude else None
+        if fields[LONGITUDE] is None:
+            longitude = node.findtext(self.longitude_path)
+            fields[LONGITUDE] = float(longitude) if longitude else None
+
+    def _read_place_types(self, node, fields: list) -> None:
+        if fields[TYPE] is None:
+            place_type = node.findtext(self.place_type_path)
+            fields[TYPE] = place_type.split('/')[1] if place_type and '/' in place_type else place_type
+
+    def _read_parent(self, node, fields: list) -> None:
+        if fields[PARENT] is None:
+            parent_id = node.findtext(self.parent_path)
+            fields[PARENT] = int(parent_id) if parent_id else None
+
+    def extract(self, elem) -> Optional[tuple]:
+        """
+        Extracts the place row of a Subject element.
+
+        Args:
+            elem (lxml.etree._Element): The Subject element.
+
+        Returns:
+            tuple | None: (original_source_id, "TGN", place_name, place_type, latitude, longitude,
+                parent_id, alternate_names), or None if the Subject has no ID or preferred name.
+        """
+        fields = [int(elem.get('Subject_ID')), "TGN", None, None, None, None, None, None]
+        handlers = self._handlers
+        for child in elem:
+            handler = handlers.get(child.tag)
+            if handler is not None:
+                handler(child, fields)
+
+        if not (fields[ID] and fields[NAME]):
+            return None
+        if fields[ALTERNATES] is not None:
+            fields[ALTERNATES] = "|".join(fields[ALTERNATES])
+        return tuple(fields)
+
+
+def iter_subjects(source) -> Iterator:
+    """
+    Yields the Subject elements of a TGN XML file, clearing each one once the consumer moves on.
+
+    Args:
+        source: A file path or a binary file-like object with the XML.
+    """
+    context = etree.iterparse(source, events=('end',), tag=SUBJECT_TAG, recover=True)
+    for _, elem in context:
+        yield elem
+        # Memory management
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
@@ -1,11 +1,11 @@
-import dbmanager.dbmanage as db
+from dbmanager.backend import get_backend
 import os
 
+db = get_backend()
+
 def initialize_db():
-    connection = db.connect_to_db()
-    cursor = connection.cursor()
-    db.create_tables(cursor, "dbmanager/sql/tgn.sql")
-    db.close_db(cursor, connection)
+    with db.session() as cursor:
+        db.create_tables(cursor, db.SCHEMA_FILE)
     
 def create_dirs():
     os.makedirs("raw_data/TGN", exist_ok=True)
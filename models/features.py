@@ -0,0 +1,218 @@
+"""
+Fit-once cache of the TF-IDF features used by train.py.
+
+The text featurization (TfidfVectorizer + StandardScaler) is the same for every model, so its
+sparse outputs are computed once per split and stored as .npz files: for each cross-validation
+fold, the featurizer is fitted on the fold's training rows and applied to both sides (fold-safe),
+and for the final model it is fitted on the whole training set and applied to the training and
+test sets. Entries are keyed by the vectorizer config and a hash of the data, so cross-validation,
+the final fit and evaluation reuse them within a run and across runs. The folds missing from the
+cache are fitted in parallel worker processes, as cross_val_score fitted the full pipelines. The
+least recently used entries are evicted when the cache grows over its size cap.
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import sklearn
+from joblib import Parallel, delayed
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.model_selection import KFold
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEATURES_DIR = "training/data/cache/features"
+DEFAULT_FEATURES_MAX_SIZE_GB = 10.0
+
+# Bump when featurizer changes, so cached matrices are not reused
+FEATURES_VERSION = 1
+
+
+def featurizer(config: Dict[str, Any]) -> Pipeline:
+    """
+    The text featurization steps shared by all model pipelines.
+    """
+    return Pipeline([
+        ("vectorizer", TfidfVectorizer(
+            max_features=config["vectorizer"]["max_features"],
+            stop_words=config["vectorizer"]["stop_words"]
+        )),
+        ("scaler", StandardScaler(with_mean=False)),
+    ])
+
+
+def data_hash(*arrays) -> str:
+    """
+    Content hash of text Series and coordinate arrays.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in arrays:
+        if isinstance(array, (pd.Series, pd.DataFrame)):
+            digest.update(pd.util.hash_pandas_object(array, index=False).to_numpy().tobytes())
+        else:
+            digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+    """
+    Sparse feature matrices on disk, one directory per (vectorizer config, data, split) key, with an LRU size cap.
+
+    Args:
+        directory (str, optional): Where entries are stored. Defaults to DEFAULT_FEATURES_DIR.
+        max_size_gb (float, optional): Total size above which the least recently used entries are
+            evicted. Defaults to DEFAULT_FEATURES_MAX_SIZE_GB.
+    """
+    def __init__(self, directory: str = DEFAULT_FEATURES_DIR, max_size_gb: float = DEFAULT_FEATURES_MAX_SIZE_GB):
+        self.directory = directory
+        self.max_bytes = int(max_size_gb * 1024 ** 3)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "FeatureCache":
+        """
+        Builds the cache from the features_dir and features_max_size_gb of the cache section of model_config.yaml.
+        """
+        settings = config.get("cache") or {}
+        return cls(settings.get("features_dir", DEFAULT_FEATURES_DIR),
+                   settings.get("features_max_size_gb", DEFAULT_FEATURES_MAX_SIZE_GB))
+
+    def key(self, config: Dict[str, Any], split: Dict[str, Any], data: str) -> str:
+        """
+        The key of the features of split, fitted with the vectorizer of config on the data with data_hash data.
+        """
+        payload = json.dumps({
+            "vectorizer": config["vectorizer"],
+            "version": FEATURES_VERSION,
+            "sklearn": sklearn.__version__,
+            "split": split,
+            "data": data,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+    def _files(self, key: str) -> list:
+        path = os.path.join(self.directory, key)
+        return [os.path.join(path, name) for name in ("featurizer.joblib", "fit.npz", "apply.npz")]
+
+    def _complete(self, key: str) -> bool:
+        # apply.npz is written last
+        return os.path.exists(self._files(key)[2])
+
+    def _fit(self, config: Dict[str, Any], key: str, X_fit, X_apply) -> Tuple[Pipeline, sp.csr_matrix, sp.csr_matrix]:
+        """
+        Fits the featurizer on X_fit, transforms X_fit and X_apply and stores the result under key.
+        """
+        logger.info(f"Feature cache miss: {key}")
+        files = self._files(key)
+        fitted = featurizer(config)
+        fit_matrix = fitted.fit_transform(X_fit).tocsr()
+        apply_matrix = fitted.transform(X_apply).tocsr()
+        os.makedirs(os.path.dirname(files[0]), exist_ok=True)
+        joblib.dump(fitted, files[0])
+        sp.save_npz(files[1], fit_matrix, compressed=False)
+        # written last: an entry is complete once apply.npz exists
+        sp.save_npz(files[2], apply_matrix, compressed=False)
+        return fitted, fit_matrix, apply_matrix
+
+    def _load_or_fit(self, config: Dict[str, Any], key: str, X_fit, X_apply) -> Tuple[Pipeline, sp.csr_matrix, sp.csr_matrix]:
+        """
+        Fits the featurizer on X_fit and transforms X_fit and X_apply, or loads the result stored under key.
+        """
+        files = self._files(key)
+        if self._complete(key):
+            os.utime(os.path.dirname(files[0]))
+            logger.info(f"Feature cache hit: {key}")
+            return joblib.load(files[0]), sp.load_npz(files[1]), sp.load_npz(files[2])
+        result = self._fit(config, key, X_fit, X_apply)
+        self.evict(keep=[os.path.dirname(files[0])])
+        return result
+
+    def entries(self) -> list:
+        """
+        The cache entries (directories), least recently used first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        with os.scandir(self.directory) as it:
+            entries = [entry for entry in it if entry.is_dir()]
+        return sorted(entries, key=lambda entry: entry.stat().st_mtime)
+
+    @staticmethod
+    def entry_size(path: str) -> int:
+        with os.scandir(path) as it:
+            return sum(entry.stat().st_size for entry in it if entry.is_file())
+
+    def evict(self, keep: Iterable[str] = ()) -> list:
+        """
+        Deletes least recently used entries until the cache fits max_size_gb.
+
+        Args:
+            keep (Iterable[str], optional): Paths of entries that are never evicted, e.g. the ones just stored.
+
+        Returns:
+            list[str]: The paths of the evicted entries.
+        """
+        keep = {os.path.abspath(path) for path in keep}
+        entries = self.entries()
+        sizes = {entry.path: self.entry_size(entry.path) for entry in entries}
+        total = sum(sizes.values())
+        evicted = []
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.abspath(entry.path) in keep:
+                continue
+            total -= sizes[entry.path]
+            shutil.rmtree(entry.path, ignore_errors=True)
+            evicted.append(entry.path)
+            logger.info(f"Feature cache evicted: {entry.name}")
+        return evicted
+
+    def folds(self, config: Dict[str, Any], X_train, y_train, cv: int = 5, n_jobs: int = None,
+              data: str = None) -> Iterator[Tuple[np.ndarray, np.ndarray, sp.csr_matrix, sp.csr_matrix]]:
+        """
+        Returns an iterator over the training and validation row indexes of each of the cv folds (the
+        KFold splits that cross_val_score uses for regressors) with their features, fitted on the
+        fold's training rows. The folds missing from the cache are fitted and stored first, n_jobs at
+        a time in worker processes; the iterator then loads one fold at a time.
+
+        Args:
+            data (str, optional): data_hash(X_train, y_train), when the caller already computed it.
+        """
+        data = data or data_hash(X_train, y_train)
+        splits = list(KFold(n_splits=cv).split(X_train))
+        keys = [self.key(config, {"cv": cv, "fold": i}, data) for i in range(cv)]
+        missing = [i for i, key in enumerate(keys) if not self._complete(key)]
+        if missing:
+            Parallel(n_jobs=n_jobs)(
+                delayed(_fit_entry)(self, config, keys[i], X_train.iloc[splits[i][0]], X_train.iloc[splits[i][1]])
+                for i in missing
+            )
+            self.evict(keep=[os.path.join(self.directory, key) for key in keys])
+        return self._load_folds(config, X_train, splits, keys)
+
+    def _load_folds(self, config: Dict[str, Any], X_train, splits: list, keys: list) -> Iterator[Tuple[np.ndarray, np.ndarray, sp.csr_matrix, sp.csr_matrix]]:
+        for (fit_index, apply_index), key in zip(splits, keys):
+            _, fit_matrix, apply_matrix = self._load_or_fit(config, key, X_train.iloc[fit_index], X_train.iloc[apply_index])
+            yield fit_index, apply_index, fit_matrix, apply_matrix
+
+    def train_test(self, config: Dict[str, Any], X_train, y_train, X_test) -> Tuple[Pipeline, sp.csr_matrix, sp.csr_matrix]:
+        """
+        Returns the featurizer fitted on the whole training set and the features of the training and test sets.
+        """
+        key = self.key(config, {"cv": None}, data_hash(X_train, y_train, X_test))
+        return self._load_or_fit(config, key, X_train, X_test)
+
+
+def _fit_entry(cache: FeatureCache, config: Dict[str, Any], key: str, X_fit, X_apply) -> None:
+    # in a worker process: only the files are passed back
+    cache._fit(config, key, X_fit, X_apply)
@@ -0,0 +1,100 @@
+"""
+model_type "hgb": histogram gradient boosting on a dense reduction of the TF-IDF features.
+
+HistGradientBoostingRegressor needs dense input and is multithreaded, unlike GradientBoostingRegressor.
+The sparse TF-IDF matrix is reduced to n_components dense columns, either with TruncatedSVD or by
+keeping the columns with the highest variance. Then one regressor per output is fitted, the outputs in
+parallel processes with a fixed number of OpenMP threads each, and boosting stops early once the
+score on a held-out fraction stops improving.
+"""
+from typing import Any, Dict
+
+import numpy as np
+from joblib import parallel_config
+from sklearn.decomposition import TruncatedSVD
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.feature_selection import SelectKBest
+from sklearn.multioutput import MultiOutputRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import FunctionTransformer
+from threadpoolctl import threadpool_limits
+
+# Used for the keys missing from the hgb section of model_config.yaml
+DEFAULT_SETTINGS = {
+    "reducer": "svd",
+    "n_components": 100,
+    "threads": None,
+    "early_stopping": True,
+    "validation_fraction": 0.1,
+    "n_iter_no_change": 10,
+}
+
+REDUCERS = ("svd", "variance")
+
+# Number of outputs: latitude and longitude
+N_OUTPUTS = 2
+
+
+def column_variance(X, y=None) -> np.ndarray:
+    """
+    Variance of each column of a sparse or dense matrix, as a SelectKBest score function.
+    """
+    mean = np.asarray(X.mean(axis=0)).ravel()
+    mean_of_squares = np.asarray(X.multiply(X).mean(axis=0)).ravel() if hasattr(X, "multiply") else (X ** 2).mean(axis=0)
+    return mean_of_squares - mean ** 2
+
+
+def to_dense(X) -> np.ndarray:
+    return X.toarray() if hasattr(X, "toarray") else np.asarray(X)
+
+
+class ParallelOutputsRegressor(MultiOutputRegressor):
+    """
+    MultiOutputRegressor whose per-output estimators use at most threads_per_output native threads,
+    whether the outputs are fitted in parallel worker processes or in this process.
+    """
+    def __init__(self, estimator, *, n_jobs=None, threads_per_output=None):
+        super().__init__(estimator, n_jobs=n_jobs)
+        self.threads_per_output = threads_per_output
+
+    def fit(self, X, y, **fit_params):
+        if self.threads_per_output is None:
+            return super().fit(X, y, **fit_params)
+        if self.n_jobs in (None, 1):
+            with threadpool_limits(limits=self.threads_per_output):
+                return super().fit(X, y, **fit_params)
+        with parallel_config(backend="loky", inner_max_num_threads=self.threads_per_output):
+            return super().fit(X, y, **fit_params)
+
+
+def hgb_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    settings = {**DEFAULT_SETTINGS, **(config.get("hgb") or {})}
+    if settings["reducer"] not in REDUCERS:
+        raise ValueError(f"Unsupported hgb reducer: {settings['reducer']}")
+    return settings
+
+
+def hgb_regressor(config: Dict[str, Any]) -> Pipeline:
+    """
+    Reduction and per-output HistGradientBoostingRegressor, applied to the featurizer output.
+    """
+    settings = hgb_settings(config)
+    if settings["reducer"] == "svd":
+        reducer = [("reducer", TruncatedSVD(n_components=settings["n_components"], random_state=config["model"]["random_state"]))]
+    else:
+        reducer = [("reducer", SelectKBest(column_variance, k=settings["n_components"])),
+                   ("densify", FunctionTransformer(to_dense, accept_sparse=True))]
+
+    regressor = HistGradientBoostingRegressor(
+        max_iter=config["model"]["n_estimators"],
+        learning_rate=config["model"]["learning_rate"],
+        max_depth=config["model"]["max_depth"],
+        early_stopping=settings["early_stopping"],
+        validation_fraction=settings["validation_fraction"],
+        n_iter_no_change=settings["n_iter_no_change"],
+        random_state=config["model"]["random_state"]
+    )
+    return Pipeline([
+        *reducer,
+        ("regressor", ParallelOutputsRegressor(regressor, n_jobs=N_OUTPUTS, threads_per_output=settings["threads"]))
+    ])
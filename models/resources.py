@@ -0,0 +1,187 @@
+"""
+Core budget of train.py, split between fold-level and estimator-level parallelism.
+
+Cross-validation fits cv_jobs folds in parallel worker processes and gives each fold
+n_cores // cv_jobs cores: the n_jobs of its estimators and the size of the native (BLAS/OpenMP)
+thread pools of its worker. The final fit runs alone and gets all n_cores. Native pools of this
+process are limited with threadpoolctl, and those of worker processes through joblib, so that
+parallel folds, forests and BLAS do not oversubscribe the cores.
+
+Each stage of a run is timed along with the CPU time of this process and its worker processes,
+and its utilization of the budget is recorded for the training report.
+"""
+import os
+import resource
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from joblib import parallel_config
+from sklearn.multioutput import MultiOutputRegressor
+from threadpoolctl import threadpool_limits
+
+from models.hgb import N_OUTPUTS, ParallelOutputsRegressor
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Used for the keys missing from the resources section of model_config.yaml
+DEFAULT_SETTINGS = {
+    "n_cores": None,
+    "cv_jobs": None,
+}
+
+
+def available_cores() -> int:
+    """
+    The cores this process may run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def resource_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_SETTINGS, **(config.get("resources") or {})}
+
+
+def resource_plan(config: Dict[str, Any], cv: int) -> Dict[str, int]:
+    """
+    Splits the core budget between the folds of cv-fold cross-validation and their estimators.
+    By default all cores are used and as many folds as possible run in parallel, since folds
+    are independent while estimators parallelize only partly (a few outputs, BLAS calls).
+
+    Returns:
+        dict: n_cores, cv_jobs (folds fitted at once), cv_estimator_jobs (cores of each fold)
+            and fit_estimator_jobs (cores of the final fit).
+    """
+    settings = resource_settings(config)
+    n_cores = max(1, settings["n_cores"] or available_cores())
+    cv_jobs = max(1, min(settings["cv_jobs"] or n_cores, n_cores, cv))
+    return {
+        "n_cores": n_cores,
+        "cv_jobs": cv_jobs,
+        "cv_estimator_jobs": max(1, n_cores // cv_jobs),
+        "fit_estimator_jobs": n_cores,
+    }
+
+
+def assign_jobs(estimator, n_jobs: int):
+    """
+    Sets the n_jobs of estimator and of the estimators nested in it to n_jobs. Multi-output
+    wrappers get one job per output at most, and the threads of ParallelOutputsRegressor not
+    set in model_config.yaml get the rest of the budget, divided between the outputs.
+    """
+    params = estimator.get_params(deep=True)
+    updates = {}
+    for name in params:
+        if name != "n_jobs" and not name.endswith("__n_jobs"):
+            continue
+        prefix = name[:-len("n_jobs")]
+        owner = params[prefix[:-2]] if prefix else estimator
+        if isinstance(owner, MultiOutputRegressor):
+            outputs = min(n_jobs, N_OUTPUTS)
+            updates[name] = outputs
+            if isinstance(owner, ParallelOutputsRegressor) and owner.threads_per_output is None:
+                updates[f"{prefix}threads_per_output"] = max(1, n_jobs // outputs)
+        else:
+            updates[name] = n_jobs
+    return estimator.set_params(**updates)
+
+
+@contextmanager
+def native_threads(threads: int):
+    """
+    Limits the BLAS/OpenMP pools of this process, and of the joblib worker processes started in
+    the enclosed block, to threads threads each.
+    """
+    with threadpool_limits(limits=threads), parallel_config(backend="loky", inner_max_num_threads=threads):
+        yield
+
+
+def _process_cpu_seconds() -> Dict[int, float]:
+    """
+    CPU seconds used so far by each running process of the tree of this process, from /proc.
+    """
+    parents = {}
+    cpu = {}
+    ticks = os.sysconf("SC_CLK_TCK")
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        parents[int(entry)] = int(fields[1])
+        cpu[int(entry)] = (int(fields[11]) + int(fields[12])) / ticks
+    tree = {os.getpid()}
+    added = True
+    while added:
+        children = {pid for pid, parent in parents.items() if parent in tree} - tree
+        tree |= children
+        added = bool(children)
+    return {pid: cpu[pid] for pid in tree if pid in cpu}
+
+
+def cpu_snapshot() -> Dict[Any, float]:
+    """
+    CPU seconds of this process and its worker processes. Running processes are read from /proc
+    where it exists; finished children are counted from their resource usage.
+    """
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    snapshot = {"finished": usage.ru_utime + usage.ru_stime}
+    if os.path.isdir("/proc"):
+        snapshot.update(_process_cpu_seconds())
+    else:
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        snapshot[os.getpid()] = own.ru_utime + own.ru_stime
+    return snapshot
+
+
+def cpu_seconds_since(start: Dict[Any, float]) -> float:
+    """
+    CPU seconds used since the cpu_snapshot start, including processes started since then.
+    Children that finished in between are counted through the resource usage of finished children,
+    which holds their whole lifetime, so what those running at start had used is subtracted.
+    """
+    end = cpu_snapshot()
+    return sum(end.get(key, 0.0) - start.get(key, 0.0) for key in start.keys() | end.keys())
+
+
+class ResourceMonitor:
+    """
+    Wall time, CPU time and CPU utilization of the stages of a training run.
+    """
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str, cores: int, **fields):
+        """
+        Records the enclosed block as stage name, running on a budget of cores cores.
+        fields, e.g. the jobs and threads of the stage, are recorded with it.
+
+        Usage:
+            with monitor.stage("training", cores=plan["fit_estimator_jobs"]):
+                model = train_model(X_train, y_train, config)
+        """
+        start = time.perf_counter()
+        start_cpu = cpu_snapshot()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            cpu_seconds = cpu_seconds_since(start_cpu)
+            utilization = cpu_seconds / (seconds * cores) if seconds else None
+            self.stages[name] = {
+                "seconds": seconds,
+                "cpu_seconds": cpu_seconds,
+                "cores": cores,
+                "cpu_utilization": utilization,
+                **fields,
+            }
+            logger.info(f"Stage {name}: {seconds:.2f} seconds, {cpu_seconds:.2f} CPU seconds "
+                        f"({utilization or 0:.0%} of {cores} cores)")
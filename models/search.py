@@ -0,0 +1,274 @@
+"""
+Successive-halving hyperparameter search for train.py --search.
+
+Candidates are sampled from the search space of model_config.yaml, whose keys are
+"<section>.<name>" paths into the config (model.max_depth, vectorizer.max_features, ...).
+Every round fits the remaining candidates on a growing subsample of the training rows of each
+cross-validation fold and keeps the best 1 / factor of them, until the last round fits the few
+that are left on all the rows, as HalvingRandomSearchCV does with n_samples as the resource.
+
+The features come from the feature cache: the TF-IDF matrices of each fold are computed once per
+distinct vectorizer setting and reused by every candidate and round. They are read back one fold
+at a time, and the subsample of a fold is taken once per round and shared by the candidates with
+that vectorizer setting, when their tasks are dispatched. Boosted models stop adding
+trees once they stop improving on a held-out part of the rows they are fitted on; the early
+stopping settings are part of the params of every candidate, so the best params train the same
+model that won. Space keys that the configured model type does not read are dropped, so that no
+round is spent on candidates that only differ in ignored settings.
+"""
+import copy
+import math
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy import stats
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import ParameterSampler
+
+from models.features import FeatureCache, data_hash
+from models.resources import assign_jobs, native_threads, resource_plan
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Used for the keys missing from the search section of model_config.yaml
+DEFAULT_SETTINGS = {
+    "n_candidates": 20,
+    "factor": 3,
+    "cv_folds": 3,
+    "min_samples": None,
+    "early_stopping": True,
+    "n_iter_no_change": 10,
+    "random_state": 42,
+    "space": {},
+}
+
+# Config keys read by the regressor of each model type (keys ending in "." stand for a whole
+# section); the vectorizer section is read by all of them
+MODEL_KEYS = {
+    "rfr": ("model.n_estimators", "model.max_depth"),
+    "gbr": ("model.n_estimators", "model.max_depth", "model.learning_rate", "model.n_iter_no_change"),
+    "hgb": ("model.n_estimators", "model.max_depth", "model.learning_rate", "hgb."),
+}
+
+# Params that turn on early stopping for the boosted model types, given n_iter_no_change
+EARLY_STOPPING_PARAMS = {
+    "gbr": lambda n_iter_no_change: {"model.n_iter_no_change": n_iter_no_change},
+    "hgb": lambda n_iter_no_change: {"hgb.early_stopping": True, "hgb.n_iter_no_change": n_iter_no_change},
+}
+
+# Distributions of the search space, from {"distribution": name, "low": ..., "high": ...}
+DISTRIBUTIONS = {
+    "uniform": lambda low, high: stats.uniform(low, high - low),
+    "loguniform": lambda low, high: stats.loguniform(low, high),
+    "randint": lambda low, high: stats.randint(low, high + 1),
+}
+
+
+def search_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    settings = {**DEFAULT_SETTINGS, **(config.get("search") or {})}
+    if not settings["space"]:
+        raise ValueError("The search section of model_config.yaml has no space to search")
+    if settings["factor"] < 2:
+        raise ValueError(f"Search factor must be at least 2, not {settings['factor']}")
+    return settings
+
+
+def model_reads(model_type: str, name: str) -> bool:
+    """
+    Whether the regressor of model_type reads the "<section>.<name>" config key name.
+    """
+    if model_type not in MODEL_KEYS:
+        raise ValueError(f"Search is not supported for model type {model_type}")
+    return name.startswith("vectorizer.") or any(
+        name.startswith(key) if key.endswith(".") else name == key for key in MODEL_KEYS[model_type]
+    )
+
+
+def model_space(space: Dict[str, Any], model_type: str) -> Dict[str, Any]:
+    """
+    The keys of space that model_type reads.
+    """
+    ignored = [name for name in space if not model_reads(model_type, name)]
+    if ignored:
+        logger.warning(f"Search space keys not used by model type {model_type} are ignored: {ignored}")
+    return {name: values for name, values in space.items() if name not in ignored}
+
+
+def parameter_space(space: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converts the search space of model_config.yaml to ParameterSampler distributions: lists are
+    sampled uniformly and {"distribution", "low", "high"} mappings become scipy distributions.
+    """
+    distributions = {}
+    for name, values in space.items():
+        if "." not in name:
+            raise ValueError(f"Search space keys are <section>.<name>, not {name}")
+        if isinstance(values, dict):
+            if values.get("distribution") not in DISTRIBUTIONS:
+                raise ValueError(f"Unsupported distribution for {name}: {values.get('distribution')}")
+            distributions[name] = DISTRIBUTIONS[values["distribution"]](values["low"], values["high"])
+        else:
+            distributions[name] = list(values)
+    return distributions
+
+
+def plain_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    params with numpy scalars converted to Python values, for YAML configs and JSON reports.
+    """
+    return {name: value.item() if isinstance(value, np.generic) else value for name, value in params.items()}
+
+
+def candidate_config(config: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A copy of config with the "<section>.<name>" values of params set.
+    """
+    candidate = copy.deepcopy(config)
+    for name, value in plain_params(params).items():
+        section, key = name.split(".", 1)
+        candidate.setdefault(section, {})[key] = value
+    return candidate
+
+
+def sample_candidates(settings: Dict[str, Any], model_type: str) -> List[Dict[str, Any]]:
+    """
+    Samples the candidate params of model_type, with its early stopping params when the search
+    has early stopping on. Candidates with the same params are sampled once.
+    """
+    space = model_space(settings["space"], model_type)
+    if not space:
+        raise ValueError(f"The search space has no keys used by model type {model_type}")
+    fixed = {}
+    if settings["early_stopping"] and model_type in EARLY_STOPPING_PARAMS:
+        fixed = EARLY_STOPPING_PARAMS[model_type](settings["n_iter_no_change"])
+    candidates = []
+    seen = set()
+    for params in ParameterSampler(parameter_space(space), settings["n_candidates"], random_state=settings["random_state"]):
+        params = plain_params({**params, **fixed})
+        key = repr(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+    return candidates
+
+
+def search_regressor(build_regressor: Callable[[Dict[str, Any]], Any], candidate: Dict[str, Any], n_jobs: int):
+    return assign_jobs(build_regressor(candidate), n_jobs)
+
+
+def vectorizer_key(candidate: Dict[str, Any]) -> str:
+    return repr(sorted(candidate["vectorizer"].items()))
+
+
+def _score_candidate(regressor, X_fit, y_fit, X_apply, y_apply) -> Dict[str, float]:
+    start = time.perf_counter()
+    regressor.fit(X_fit, y_fit)
+    fit_seconds = time.perf_counter() - start
+    return {"mae": mean_absolute_error(y_apply, regressor.predict(X_apply)), "fit_seconds": fit_seconds}
+
+
+def successive_halving(config: Dict[str, Any], features: FeatureCache, X_train, y_train,
+                       build_regressor: Callable[[Dict[str, Any]], Any]) -> Dict[str, Any]:
+    """
+    Searches the space of the search section of config by successive halving.
+
+    Args:
+        config (dict): The training config, with a search section.
+        features (FeatureCache): Where the fold features are cached.
+        X_train (pd.Series): The training texts.
+        y_train (np.ndarray): The training coordinates.
+        build_regressor (Callable): Builds the regressor of a config, without the featurization steps.
+
+    Returns:
+        dict: The rounds (candidates and training rows of each), the results table (one row per
+            candidate and round, with the mean and std of the fold MAEs) and the best params of the
+            last round ("<section>.<name>": value, early stopping included) and their MAE.
+    """
+    settings = search_settings(config)
+    cv = settings["cv_folds"]
+    factor = settings["factor"]
+    y_train = np.asarray(y_train)
+    candidates = sample_candidates(settings, config.get("model_type", "rfr").lower())
+    rng = np.random.default_rng(settings["random_state"])
+
+    # the fold features of every distinct vectorizer setting, fitted into the cache before the rounds read them
+    vectorizers = {}
+    for params in candidates:
+        candidate = candidate_config(config, params)
+        vectorizers.setdefault(vectorizer_key(candidate), candidate)
+    data = data_hash(X_train, y_train)
+    for candidate in vectorizers.values():
+        features.folds(candidate, X_train, y_train, cv, resource_plan(config, cv)["cv_jobs"], data)
+
+    max_samples = len(X_train) - math.ceil(len(X_train) / cv)
+    # floor(log_factor(candidates)) + 1 rounds, as HalvingRandomSearchCV
+    n_rounds = 1
+    while factor ** n_rounds <= len(candidates):
+        n_rounds += 1
+    min_samples = settings["min_samples"] or max(1, max_samples // factor ** (n_rounds - 1))
+    # the same subsample order for every candidate, so that they are compared on the same rows
+    orders = [rng.permutation(max_samples) for _ in range(cv)]
+
+    results = []
+    rounds = []
+    remaining = list(range(len(candidates)))
+    for round_index in range(n_rounds):
+        n_samples = min(max_samples, min_samples * factor ** round_index)
+        logger.info(f"Search round {round_index + 1}/{n_rounds}: {len(remaining)} candidates on {n_samples} rows per fold")
+        groups = {}
+        for candidate_index in remaining:
+            groups.setdefault(vectorizer_key(candidate_config(config, candidates[candidate_index])), []).append(candidate_index)
+
+        # one task per candidate and fold, sharing the cores like the folds of cross-validation
+        plan = resource_plan(config, len(remaining) * cv)
+        task_candidates = []
+        def tasks():
+            # generated as Parallel dispatches them: one fold is loaded and subsampled at a time
+            for key, indexes in groups.items():
+                for fold_index, (fit_index, apply_index, X_fit, X_apply) in enumerate(
+                        features.folds(vectorizers[key], X_train, y_train, cv, data=data)):
+                    rows = np.sort(orders[fold_index][:n_samples])
+                    X_rows, y_rows, y_apply = X_fit[rows], y_train[fit_index][rows], y_train[apply_index]
+                    for candidate_index in indexes:
+                        task_candidates.append(candidate_index)
+                        regressor = search_regressor(build_regressor, candidate_config(config, candidates[candidate_index]),
+                                                     plan["cv_estimator_jobs"])
+                        yield delayed(_score_candidate)(regressor, X_rows, y_rows, X_apply, y_apply)
+
+        with native_threads(plan["cv_estimator_jobs"]):
+            scores = Parallel(n_jobs=plan["cv_jobs"], verbose=1)(tasks())
+
+        round_results = []
+        for candidate_index in remaining:
+            fold_scores = [score for index, score in zip(task_candidates, scores) if index == candidate_index]
+            maes = [score["mae"] for score in fold_scores]
+            round_results.append({
+                "round": round_index + 1,
+                "candidate": candidate_index,
+                "n_samples": n_samples,
+                "params": candidates[candidate_index],
+                "mean_mae": float(np.mean(maes)),
+                "std_mae": float(np.std(maes)),
+                "mean_fit_seconds": float(np.mean([score["fit_seconds"] for score in fold_scores])),
+            })
+        round_results.sort(key=lambda result: result["mean_mae"])
+        results.extend(round_results)
+        rounds.append({"round": round_index + 1, "n_candidates": len(remaining), "n_samples": n_samples})
+        logger.info(f"Search round {round_index + 1}/{n_rounds}: best MAE {round_results[0]['mean_mae']:.4f} "
+                    f"with {round_results[0]['params']}")
+        remaining = [result["candidate"] for result in round_results[:max(1, math.ceil(len(remaining) / factor))]]
+
+    best = round_results[0]
+    return {
+        "n_candidates": len(candidates),
+        "factor": factor,
+        "cv_folds": cv,
+        "rounds": rounds,
+        "results": results,
+        "best_params": best["params"],
+        "best_mae": best["mean_mae"],
+    }
@@ -0,0 +1,168 @@
+"""
+Out-of-core training for model_type "sgd_stream".
+
+The text features of the split saved by training/preprocessing_training.py are memory-mapped and
+read batch_size rows at a time, hashed with a stateless HashingVectorizer and fed to one
+SGDRegressor per coordinate through partial_fit, for several epochs. Only one batch is in memory at
+a time, so the training set can be larger than RAM.
+"""
+import os
+import time
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+import pyarrow.feather as feather
+from sklearn.base import BaseEstimator, RegressorMixin
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDRegressor
+from sklearn.multioutput import MultiOutputRegressor
+from tqdm import tqdm
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Targets are divided by these so that latitude and longitude are both in [-1, 1] for SGD
+COORDINATE_SCALE = np.array([90.0, 180.0])
+
+# Used for the keys missing from the streaming section of model_config.yaml
+DEFAULT_SETTINGS = {
+    "batch_size": 50000,
+    "epochs": 5,
+    "n_features": 2 ** 20,
+    "alpha": 0.0001,
+    "eta0": 0.01,
+}
+
+
+class StreamingRegressor(RegressorMixin, BaseEstimator):
+    """
+    Predicts (latitude, longitude) from text with hashed features and one SGDRegressor per coordinate.
+    Trained incrementally with partial_fit; fit is a single pass over in-memory data.
+    """
+    def __init__(self, n_features: int = DEFAULT_SETTINGS["n_features"], stop_words: str = "english",
+                 alpha: float = DEFAULT_SETTINGS["alpha"], eta0: float = DEFAULT_SETTINGS["eta0"], random_state: int = None):
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.alpha = alpha
+        self.eta0 = eta0
+        self.random_state = random_state
+
+    def _transform(self, X):
+        return self.vectorizer_.transform(X)
+
+    def partial_fit(self, X, y):
+        if not hasattr(self, "regressor_"):
+            self.vectorizer_ = HashingVectorizer(n_features=self.n_features, stop_words=self.stop_words, alternate_sign=False)
+            self.regressor_ = MultiOutputRegressor(SGDRegressor(alpha=self.alpha, eta0=self.eta0, random_state=self.random_state))
+        self.regressor_.partial_fit(self._transform(X), np.asarray(y, dtype=np.float64) / COORDINATE_SCALE)
+        return self
+
+    def fit(self, X, y):
+        for attribute in ("vectorizer_", "regressor_"):
+            if hasattr(self, attribute):
+                delattr(self, attribute)
+        return self.partial_fit(X, y)
+
+    def predict(self, X):
+        return self.regressor_.predict(self._transform(X)) * COORDINATE_SCALE
+
+
+def streaming_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_SETTINGS, **(config.get("streaming") or {})}
+
+
+def streaming_regressor(config: Dict[str, Any]) -> StreamingRegressor:
+    settings = streaming_settings(config)
+    return StreamingRegressor(
+        n_features=settings["n_features"],
+        stop_words=config["vectorizer"]["stop_words"],
+        alpha=settings["alpha"],
+        eta0=settings["eta0"],
+        random_state=config["model"]["random_state"]
+    )
+
+
+def open_split(data_path: str, part: str) -> Tuple[Any, np.ndarray, np.ndarray]:
+    """
+    Memory-maps the text features, row indexes and coordinates of the "train" or "test" part of a split directory.
+    """
+    if data_path.endswith(".pkl"):
+        raise ValueError("Streaming training needs a split directory written by training/preprocessing_training.py, "
+                         f"not {data_path}")
+    text_features = feather.read_table(os.path.join(data_path, "text_features.feather"), memory_map=True)["text_features"]
+    index = np.load(os.path.join(data_path, f"{part}_index.npy"), mmap_mode="r")
+    coordinates = np.load(os.path.join(data_path, f"y_{part}.npy"), mmap_mode="r")
+    return text_features, index, coordinates
+
+
+def iter_batches(data_path: str, part: str, batch_size: int, rng: np.random.Generator = None) -> Iterator[Tuple[list, np.ndarray]]:
+    """
+    Yields (texts, coordinates) of a part of a split, batch_size rows at a time.
+    With rng, the batches are visited in a random order.
+    """
+    text_features, index, coordinates = open_split(data_path, part)
+    starts = np.arange(0, len(index), batch_size)
+    if rng is not None:
+        rng.shuffle(starts)
+    for start in starts:
+        end = start + batch_size
+        yield text_features.take(np.asarray(index[start:end])).to_pylist(), np.asarray(coordinates[start:end])
+
+
+def split_sizes(data_path: str) -> Tuple[int, int]:
+    """
+    The number of training and test rows of a split directory, read from the index headers.
+    """
+    return len(open_split(data_path, "train")[1]), len(open_split(data_path, "test")[1])
+
+
+def train_streaming_model(config: Dict[str, Any], data_path: str) -> Tuple[StreamingRegressor, Dict[str, Any]]:
+    """
+    Trains a StreamingRegressor on the training part of a split directory, one batch at a time.
+
+    Returns:
+        tuple[StreamingRegressor, dict]: The model and the throughput of the run (rows, seconds and rows/sec,
+            in total and per epoch).
+    """
+    settings = streaming_settings(config)
+    model = streaming_regressor(config)
+    rng = np.random.default_rng(config["model"]["random_state"])
+    n_rows = split_sizes(data_path)[0]
+    epochs = []
+    start_time = time.perf_counter()
+    for epoch in range(settings["epochs"]):
+        epoch_start = time.perf_counter()
+        rows = 0
+        with tqdm(total=n_rows, unit="rows", desc=f"Epoch {epoch + 1}/{settings['epochs']}") as progress:
+            for texts, coordinates in iter_batches(data_path, "train", settings["batch_size"], rng):
+                model.partial_fit(texts, coordinates)
+                rows += len(texts)
+                progress.update(len(texts))
+        seconds = time.perf_counter() - epoch_start
+        epochs.append({"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds else None})
+        logger.info(f"Epoch {epoch + 1}/{settings['epochs']}: {rows} rows in {seconds:.2f} seconds "
+                    f"({epochs[-1]['rows_per_sec']:,.0f} rows/sec)")
+    seconds = time.perf_counter() - start_time
+    rows = sum(epoch["rows"] for epoch in epochs)
+    stats = {
+        "batch_size": settings["batch_size"],
+        "epochs": epochs,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds else None,
+    }
+    logger.info(f"Streaming training completed: {rows} rows in {seconds:.2f} seconds ({stats['rows_per_sec']:,.0f} rows/sec)")
+    return model, stats
+
+
+def evaluate_streaming_model(model: StreamingRegressor, data_path: str, batch_size: int) -> float:
+    """
+    Mean absolute error over latitude and longitude on the test part of a split directory, one batch at a time.
+    """
+    total = 0.0
+    count = 0
+    for texts, coordinates in iter_batches(data_path, "test", batch_size):
+        total += float(np.abs(model.predict(texts) - coordinates).sum())
+        count += coordinates.size
+    return total / count
@@ -1,3 +1,4 @@
+import argparse
 import datetime
 import json
 import os
@@ -9,22 +10,29 @@ from tqdm import tqdm
 import time
 from typing import Dict, Any, Tuple
 import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
 import yaml
 
 import joblib
 
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.multioutput import MultiOutputRegressor
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.pipeline import Pipeline
 from sklearn.metrics import mean_absolute_error
 from sklearn.model_selection import cross_val_score
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler
 from sklearn.compose import TransformedTargetRegressor
+from joblib import Parallel, delayed
 
 import logging
 
 from initialization import create_dirs
+from models.features import FeatureCache, featurizer
+from models.hgb import hgb_regressor, hgb_settings
+from models.resources import ResourceMonitor, assign_jobs, native_threads, resource_plan
+from models.search import candidate_config, successive_halving
+from models.streaming import streaming_regressor, streaming_settings, split_sizes, train_streaming_model, evaluate_streaming_model
 
 PROJECT_ROOT = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 sys.path.insert(0, PROJECT_ROOT)
@@ -61,9 +69,24 @@ def validate_paths(*paths: str) -> None:
             logger.info(f"Created directory: {path_obj.parent}")
 
 
-def train_test_split(data_path="training/data/train_test_split.pkl"):
+def train_test_split(data_path="training/data/train_test_split"):
+    """
+    Loads the train-test split saved by training/preprocessing_training.py, memory-mapping its files.
+    X_train and X_test are Arrow-backed string Series, y_train and y_test float32 (n, 2) arrays of
+    latitude and longitude. A .pkl path is loaded with joblib, as written by earlier versions.
+    """
     try:
-        X_train, X_test, y_train, y_test = joblib.load(data_path)
+        if data_path.endswith(".pkl"):
+            X_train, X_test, y_train, y_test = joblib.load(data_path)
+            logger.info(f"Loaded train-test split from {data_path}")
+            return X_train, X_test, y_train, y_test
+        
+        text_features = feather.read_table(os.path.join(data_path, "text_features.feather"), memory_map=True)["text_features"]
+        def load(name):
+            return np.load(os.path.join(data_path, f"{name}.npy"), mmap_mode="r")
+        X_train = pd.Series(pd.arrays.ArrowExtensionArray(text_features.take(load("train_index"))), name="text_features")
+        X_test = pd.Series(pd.arrays.ArrowExtensionArray(text_features.take(load("test_index"))), name="text_features")
+        y_train, y_test = load("y_train"), load("y_test")
         logger.info(f"Loaded train-test split from {data_path}")
         return X_train, X_test, y_train, y_test
     except Exception as e:
@@ -71,8 +94,8 @@ def train_test_split(data_path="training/data/train_test_split.pkl"):
         raise e
     
 
-def rfr_pipeline(config: Dict[str, Any]) -> Pipeline:
-    regressor = TransformedTargetRegressor(
+def rfr_regressor(config: Dict[str, Any]) -> TransformedTargetRegressor:
+    return TransformedTargetRegressor(
         regressor=RandomForestRegressor(
             n_estimators=config["model"]["n_estimators"],
             max_depth=config["model"]["max_depth"],
@@ -80,46 +103,68 @@ def rfr_pipeline(config: Dict[str, Any]) -> Pipeline:
         ),
         transformer=MinMaxScaler()
     )
-    
+
+def rfr_pipeline(config: Dict[str, Any]) -> Pipeline:
     return Pipeline([
-        ("vectorizer", TfidfVectorizer(
-            max_features=config["vectorizer"]["max_features"],
-            stop_words=config["vectorizer"]["stop_words"]
-        )),
-        ("scaler", StandardScaler(with_mean=False)), 
-        ("regressor", regressor)
+        *featurizer(config).steps,
+        ("regressor", rfr_regressor(config))
     ], verbose=True)
 
-def gbr_pipeline(config: Dict[str, Any]) -> Pipeline:
+def gbr_regressor(config: Dict[str, Any]) -> MultiOutputRegressor:
     base_regressor = TransformedTargetRegressor(
         regressor=GradientBoostingRegressor(
             n_estimators=config["model"]["n_estimators"],
             learning_rate=config["model"]["learning_rate"],
             max_depth=config["model"]["max_depth"],
+            n_iter_no_change=config["model"].get("n_iter_no_change"),
             random_state=config["model"]["random_state"]
         ),
         transformer=MinMaxScaler()
     )
     
+    return MultiOutputRegressor(base_regressor)
+
+def gbr_pipeline(config: Dict[str, Any]) -> Pipeline:
+    return Pipeline([
+        *featurizer(config).steps,
+        ("regressor", gbr_regressor(config))
+    ], verbose=True)
+
+def hgb_pipeline(config: Dict[str, Any]) -> Pipeline:
     return Pipeline([
-        ("vectorizer", TfidfVectorizer(
-            max_features=config["vectorizer"]["max_features"],
-            stop_words=config["vectorizer"]["stop_words"]
-        )),
-        ("scaler", StandardScaler(with_mean=False)), 
-        ("regressor", MultiOutputRegressor(base_regressor))
+        *featurizer(config).steps,
+        *hgb_regressor(config).steps
     ], verbose=True)
 
+def model_regressor(config: Dict[str, Any]):
+    """
+    The regressor of the configured model, without the featurization steps.
+    """
+    model_type = config.get("model_type", "rfr").lower()
+    if model_type == "rfr":
+        return rfr_regressor(config)
+    elif model_type == "gbr":
+        return gbr_regressor(config)
+    elif model_type == "hgb":
+        return hgb_regressor(config)
+    else:
+        raise ValueError(f"Unsupported model type: {model_type}")
+
 def model_pipeline(config: Dict[str, Any]) -> Pipeline:
     model_type = config.get("model_type", "rfr").lower()
     if model_type == "rfr":
         return rfr_pipeline(config)
     elif model_type == "gbr":
         return gbr_pipeline(config)
+    elif model_type == "hgb":
+        return hgb_pipeline(config)
+    elif model_type == "sgd_stream":
+        # hashes its own features, so it takes the text directly
+        return streaming_regressor(config)
     else:
         raise ValueError(f"Unsupported model type: {model_type}")
 
-def perform_cross_validation(pipeline, X_train, y_train, cv=5) -> Tuple[float, float]:
+def perform_cross_validation(pipeline, X_train, y_train, cv=5, n_jobs=-1) -> Tuple[float, float]:
     try:
         logger.info(f"Starting {cv}-fold cross-validation...")
         scores = []
@@ -127,7 +172,7 @@ def perform_cross_validation(pipeline, X_train, y_train, cv=5) -> Tuple[float, f
         scores = cross_val_score(pipeline, X_train, y_train, 
                                cv=cv,
                                scoring='neg_mean_absolute_error',
-                               n_jobs=-1,
+                               n_jobs=n_jobs,
                                verbose=1)
         
         mean_mae = -np.mean(scores)
@@ -138,8 +183,10 @@ def perform_cross_validation(pipeline, X_train, y_train, cv=5) -> Tuple[float, f
         logger.error(f"Error during cross-validation: {e}")
         raise e
 
-def train_model(X_train, y_train, config):
+def train_model(X_train, y_train, config, n_jobs=None):
     pipeline = model_pipeline(config)
+    if n_jobs is not None:
+        assign_jobs(pipeline, n_jobs)
     logger.info("Starting model training...")
     start_time = time.time()
     
@@ -154,6 +201,57 @@ def train_model(X_train, y_train, config):
     logger.info(f"Model training completed in {training_time:.2f} seconds")
     return pipeline
 
+def _score_fold(regressor, X_fit, y_fit, X_apply, y_apply) -> float:
+    regressor.fit(X_fit, y_fit)
+    return mean_absolute_error(y_apply, regressor.predict(X_apply))
+
+def scheduled_regressor(config, estimator_jobs=None):
+    regressor = model_regressor(config)
+    if estimator_jobs is not None:
+        assign_jobs(regressor, estimator_jobs)
+    return regressor
+
+def cached_cross_validation(config, features: FeatureCache, X_train, y_train, cv=5, n_jobs=-1, estimator_jobs=None) -> Tuple[float, float]:
+    """
+    Cross-validates the regressor on the cached, fold-safe features of each fold, featurizing the folds missing
+    from the cache and then fitting the regressors n_jobs folds at a time, with estimator_jobs jobs each.
+    Same folds and scores as perform_cross_validation on the full pipeline.
+    """
+    try:
+        logger.info(f"Starting {cv}-fold cross-validation on cached features...")
+        y_train = np.asarray(y_train)
+        maes = Parallel(n_jobs=n_jobs, verbose=1)(
+            delayed(_score_fold)(scheduled_regressor(config, estimator_jobs), X_fit, y_train[fit_index], X_apply, y_train[apply_index])
+            for fit_index, apply_index, X_fit, X_apply in features.folds(config, X_train, y_train, cv, n_jobs)
+        )
+        
+        mean_mae = np.mean(maes)
+        std_mae = np.std(maes)
+        logger.info(f"Cross-validation complete - Average MAE: {mean_mae:.4f} (+/- {std_mae:.4f})")
+        return mean_mae, std_mae
+    except Exception as e:
+        logger.error(f"Error during cross-validation: {e}")
+        raise e
+
+def train_cached_model(X_train, y_train, X_test, config, features: FeatureCache, n_jobs=None):
+    """
+    Fits the regressor on the cached features of the whole training set.
+    
+    Returns:
+        tuple: The fitted pipeline (featurizer and regressor, predicting from text) and the cached
+            features of X_test, for evaluate_model on the regressor.
+    """
+    fitted_featurizer, train_features, test_features = features.train_test(config, X_train, y_train, X_test)
+    regressor = scheduled_regressor(config, n_jobs)
+    logger.info("Starting model training on cached features...")
+    start_time = time.time()
+    
+    regressor.fit(train_features, y_train)
+    
+    training_time = time.time() - start_time
+    logger.info(f"Model training completed in {training_time:.2f} seconds")
+    return Pipeline([*fitted_featurizer.steps, ("regressor", regressor)]), test_features
+
 def evaluate_model(model, X_test, y_test):
     try:
         y_pred = model.predict(X_test)
@@ -177,6 +275,12 @@ if __name__ == "__main__":
     # validation test
     from validation.validation_test import ValidationTest
 
+    parser = argparse.ArgumentParser(description="Trains the configured model and writes a training report.")
+    parser.add_argument("--search", action="store_true",
+                        help="First search the space of the search section of model_config.yaml by successive halving "
+                             "and train the best candidate")
+    args = parser.parse_args()
+
     try:
         logger.info("=== Starting Model Training Pipeline ===")
         
@@ -192,51 +296,122 @@ if __name__ == "__main__":
             "max_features": config["vectorizer"]["max_features"],
             "stop_words": config["vectorizer"]["stop_words"]
         }
+        if config["model_type"] == "hgb":
+            prepare_report["hgb"] = hgb_settings(config)
         
         logger.info("Validating paths...")
         validate_paths(config["paths"]["train_test_split"], 
                       config["paths"]["model_output"])
         
-        logger.info("Loading train-test split...")
-        X_train, X_test, y_train, y_test = train_test_split(
-            data_path=config["paths"]["train_test_split"]
-        )
-        logger.info(f"Data loaded - Training samples: {X_train.shape[0]}, "
-                   f"Test samples: {X_test.shape[0]}")
+        if config["model_type"] == "sgd_stream":
+            # out of core: batches are read from the memory-mapped split, so it is never loaded whole
+            training_samples, test_samples = split_sizes(config["paths"]["train_test_split"])
+            logger.info(f"Streaming train-test split - Training samples: {training_samples}, "
+                       f"Test samples: {test_samples}")
+            prepare_report["training_samples"] = training_samples
+            prepare_report["test_samples"] = test_samples
+        else:
+            logger.info("Loading train-test split...")
+            X_train, X_test, y_train, y_test = train_test_split(
+                data_path=config["paths"]["train_test_split"]
+            )
+            logger.info(f"Data loaded - Training samples: {X_train.shape[0]}, "
+                       f"Test samples: {X_test.shape[0]}")
+            
+            prepare_report["training_samples"] = X_train.shape[0]
+            prepare_report["test_samples"] = X_test.shape[0]
         
-        prepare_report["training_samples"] = X_train.shape[0]
-        prepare_report["test_samples"] = X_test.shape[0]
+        cv = config["training"]["cv_folds"]
+        plan = resource_plan(config, cv)
+        monitor = ResourceMonitor()
+        logger.info(f"Resource plan: {plan}")
         
-        logger.info("Creating model pipeline...")
-        pipeline = model_pipeline(config)
+        if args.search:
+            if config["model_type"] == "sgd_stream":
+                raise ValueError("Search is not supported for model type sgd_stream")
+            logger.info("Searching hyperparameters...")
+            with monitor.stage("search", cores=plan["n_cores"]):
+                search = successive_halving(config, FeatureCache.from_config(config), X_train, y_train, model_regressor)
+            logger.info(f"Best search candidate - MAE: {search['best_mae']:.4f}, params: {search['best_params']}")
+            config = candidate_config(config, search["best_params"])
+            prepare_report["search"] = search
+            prepare_report["n_estimators"] = config["model"]["n_estimators"]
+            prepare_report["max_depth"] = config["model"]["max_depth"]
+            prepare_report["max_features"] = config["vectorizer"]["max_features"]
+            prepare_report["best_config"] = {section: config[section] for section in ("model", "vectorizer", "hgb") if section in config}
         
-        logger.info("Starting cross-validation...")
-        cv_mae, cv_std = perform_cross_validation(
-            pipeline, X_train, y_train, 
-            cv=config["training"]["cv_folds"]
-        )
+        if config["model_type"] == "sgd_stream":
+            # no cross-validation: each fold would be another full pass over the data set
+            cv_mae, cv_std = None, None
+            
+            logger.info("Training streaming model...")
+            with monitor.stage("training", cores=plan["n_cores"]), native_threads(plan["fit_estimator_jobs"]):
+                model, prepare_report["streaming"] = train_streaming_model(config, config["paths"]["train_test_split"])
+            
+            logger.info("Evaluating model on test set...")
+            with monitor.stage("evaluation", cores=plan["n_cores"]), native_threads(plan["n_cores"]):
+                mae = evaluate_streaming_model(model, config["paths"]["train_test_split"],
+                                               streaming_settings(config)["batch_size"])
+        elif config["training"].get("feature_cache", True):
+            # the TF-IDF features of every fold and of the final split are computed once and reused
+            features = FeatureCache.from_config(config)
+            
+            logger.info("Starting cross-validation...")
+            with monitor.stage("cross_validation", cores=plan["n_cores"], jobs=plan["cv_jobs"],
+                               estimator_jobs=plan["cv_estimator_jobs"]), native_threads(plan["cv_estimator_jobs"]):
+                cv_mae, cv_std = cached_cross_validation(
+                    config, features, X_train, y_train, cv=cv,
+                    n_jobs=plan["cv_jobs"], estimator_jobs=plan["cv_estimator_jobs"]
+                )
+            
+            logger.info("Training final model...")
+            with monitor.stage("training", cores=plan["n_cores"], estimator_jobs=plan["fit_estimator_jobs"]), \
+                    native_threads(plan["fit_estimator_jobs"]):
+                model, test_features = train_cached_model(X_train, y_train, X_test, config, features,
+                                                          n_jobs=plan["fit_estimator_jobs"])
+            
+            logger.info("Evaluating model on test set...")
+            with monitor.stage("evaluation", cores=plan["n_cores"]), native_threads(plan["n_cores"]):
+                mae = evaluate_model(model.named_steps["regressor"], test_features, y_test)
+        else:
+            logger.info("Creating model pipeline...")
+            pipeline = assign_jobs(model_pipeline(config), plan["cv_estimator_jobs"])
+            
+            logger.info("Starting cross-validation...")
+            with monitor.stage("cross_validation", cores=plan["n_cores"], jobs=plan["cv_jobs"],
+                               estimator_jobs=plan["cv_estimator_jobs"]), native_threads(plan["cv_estimator_jobs"]):
+                cv_mae, cv_std = perform_cross_validation(
+                    pipeline, X_train, y_train, cv=cv, n_jobs=plan["cv_jobs"]
+                )
+            
+            logger.info("Training final model...")
+            with monitor.stage("training", cores=plan["n_cores"], estimator_jobs=plan["fit_estimator_jobs"]), \
+                    native_threads(plan["fit_estimator_jobs"]):
+                model = train_model(X_train, y_train, config, n_jobs=plan["fit_estimator_jobs"])
+            
+            logger.info("Evaluating model on test set...")
+            with monitor.stage("evaluation", cores=plan["n_cores"]), native_threads(plan["n_cores"]):
+                mae = evaluate_model(model, X_test, y_test)
+        training_time = monitor.stages["training"]["seconds"]
 
         prepare_report["cross_validation_mae"] = cv_mae
         prepare_report["cross_validation_std"] = cv_std
-        
-        logger.info("Training final model...")
-        model = train_model(X_train, y_train, config)
-        
-        logger.info("Evaluating model on test set...")
-        mae = evaluate_model(model, X_test, y_test)
-        logger.info(f"Final model MAE: {mae}")
+        logger.info(f"Final model MAE: {mae} (training time: {training_time:.2f} seconds)")
         
         prepare_report["final_model_mae"] = mae
+        prepare_report["training_time_seconds"] = training_time
 
         prepare_report["end_time"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-        validation_test = ValidationTest()
-        mae_lat, mae_lon, mse_lat, mse_lon = validation_test.perform_validation()
+        with monitor.stage("validation", cores=plan["n_cores"]), native_threads(plan["n_cores"]):
+            validation_test = ValidationTest(model)
+            mae_lat, mae_lon, mse_lat, mse_lon = validation_test.perform_validation()
 
         prepare_report["validation_mae_lat"] = mae_lat
         prepare_report["validation_mae_lon"] = mae_lon
         prepare_report["validation_mse_lat"] = mse_lat
         prepare_report["validation_mse_lon"] = mse_lon
+        prepare_report["resources"] = {**plan, "stages": monitor.stages}
 
         with open(f"{PROJECT_ROOT}/models/training_report_{config['model_type']}_{prepare_report['end_time']}.json", "w") as f:
             json.dump(prepare_report, f, indent=4)
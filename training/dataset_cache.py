@@ -0,0 +1,172 @@
+"""
+Content-addressed cache of intermediate training datasets.
+
+Each entry is an uncompressed Feather (Arrow IPC) file, memory-mapped on load, named after a key
+derived from the content hash of the upstream files and the parameters of the transform that
+produced it. Changing an input file or a parameter changes the key, so stale entries are never
+returned; they age out instead. The least recently used entries are evicted when the cache
+grows over its size cap.
+"""
+import hashlib
+import json
+import os
+from typing import Callable, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "training/data/cache"
+DEFAULT_MAX_SIZE_GB = 5.0
+
+# Remembers the digests of upstream files by path, size and mtime, so unchanged files are not rehashed
+DIGESTS_FILE = "digests.json"
+
+ENTRY_SUFFIX = ".feather"
+
+# String columns are loaded as Arrow-backed pandas columns, read straight from the memory map
+STRING_TYPES = {pa.string(): pd.ArrowDtype(pa.string()), pa.large_string(): pd.ArrowDtype(pa.large_string())}
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DatasetCache:
+    """
+    A directory of cached DataFrames with an LRU size cap.
+
+    Args:
+        directory (str, optional): Where entries are stored. Defaults to DEFAULT_CACHE_DIR.
+        max_size_gb (float, optional): Total size above which the least recently used entries are
+            evicted. Defaults to DEFAULT_MAX_SIZE_GB.
+    """
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_size_gb: float = DEFAULT_MAX_SIZE_GB):
+        self.directory = directory
+        self.max_bytes = int(max_size_gb * 1024 ** 3)
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "DatasetCache":
+        """
+        Builds the cache from the cache section of model_config.yaml.
+        """
+        settings = config.get("cache") or {}
+        return cls(settings.get("dir", DEFAULT_CACHE_DIR), settings.get("max_size_gb", DEFAULT_MAX_SIZE_GB))
+
+    def file_digest(self, path: str) -> str:
+        """
+        Content hash of a file, recomputed only when its size or modification time changes.
+        """
+        stat = os.stat(path)
+        digests_path = os.path.join(self.directory, DIGESTS_FILE)
+        digests = {}
+        if os.path.exists(digests_path):
+            with open(digests_path, "r") as f:
+                digests = json.load(f)
+        key = os.path.abspath(path)
+        known = digests.get(key)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["digest"]
+        digest = _hash_file(path)
+        digests[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest}
+        tmp_path = f"{digests_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(digests, f, indent=4)
+        os.replace(tmp_path, digests_path)
+        return digest
+
+    def key(self, name: str, inputs: list[str], params: dict) -> str:
+        """
+        The key of the dataset produced by transform name from the inputs files with params.
+        """
+        payload = json.dumps({
+            "name": name,
+            "inputs": [self.file_digest(path) for path in inputs],
+            "params": params,
+        }, sort_keys=True, default=str)
+        return f"{name}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:24]}"
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{ENTRY_SUFFIX}")
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        """
+        Loads an entry, memory-mapping the file, and marks it as recently used. Returns None on a miss.
+        String columns are returned with pd.ArrowDtype.
+        """
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        table = feather.read_table(path, memory_map=True)
+        os.utime(path)
+        logger.info(f"Dataset cache hit: {key}")
+        return table.to_pandas(types_mapper=STRING_TYPES.get)
+
+    def put(self, key: str, df: pd.DataFrame) -> str:
+        """
+        Stores a DataFrame under key and evicts least recently used entries over the size cap.
+
+        Returns:
+            str: The path of the entry.
+        """
+        path = self.path(key)
+        tmp_path = f"{path}.tmp"
+        # uncompressed, so that reads can memory-map the file
+        feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        logger.info(f"Dataset cache stored: {key} ({os.path.getsize(path) / 2**20:.1f} MiB)")
+        self.evict(keep=path)
+        return path
+
+    def get_or_compute(self, name: str, inputs: list[str], params: dict, compute: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Returns the cached dataset for (inputs, params), computing and storing it on a miss.
+        """
+        key = self.key(name, inputs, params)
+        df = self.get(key)
+        if df is None:
+            logger.info(f"Dataset cache miss: {key}")
+            df = compute()
+            self.put(key, df)
+        return df
+
+    def entries(self) -> list[os.DirEntry]:
+        """
+        The cache entries, least recently used first.
+        """
+        with os.scandir(self.directory) as it:
+            entries = [entry for entry in it if entry.is_file() and entry.name.endswith(ENTRY_SUFFIX)]
+        return sorted(entries, key=lambda entry: entry.stat().st_mtime)
+
+    def evict(self, keep: str = None) -> list[str]:
+        """
+        Deletes least recently used entries until the cache fits max_size_gb.
+
+        Args:
+            keep (str, optional): Path of an entry that is never evicted, e.g. the one just stored.
+
+        Returns:
+            list[str]: The paths of the evicted entries.
+        """
+        entries = self.entries()
+        total = sum(entry.stat().st_size for entry in entries)
+        evicted = []
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and os.path.abspath(entry.path) == os.path.abspath(keep):
+                continue
+            total -= entry.stat().st_size
+            os.remove(entry.path)
+            evicted.append(entry.path)
+            logger.info(f"Dataset cache evicted: {entry.name}")
+        return evicted
@@ -1,35 +1,47 @@
+import argparse
 import sys
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).parent.parent))
 
-import dbmanager.dbmanage as db
-import subprocess
+from dbmanager.backend import get_backend
 
 import logging
 
 logging.basicConfig(level=logging.INFO, filename="logs/extract_training_data.log", encoding="utf-8")
 logger = logging.getLogger(__name__)
 
-def extract_training_data():
+db = get_backend()
+
+def parse_root(value):
+    """
+    Parses a subtree root given as SOURCE:ORIGINAL_SOURCE_ID, e.g. TGN:7005560.
+    """
+    source, _, original_source_id = value.rpartition(":")
+    if not source or not original_source_id.isdigit():
+        raise argparse.ArgumentTypeError(f"Expected SOURCE:ORIGINAL_SOURCE_ID, got {value}")
+    return source, int(original_source_id)
+
+def extract_training_data(output_path="training/data/training_data.parquet", roots=None):
     connection = db.connect_to_db()
     cursor = connection.cursor()
     try:
-        db.execute_sql(cursor, "dbmanager/sql/filterdata.sql")
+        count = db.export_filtered_places(cursor, output_path, roots=roots)
         connection.commit()
-        logger.info("Training data successfully extracted")
+        logger.info(f"Training data successfully extracted: {count} rows written to {output_path}")
     except Exception as e:
         logger.error(f"Error extracting training data: {e}")
         connection.rollback()
     finally:
         db.close_db(cursor, connection)
 
-def move_data_to_training_dir():
-    subprocess.run(["mv", "/var/lib/mysql-files/filtered_places.csv", "training/data/training_data.csv"])
-
 def main():
-    extract_training_data()
-    move_data_to_training_dir()
+    parser = argparse.ArgumentParser(description="Exports the places used for training to Parquet.")
+    parser.add_argument("--output", default="training/data/training_data.parquet")
+    parser.add_argument("--root", type=parse_root, action="append", dest="roots",
+                        help="Only export the subtree of this place (SOURCE:ORIGINAL_SOURCE_ID); repeatable")
+    args = parser.parse_args()
+    extract_training_data(args.output, args.roots)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
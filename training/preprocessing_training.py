@@ -1,77 +1,134 @@
-import pandas as pd
-import joblib
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import yaml
 from sklearn.model_selection import train_test_split
 
+try:
+    from .dataset_cache import DatasetCache, STRING_TYPES
+except ImportError:
+    from dataset_cache import DatasetCache, STRING_TYPES
+
 import logging
 
 logging.basicConfig(level=logging.INFO, filename="logs/preprocessing_training.log", encoding="utf-8")
 logger = logging.getLogger(__name__)
 
-def preprocess_training_data(data_path="training/data/training_data.csv"):
+CONFIG_PATH = "config/model_config.yaml"
+
+# Bump when the features built by preprocess_training_data change, so cached frames are not reused
+PREPROCESSING_VERSION = 2
+
+DEFAULT_CHUNK_SIZE = 500000
+
+INPUT_COLUMNS = ["place_name", "place_type", "latitude", "longitude", "alternate_names"]
+
+# Files of a saved split (see save_split)
+SPLIT_FILES = {
+    "text_features": "text_features.feather",
+    "train_index": "train_index.npy",
+    "test_index": "test_index.npy",
+    "y_train": "y_train.npy",
+    "y_test": "y_test.npy",
+}
+
+def build_features(table: pa.Table) -> pa.Table:
+    """
+    Drops the rows of a chunk without coordinates and builds
+    text_features = "<place_name>|<alternate_names> <place_type>" in one pass over Arrow strings.
+    """
+    has_coordinates = pc.and_(pc.is_valid(table["latitude"]), pc.is_valid(table["longitude"]))
+    table = table.filter(has_coordinates)
+    text_features = pc.binary_join_element_wise(
+        table["place_name"], "|", pc.fill_null(table["alternate_names"], ""),
+        " ", pc.fill_null(table["place_type"], ""), "",
+    )
+    return pa.table({
+        "text_features": text_features,
+        "latitude": pc.cast(table["latitude"], pa.float64()),
+        "longitude": pc.cast(table["longitude"], pa.float64()),
+    })
+
+def preprocess_training_data(data_path="training/data/training_data.parquet", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Reads the training data chunk_size rows at a time and returns its text_features, latitude and
+    longitude. text_features is an Arrow-backed string column.
+    """
     try:
-        df = pd.read_csv(data_path,
-                 dtype={"latitude": float, "longitude": float},
-                 na_values=["\\", "N", "NULL", "", "nan", "\\N"])
-
-        logger.info(f"Read {df.shape[0]} rows from training data")
-
-        # drop rows where latitude or longitude is null
-        df = df[df['latitude'].notna() & df['longitude'].notna()]
-
-        logger.info(f"Dropped {df.shape[0]} rows where latitude or longitude is null")
+        source = pq.ParquetFile(data_path)
+        chunks = []
+        read = 0
+        for batch in source.iter_batches(batch_size=chunk_size, columns=INPUT_COLUMNS):
+            read += batch.num_rows
+            chunks.append(build_features(pa.Table.from_batches([batch])))
 
-        df = df[["place_name", "place_type", "latitude", "longitude", "alternate_names"]]
+        logger.info(f"Read {read} rows from training data")
 
-        df["alternate_names"] = df["alternate_names"].fillna("")
+        table = pa.concat_tables(chunks) if chunks else build_features(source.schema_arrow.empty_table().select(INPUT_COLUMNS))
 
-        logger.info(f"Filled {df.shape[0]} null alternate names")
+        logger.info(f"Dropped {read - table.num_rows} rows where latitude or longitude is null")
+        logger.info(f"Built text features for {table.num_rows} rows")
 
-        df["name_with_alternates"] = df["place_name"] + "|" + df["alternate_names"]
+        return table.to_pandas(types_mapper=STRING_TYPES.get)
 
-        logger.info(f"Created {df.shape[0]} name with alternates")
-
-        df_filtered = df[["name_with_alternates", "place_type", "latitude", "longitude"]]
-
-        logger.info(f"Filtered {df_filtered.shape[0]} rows")
-
-        return df_filtered
-    
     except Exception as e:
         logger.error(f"Error preprocessing training data: {e}")
         raise e
 
-def reduce_dimensionality(df):
-    try:
-        df['text_features'] = df['name_with_alternates'] + " " + df['place_type']
-        return df[['text_features', 'latitude', 'longitude']]
-    except Exception as e:
-        logger.error(f"Error reducing dimensionality: {e}")
-        raise e
-
 def split_data(df):
+    """
+    Splits the rows of df 80/20.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The row indexes of the training and test sets.
+    """
     try:
-        X = df['text_features']
-        y = df[['latitude', 'longitude']]
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        
-        logger.info(f"Split data into {X_train.shape[0]} training and {X_test.shape[0]} test rows")
-        return X_train, X_test, y_train, y_test
+        train_index, test_index = train_test_split(np.arange(len(df)), test_size=0.2, random_state=42)
+
+        logger.info(f"Split data into {len(train_index)} training and {len(test_index)} test rows")
+        return train_index, test_index
     except Exception as e:
         logger.error(f"Error splitting data: {e}")
         raise e
 
-def save_data(X_train, X_test, y_train, y_test, file_path="training/data/train_test_split.pkl"):
+def save_split(df, train_index, test_index, directory="training/data/train_test_split"):
+    """
+    Saves a train-test split as files that train.train_test_split memory-maps: the text_features
+    column as uncompressed Feather, the row indexes of each set as int64 .npy arrays and the
+    latitude/longitude of each set as float32 (n, 2) .npy arrays.
+    """
     try:
-        # Save train-test split to file
-        joblib.dump((X_train, X_test, y_train, y_test), file_path)
-        logger.info(f"Train-test split saved to {file_path}")
+        os.makedirs(directory, exist_ok=True)
+        coordinates = df[["latitude", "longitude"]].to_numpy(dtype=np.float32)
+        feather.write_feather(pa.table({"text_features": pa.array(df["text_features"])}),
+                              os.path.join(directory, SPLIT_FILES["text_features"]), compression="uncompressed")
+        np.save(os.path.join(directory, SPLIT_FILES["train_index"]), train_index.astype(np.int64))
+        np.save(os.path.join(directory, SPLIT_FILES["test_index"]), test_index.astype(np.int64))
+        np.save(os.path.join(directory, SPLIT_FILES["y_train"]), coordinates[train_index])
+        np.save(os.path.join(directory, SPLIT_FILES["y_test"]), coordinates[test_index])
+        logger.info(f"Train-test split saved to {directory}")
 
     except Exception as e:
         logger.error(f"Error in saving data: {str(e)}")
         raise
-    
+
+def load_features(data_path, cache=None):
+    """
+    Returns the text_features/latitude/longitude frame of the training data, from the dataset
+    cache when data_path has not changed since it was last computed.
+    """
+    compute = lambda: preprocess_training_data(data_path)
+    if cache is None:
+        return compute()
+    return cache.get_or_compute("features", [data_path], {"version": PREPROCESSING_VERSION}, compute)
+
 if __name__ == "__main__":
-    df = preprocess_training_data(data_path="training/data/training_data_americas.csv")
-    df_reduced = reduce_dimensionality(df)
-    X_train, X_test, y_train, y_test = split_data(df_reduced)
-    save_data(X_train, X_test, y_train, y_test)
+    with open(CONFIG_PATH, "r") as f:
+        config = yaml.safe_load(f) or {}
+    df = load_features("training/data/training_data_americas.parquet", DatasetCache.from_config(config))
+    train_index, test_index = split_data(df)
+    save_split(df, train_index, test_index, config["paths"]["train_test_split"])
@@ -1,25 +1,241 @@
-from shapely.geometry import Point, Polygon
-import pandas as pd
+import json
+import os
+import sys
+from pathlib import Path
 
-americas_polygon = Polygon([
-    (-179.231086, 71.439786),  
-    (-56.000000, 71.439786),  
-    (-56.000000, -54.000000),  
-    (-179.231086, -54.000000),  
-    (-179.231086, 71.439786) 
-])
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+import yaml
+from shapely.geometry import Polygon, shape
 
-df = pd.read_csv("training/data/training_data.csv",
-                 dtype={"latitude": float, "longitude": float},
-                 na_values=["\\", "N", "NULL", "", "nan", "\\N"])
+try:
+    from .dataset_cache import DatasetCache
+except ImportError:
+    from dataset_cache import DatasetCache
 
-df = df[df['latitude'].notna() & df['longitude'].notna()]
+import logging
 
-df['is_in_americas'] = df.apply(
-    lambda row: americas_polygon.contains(Point(row['longitude'], row['latitude'])),
-    axis=1
-)
+logging.basicConfig(level=logging.INFO, filename="logs/regionalization_of_training.log", encoding="utf-8")
+logger = logging.getLogger(__name__)
 
-places_in_americas = df[df['is_in_americas']]
+CONFIG_PATH = "config/model_config.yaml"
 
-places_in_americas.to_csv("training/data/training_data_americas.csv", index=False)
\ No newline at end of file
+# Used when the config has no regionalization section
+DEFAULT_SETTINGS = {
+    "input": "training/data/training_data.parquet",
+    "output_dir": "training/data",
+    "output": "split",
+    "chunk_size": 500000,
+    "regions": {
+        "americas": {
+            "polygon": [
+                [-179.231086, 71.439786],
+                [-56.000000, 71.439786],
+                [-56.000000, -54.000000],
+                [-179.231086, -54.000000],
+                [-179.231086, 71.439786],
+            ]
+        }
+    },
+}
+
+OUTPUT_MODES = ("split", "label")
+
+# Schema metadata key of the outputs holding the dataset cache key they were computed for
+DATASET_KEY = b"dataset_key"
+
+
+def load_config(config_path: str = CONFIG_PATH) -> dict:
+    with open(config_path, "r") as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_settings(config_path: str = CONFIG_PATH) -> dict:
+    """
+    Reads the regionalization section of the model config, filling missing keys with DEFAULT_SETTINGS.
+    """
+    config = load_config(config_path)
+    settings = {**DEFAULT_SETTINGS, **(config.get("regionalization") or {})}
+    if settings["output"] not in OUTPUT_MODES:
+        raise ValueError(f"Unsupported regionalization output: {settings['output']}")
+    return settings
+
+
+def load_region(spec: dict):
+    """
+    Builds the geometry of a region from a list of (lon, lat) vertices ("polygon") or a GeoJSON file
+    ("geojson"; the features of a FeatureCollection are merged).
+    """
+    if "polygon" in spec:
+        return Polygon(spec["polygon"])
+    if "geojson" in spec:
+        with open(spec["geojson"], "r") as f:
+            data = json.load(f)
+        if data.get("type") == "FeatureCollection":
+            return shapely.union_all([shape(feature["geometry"]) for feature in data["features"]])
+        if data.get("type") == "Feature":
+            return shape(data["geometry"])
+        return shape(data)
+    raise ValueError(f"Region needs a 'polygon' or a 'geojson' file: {spec}")
+
+
+def load_regions(settings: dict) -> dict:
+    """
+    Returns the prepared geometry of each configured region, in config order.
+    """
+    regions = {}
+    for name, spec in settings["regions"].items():
+        geometry = load_region(spec)
+        shapely.prepare(geometry)
+        regions[name] = geometry
+        logger.info(f"Loaded region {name} with bounds {geometry.bounds}")
+    return regions
+
+
+def assign_regions(longitude: np.ndarray, latitude: np.ndarray, regions: dict) -> np.ndarray:
+    """
+    Labels each point with the first region that contains it, or None.
+
+    Points outside a region's bounding box are discarded with numpy comparisons before
+    the exact, vectorized shapely.contains_xy test on the remaining candidates.
+    """
+    labels = np.full(len(longitude), None, dtype=object)
+    unassigned = np.ones(len(longitude), dtype=bool)
+    for name, geometry in regions.items():
+        min_x, min_y, max_x, max_y = geometry.bounds
+        candidates = np.flatnonzero(unassigned & (longitude >= min_x) & (longitude <= max_x)
+                                    & (latitude >= min_y) & (latitude <= max_y))
+        if len(candidates) == 0:
+            continue
+        inside = candidates[shapely.contains_xy(geometry, longitude[candidates], latitude[candidates])]
+        labels[inside] = name
+        unassigned[inside] = False
+    return labels
+
+
+def output_path(settings: dict, region: str = None) -> str:
+    stem = Path(settings["input"]).stem
+    suffix = region if region is not None else "regions"
+    return os.path.join(settings["output_dir"], f"{stem}_{suffix}.parquet")
+
+
+def output_paths(settings: dict) -> dict:
+    """
+    The output file of each region ("split") or the single output file keyed by None ("label").
+    """
+    if settings["output"] == "label":
+        return {None: output_path(settings)}
+    return {name: output_path(settings, name) for name in settings["regions"]}
+
+
+def dataset_key(settings: dict, cache: DatasetCache) -> str:
+    """
+    The cache key of the outputs: the content of the input and GeoJSON files, the regions and the output mode.
+    """
+    inputs = [settings["input"]] + [spec["geojson"] for spec in settings["regions"].values() if "geojson" in spec]
+    return cache.key("regionalization", inputs, {"regions": settings["regions"], "output": settings["output"]})
+
+
+def cached_counts(settings: dict, key: str) -> dict:
+    """
+    Returns the rows per region of the existing outputs if they were all computed for key, otherwise None.
+    """
+    paths = output_paths(settings)
+    for path in paths.values():
+        if not os.path.exists(path) or (pq.read_schema(path).metadata or {}).get(DATASET_KEY) != key.encode():
+            return None
+    if settings["output"] == "label":
+        regions = pq.read_table(paths[None], columns=["region"])["region"].to_pandas()
+        counts = {name: int((regions == name).sum()) for name in settings["regions"]}
+        counts[None] = int(regions.isna().sum())
+        return counts
+    return {name: pq.read_metadata(path).num_rows for name, path in paths.items()}
+
+
+def regionalize(settings: dict, cache: DatasetCache = None) -> dict:
+    """
+    Reads the training data in chunks, drops rows without coordinates and labels the rest by region.
+
+    With output "split" the rows of each region are written to training_data_<region>.parquet.
+    With output "label" all rows are written to training_data_regions.parquet with a region column
+    (null outside every region).
+
+    With a cache, the outputs are stamped with the key of the input and settings, and are left as
+    they are on reruns with the same key.
+
+    Returns:
+        dict: Rows written per region (None for rows outside every region in "label" mode).
+    """
+    key = None
+    if cache is not None:
+        key = dataset_key(settings, cache)
+        counts = cached_counts(settings, key)
+        if counts is not None:
+            logger.info(f"Outputs are up to date with {key}, rows per region: {counts}")
+            return counts
+
+    regions = load_regions(settings)
+    source = pq.ParquetFile(settings["input"])
+    schema = source.schema_arrow
+    if settings["output"] == "label":
+        schema = schema.append(pa.field("region", pa.string()))
+    if key is not None:
+        schema = schema.with_metadata({**(schema.metadata or {}), DATASET_KEY: key.encode()})
+    os.makedirs(settings["output_dir"], exist_ok=True)
+
+    # every output is written, even if empty, so that a rerun finds all of them up to date; each is
+    # written to a temporary path and renamed when complete, so a failed run never leaves stamped partial files
+    paths = output_paths(settings)
+    writers = {name: pq.ParquetWriter(f"{path}.tmp", schema, compression="zstd") for name, path in paths.items()}
+    counts = {name: 0 for name in regions}
+    if settings["output"] == "label":
+        counts[None] = 0
+    try:
+        for batch in source.iter_batches(batch_size=settings["chunk_size"]):
+            table = pa.Table.from_batches([batch])
+            longitude = table["longitude"].to_numpy(zero_copy_only=False).astype(np.float64)
+            latitude = table["latitude"].to_numpy(zero_copy_only=False).astype(np.float64)
+            has_coordinates = ~(np.isnan(longitude) | np.isnan(latitude))
+
+            table = table.filter(pa.array(has_coordinates))
+            labels = assign_regions(longitude[has_coordinates], latitude[has_coordinates], regions)
+
+            if settings["output"] == "label":
+                writers[None].write_table(table.append_column("region", pa.array(labels, pa.string())))
+
+            assigned = 0
+            for name in regions:
+                mask = labels == name
+                count = int(mask.sum())
+                counts[name] += count
+                assigned += count
+                if settings["output"] == "split" and count:
+                    writers[name].write_table(table.filter(pa.array(mask)))
+            if settings["output"] == "label":
+                counts[None] += len(labels) - assigned
+            
+            logger.info(f"Processed chunk of {len(batch)} rows ({int(has_coordinates.sum())} with coordinates)")
+        for name, writer in writers.items():
+            writer.close()
+            os.replace(f"{paths[name]}.tmp", paths[name])
+    finally:
+        for name, writer in writers.items():
+            writer.close()
+            if os.path.exists(f"{paths[name]}.tmp"):
+                os.remove(f"{paths[name]}.tmp")
+
+    logger.info(f"Rows per region: {counts}")
+    return counts
+
+
+def main(config_path: str = CONFIG_PATH):
+    settings = load_settings(config_path)
+    counts = regionalize(settings, DatasetCache.from_config(load_config(config_path)))
+    for name, count in counts.items():
+        print(f"{name}: {count}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH)
@@ -10,8 +10,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 PROJECT_ROOT = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
 class ValidationTest:
-    def __init__(self):
-        self.model = self.get_model()
+    def __init__(self, model=None):
+        """
+        Args:
+            model (optional): A fitted model predicting (latitude, longitude) from text. Defaults to models/model.pkl.
+        """
+        self.model = model if model is not None else self.get_model()
         self.validation_data = self.get_validation_data()
 
     def get_lat_long(self, input_text, place_type):
@@ -32,11 +36,11 @@ class ValidationTest:
 
         validation_df.dropna(subset=['lat', 'lon'], inplace=True)
 
-        validation_df["predicted_lat_long"] = validation_df.apply(
-            lambda row: self.get_lat_long(f"{row['nombre_lugar']}", row['tipo']), axis=1
-        )
-        validation_df["predicted_latitude"] = validation_df["predicted_lat_long"].apply(lambda x: x[0][0])
-        validation_df["predicted_longitude"] = validation_df["predicted_lat_long"].apply(lambda x: x[0][1])
+        # one predict call for all rows: the text is vectorized in a single batch
+        texts = validation_df["nombre_lugar"].astype(str) + " " + validation_df["tipo"].astype(str)
+        predictions = self.model.predict(texts.tolist())
+        validation_df["predicted_latitude"] = predictions[:, 0]
+        validation_df["predicted_longitude"] = predictions[:, 1]
 
         mae_lat = mean_absolute_error(validation_df["lat"], validation_df["predicted_latitude"])
         mae_lon = mean_absolute_error(validation_df["lon"], validation_df["predicted_longitude"])